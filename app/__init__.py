@@ -12,23 +12,45 @@ from extensions import cors, login_manager, csrf
 from .auth.routes import auth_bp
 from .api.routes import api_bp
 from .main.routes import main_bp
+from .uploads.routes import uploads_bp
+from .uploads.streaming import UploadRequest
+from .jobs.routes import jobs_bp
+from .jobs.engine import job_manager
+from .api.search_index import filename_index
+from .api.content_index import content_index
+from .api.file_hashes import hash_cache
+from .api.listing import listing_cache
+from .api.changes import change_feed
+from .metrics import collectors as metrics
+from .metrics.routes import metrics_bp
+from .assets.serving import static_assets
 
 def create_app():
     app = Flask(__name__, static_folder='static', template_folder='templates')
     app.config.from_object(Config)
+    app.request_class = UploadRequest
+
+    # Registered first so its hooks time everything else, CSRF checks included
+    metrics.init_app(app)
 
     # Initialize Extensions
     cors.init_app(app, resources={
         r"/*": {
             "origins": app.config['CORS_ORIGINS'],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "X-CSRFToken"],
-            "expose_headers": ["Content-Disposition"],
+            "allow_headers": ["Content-Type", "X-CSRFToken", "If-None-Match"],
+            "expose_headers": ["Content-Disposition", "ETag"],
             "supports_credentials": True
         }
     })
     login_manager.init_app(app)
     csrf.init_app(app)
+    listing_cache.init_app(app)
+    change_feed.init_app(app)
+    job_manager.init_app(app)
+    hash_cache.init_app(app)
+    # Wraps wsgi_app, so asset requests bypass sessions, login and hooks
+    static_assets.init_app(app)
 
     # ProxyFix Middleware
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
@@ -44,7 +66,10 @@ def create_app():
     # Register Blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(uploads_bp, url_prefix='/uploads')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
     app.register_blueprint(main_bp)  # No prefix; serves root routes
+    app.register_blueprint(metrics_bp)
 
     # Register Error Handlers
     register_error_handlers(app)
@@ -55,6 +80,11 @@ def create_app():
             os.makedirs(VOLUME)
             app.logger.info(f"Created base directory: {VOLUME}")
 
+    # Build and maintain the filename index used by /api/search
+    filename_index.init_app(app)
+    # Optional full-text index used by /api/search?mode=content
+    content_index.init_app(app)
+
     return app
 
 def register_error_handlers(app):
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import errno
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+from config import VOLUME
+from .listing import listing_cache
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_MODIFY is left out on purpose: it fires on every write() while
+# IN_CLOSE_WRITE reports a finished file once.
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+READ_SIZE = 64 * 1024
+MAX_PENDING_EVENTS = 1000
+
+
+class Inotify:
+    """Minimal ctypes binding of the Linux inotify API."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise self._error()
+
+    @staticmethod
+    def _error():
+        code = ctypes.get_errno()
+        return OSError(code, os.strerror(code))
+
+    def add_watch(self, path, mask):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise self._error()
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read(self):
+        """Return the pending (wd, mask, name) events; empty if there are none."""
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    """A queue of change events for one directory and one client."""
+
+    def __init__(self, feed, path):
+        self.feed = feed
+        self.path = path
+        self.queue = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            event = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if self.overflowed:
+            # The client fell behind; it has to re-list rather than replay
+            self.overflowed = False
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            return {'event': 'resync', 'path': self.feed.relative(self.path)}
+        return event
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class ChangeFeed:
+    """
+    Per-process inotify watcher shared by every change-feed subscriber.
+
+    Only directories that someone is looking at are watched: the first
+    subscriber of a directory adds the inotify watch, the last one to leave
+    removes it. Events are turned into added/removed/modified deltas carrying
+    the same fields as /api/list entries.
+    """
+
+    def __init__(self, volume=VOLUME):
+        self.volume = volume
+        self.enabled = False
+        self.keepalive = 15
+        self.logger = None
+        self._inotify = None
+        self._lock = threading.Lock()
+        self._watches = {}  # absolute directory -> wd
+        self._paths = {}  # wd -> absolute directory
+        self._subscribers = {}  # absolute directory -> set of Subscriptions
+        self._thread = None
+
+    def init_app(self, app):
+        self.logger = app.logger
+        self.keepalive = app.config['CHANGE_FEED_KEEPALIVE']
+        self.enabled = app.config['CHANGE_FEED'] and sys.platform.startswith('linux')
+
+    def _start(self):
+        # Started lazily so a preloading gunicorn master never owns the fd
+        if self._inotify is None:
+            self._inotify = Inotify()
+            self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, path):
+        """Start watching path (an absolute directory) for a new subscriber."""
+        subscription = Subscription(self, path)
+        with self._lock:
+            self._start()
+            if path not in self._watches:
+                wd = self._inotify.add_watch(path, WATCH_MASK)
+                self._watches[path] = wd
+                self._paths[wd] = path
+            self._subscribers.setdefault(path, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.path)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.path]
+                wd = self._watches.pop(subscription.path, None)
+                if wd is not None:
+                    self._paths.pop(wd, None)
+                    self._inotify.rm_watch(wd)
+
+    def _run(self):
+        while True:
+            try:
+                select.select([self._inotify.fd], [], [])
+                events = self._inotify.read()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                self.logger.exception(f"Change feed stopped: {e}")
+                return
+            for wd, mask, name in events:
+                try:
+                    self._dispatch(wd, mask, name)
+                except Exception as e:
+                    self.logger.exception(f"Error dispatching change event: {e}")
+
+    def _dispatch(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            with self._lock:
+                subscriptions = [s for subs in self._subscribers.values() for s in subs]
+            for subscription in subscriptions:
+                listing_cache.invalidate(subscription.path)
+                subscription.put({'event': 'resync', 'path': self.relative(subscription.path)})
+            return
+
+        with self._lock:
+            path = self._paths.get(wd)
+            if path is None:
+                return
+            subscriptions = list(self._subscribers.get(path, ()))
+            if mask & IN_IGNORED:
+                # The watch is gone (directory deleted or unmounted)
+                self._paths.pop(wd, None)
+                self._watches.pop(path, None)
+
+        listing_cache.invalidate(path)
+        relative_dir = self.relative(path)
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            event = {'event': 'deleted', 'path': relative_dir}
+        elif mask & IN_IGNORED:
+            return
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            event = {'event': 'removed', 'path': relative_dir, 'name': name, 'is_dir': bool(mask & IN_ISDIR)}
+        else:
+            try:
+                stat = os.stat(os.path.join(path, name))
+            except OSError:
+                # Already gone again; the removal event follows
+                return
+            is_dir = bool(mask & IN_ISDIR)
+            event = {
+                'event': 'added' if mask & (IN_CREATE | IN_MOVED_TO) else 'modified',
+                'path': relative_dir,
+                'name': name,
+                'is_dir': is_dir,
+                'size': 0 if is_dir else stat.st_size,
+                'lastModified': int(stat.st_mtime)
+            }
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def relative(self, path):
+        relative_path = os.path.relpath(path, self.volume).replace("\\", "/")
+        return '' if relative_path == '.' else relative_path
+
+    def stream(self, subscription):
+        """Generate the server-sent events for one subscription."""
+        try:
+            yield 'retry: 3000\n\n'
+            yield format_event('ready', {'path': self.relative(subscription.path)})
+            while True:
+                event = subscription.get(self.keepalive)
+                if event is None:
+                    # Comment line that keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event('change', event)
+                if event['event'] == 'deleted':
+                    return
+        finally:
+            subscription.close()
+
+
+change_feed = ChangeFeed()
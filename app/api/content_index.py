@@ -0,0 +1,296 @@
+import os
+import time
+import fcntl
+import sqlite3
+from contextlib import contextmanager
+
+from config import VOLUME, CONTENT_INDEX_FILE
+from app.metrics.collectors import FILESYSTEM_DURATION
+from app.jobs.engine import native_thread
+from .search_index import join_relative
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed INTEGER NOT NULL,
+    UNIQUE (parent, name)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS contents USING fts5(body, tokenize='trigram');
+"""
+
+SNIFF_SIZE = 8192  # bytes checked for NULs before a file is read in full
+MAX_REPLACEMENTS = 0.01  # share of undecodable bytes above which a file counts as binary
+COMMIT_EVERY = 200  # files (re)indexed per transaction
+MIN_TERM_LENGTH = 3  # the trigram tokenizer can't match anything shorter
+SNIPPETS_PER_FILE = 3
+SNIPPET_LENGTH = 200
+
+
+def fts_query(terms):
+    """Quote each term so FTS5 matches it literally; terms are ANDed."""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def read_text(path, max_size):
+    """
+    Return the text of path, or None if it is binary.
+
+    A NUL in the first SNIFF_SIZE bytes marks a file as binary straight
+    away; otherwise it is decoded as UTF-8 and rejected if more than
+    MAX_REPLACEMENTS of it isn't valid UTF-8.
+    """
+    with open(path, 'rb') as f:
+        data = f.read(max_size + 1)
+    if len(data) > max_size or b'\0' in data[:SNIFF_SIZE]:
+        return None
+    text = data.decode('utf-8', errors='replace')
+    if text.count('\ufffd') > len(text) * MAX_REPLACEMENTS:
+        return None
+    return text
+
+
+def matching_lines(text, terms, limit=SNIPPETS_PER_FILE):
+    """Return up to limit {'line', 'text'} dicts for the lines containing any term."""
+    matches = []
+    for number, line in enumerate(text.splitlines(), 1):
+        lowered = line.lower()
+        if any(term in lowered for term in terms):
+            matches.append({'line': number, 'text': line.strip()[:SNIPPET_LENGTH]})
+            if len(matches) >= limit:
+                break
+    return matches
+
+
+class ContentIndex:
+    """
+    Optional full-text index of the text files in VOLUME, kept in SQLite under DATA_DIR.
+
+    File contents go into an FTS5 table with the trigram tokenizer, so any
+    substring of three or more characters can be looked up and hits are
+    ranked by bm25. Like the filename index, one process at a time (under an
+    flock) keeps it current: each pass lists every directory but only reads
+    files whose size or mtime changed, and drops files and directories that
+    are gone. Files above CONTENT_INDEX_MAX_FILE_SIZE and binary files are
+    recorded without their contents so they aren't read again until they
+    change.
+    """
+
+    def __init__(self, path=CONTENT_INDEX_FILE, volume=VOLUME):
+        self.path = path
+        self.volume = volume
+        self.interval = 300
+        self.max_file_size = 1024 * 1024
+        self.enabled = False
+        self.logger = None
+        self._lock_file = None
+        self._changed = 0
+
+    def init_app(self, app):
+        self.logger = app.logger
+        self.interval = app.config['CONTENT_INDEX_INTERVAL']
+        self.max_file_size = app.config['CONTENT_INDEX_MAX_FILE_SIZE']
+        if not app.config['CONTENT_INDEX']:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self.connect() as conn:
+                conn.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            app.logger.warning(f"Content index disabled: {e}")
+            return
+
+        self.enabled = True
+        native_thread(self._run, 'content-index')
+
+    @contextmanager
+    def connect(self):
+        """Open a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def is_ready(self):
+        """True once a complete pass over the volume has been committed."""
+        if not self.enabled:
+            return False
+        try:
+            with self.connect() as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def search(self, query, limit=None):
+        """
+        Return (files, truncated) for the files containing every word of query.
+
+        Files carry name, size, lastModified and path like the filename
+        search, best matches first, plus up to SNIPPETS_PER_FILE matching
+        lines with their line numbers. Raises ValueError for words shorter
+        than MIN_TERM_LENGTH.
+        """
+        terms = query.lower().split()
+        if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+            raise ValueError(f"Content search words need at least {MIN_TERM_LENGTH} characters.")
+
+        files = []
+        truncated = False
+        with self.connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT d.parent, d.name, contents.body
+                FROM contents JOIN docs d ON d.id = contents.rowid
+                WHERE contents MATCH ?
+                ORDER BY contents.rank
+                LIMIT ?
+                """,
+                (fts_query(terms), -1 if limit is None else limit + 1)
+            )
+            for parent, name, body in rows:
+                if limit is not None and len(files) >= limit:
+                    truncated = True
+                    break
+                relative_path = join_relative(parent, name)
+                try:
+                    stat = os.stat(os.path.join(self.volume, relative_path))
+                except OSError:
+                    continue
+                files.append({
+                    'name': name,
+                    'size': stat.st_size,
+                    'lastModified': int(stat.st_mtime),
+                    'path': relative_path,
+                    'matches': matching_lines(body, terms),
+                })
+        return files, truncated
+
+    def _run(self):
+        while True:
+            if self._acquire_lock():
+                try:
+                    with FILESYSTEM_DURATION.time(operation='content_index_update'):
+                        self.update()
+                except Exception as e:
+                    self.logger.exception(f"Error updating content index: {e}")
+            time.sleep(self.interval)
+
+    def _acquire_lock(self):
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def update(self):
+        """Bring the index in line with VOLUME, reading only new and changed files."""
+        start = time.monotonic()
+        self._changed = 0
+        with self.connect() as conn:
+            seen = set()
+            stack = ['']
+            while stack:
+                relative_dir = stack.pop()
+                try:
+                    subdirs = self._update_directory(conn, relative_dir)
+                except OSError as e:
+                    self.logger.warning(f"Content index could not list {relative_dir or '/'}: {e}")
+                    continue
+                seen.add(relative_dir)
+                stack.extend(join_relative(relative_dir, name) for name in subdirs)
+                # Yield to other greenlets when running under gevent
+                time.sleep(0)
+
+            for (relative_dir,) in conn.execute('SELECT DISTINCT parent FROM docs').fetchall():
+                if relative_dir not in seen:
+                    for (doc_id,) in conn.execute('SELECT id FROM docs WHERE parent = ?', (relative_dir,)).fetchall():
+                        self._remove(conn, doc_id)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)",
+                (str(int(time.time())),)
+            )
+
+        if self._changed:
+            self.logger.info(
+                f"Content index updated {self._changed} files in {time.monotonic() - start:.2f}s."
+            )
+
+    def _update_directory(self, conn, relative_dir):
+        """Reindex the changed files of one directory; return its subdirectories."""
+        absolute_dir = os.path.join(self.volume, relative_dir)
+        indexed = {
+            name: (doc_id, size, mtime_ns)
+            for doc_id, name, size, mtime_ns in conn.execute(
+                'SELECT id, name, size, mtime_ns FROM docs WHERE parent = ?', (relative_dir,)
+            )
+        }
+        subdirs = []
+        with os.scandir(absolute_dir) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                doc_id, size, mtime_ns = indexed.pop(entry.name, (None, None, None))
+                if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                if doc_id is not None:
+                    self._remove(conn, doc_id)
+                self._add(conn, relative_dir, entry, stat)
+
+        for doc_id, _, _ in indexed.values():
+            self._remove(conn, doc_id)
+        return subdirs
+
+    def _add(self, conn, relative_dir, entry, stat):
+        text = None
+        if stat.st_size <= self.max_file_size:
+            try:
+                text = read_text(entry.path, self.max_file_size)
+            except OSError:
+                return
+        cursor = conn.execute(
+            'INSERT INTO docs (parent, name, size, mtime_ns, indexed) VALUES (?, ?, ?, ?, ?)',
+            (relative_dir, entry.name, stat.st_size, stat.st_mtime_ns, int(text is not None))
+        )
+        if text is not None:
+            conn.execute('INSERT INTO contents (rowid, body) VALUES (?, ?)', (cursor.lastrowid, text))
+        self._count_change(conn)
+
+    def _remove(self, conn, doc_id):
+        conn.execute('DELETE FROM contents WHERE rowid = ?', (doc_id,))
+        conn.execute('DELETE FROM docs WHERE id = ?', (doc_id,))
+        self._count_change(conn)
+
+    def _count_change(self, conn):
+        self._changed += 1
+        if self._changed % COMMIT_EVERY == 0:
+            conn.commit()
+
+
+content_index = ContentIndex()
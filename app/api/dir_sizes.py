@@ -0,0 +1,143 @@
+import time
+import sqlite3
+
+from app.metrics.collectors import FILESYSTEM_DURATION
+from .search_index import filename_index, join_relative
+
+LOOKUP_BATCH = 500  # stays below SQLite's bound-parameter limit
+
+
+def parent_of(relative_dir):
+    return relative_dir.rpartition('/')[0]
+
+
+def depth(relative_dir):
+    return relative_dir.count('/') + 1 if relative_dir else 0
+
+
+class DirectorySizes:
+    """
+    Recursive byte, file and folder counts for every directory in VOLUME.
+
+    Totals live in the filename index's dirs table, next to the mtime and
+    inode that decide when a directory is rescanned. After each rescan the
+    directories it flagged dirty are recomputed from their own files and
+    their children's stored totals, deepest first, and the change is
+    carried up to the root. An unchanged volume costs nothing and a change
+    deep in the tree only touches that directory's ancestors, so requests
+    never have to walk anything.
+
+    Files edited in place don't change their directory's mtime, so their
+    new size is picked up the next time something else in that directory
+    changes.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        index.rescan_hooks.append(self.update)
+
+    def update(self, conn):
+        """Recompute the totals of dirty directories and their ancestors."""
+        start = time.monotonic()
+        pending = {path for (path,) in conn.execute('SELECT path FROM dirs WHERE dirty = 1')}
+        if not pending:
+            return
+        for path in list(pending):
+            while path:
+                path = parent_of(path)
+                if path in pending:
+                    break
+                pending.add(path)
+
+        with FILESYSTEM_DURATION.time(operation='directory_sizes'):
+            self._update_totals(conn, pending)
+
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('sizes_at', ?)",
+            (str(time.time_ns()),)
+        )
+        self.index.logger.info(
+            f"Directory sizes updated for {len(pending)} directories in {time.monotonic() - start:.2f}s."
+        )
+
+    @staticmethod
+    def _update_totals(conn, pending):
+        for path in sorted(pending, key=depth, reverse=True):
+            files, size = conn.execute(
+                """
+                SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries
+                WHERE parent = ? AND is_dir = 0 AND is_link = 0
+                """,
+                (path,)
+            ).fetchone()
+            subdirs, child_bytes, child_files, child_dirs = conn.execute(
+                """
+                SELECT COUNT(d.path), COALESCE(SUM(d.total_bytes), 0),
+                       COALESCE(SUM(d.total_files), 0), COALESCE(SUM(d.total_dirs), 0)
+                FROM entries e JOIN dirs d
+                    ON d.path = CASE WHEN e.parent = '' THEN e.name ELSE e.parent || '/' || e.name END
+                WHERE e.parent = ? AND e.is_dir = 1 AND e.is_link = 0
+                """,
+                (path,)
+            ).fetchone()
+            conn.execute(
+                """
+                UPDATE dirs SET dirty = 0, total_bytes = ?, total_files = ?, total_dirs = ?
+                WHERE path = ?
+                """,
+                (size + child_bytes, files + child_files, subdirs + child_dirs, path)
+            )
+
+    def version(self):
+        """Opaque value that changes whenever any total changes; None if unavailable."""
+        if not self.index.is_ready():
+            return None
+        try:
+            with self.index.connect() as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'sizes_at'").fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def get(self, relative_dir, names):
+        """Return {name: totals} for the subdirectories names of relative_dir that are known."""
+        paths = {join_relative(relative_dir, name): name for name in names}
+        sizes = {}
+        keys = list(paths)
+        with self.index.connect() as conn:
+            for i in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[i:i + LOOKUP_BATCH]
+                rows = conn.execute(
+                    f"""
+                    SELECT path, total_bytes, total_files, total_dirs FROM dirs
+                    WHERE path IN ({', '.join('?' * len(batch))})
+                    """,
+                    batch
+                )
+                for path, total_bytes, total_files, total_dirs in rows:
+                    sizes[paths[path]] = {'size': total_bytes, 'files': total_files, 'folders': total_dirs}
+        return sizes
+
+    def largest(self, relative_dir='', limit=20):
+        """Return the limit largest folders below relative_dir, biggest first."""
+        if relative_dir:
+            # Every path between 'dir/' and 'dir0' ('/' + 1) is inside dir
+            condition, params = 'path > ? AND path < ?', (relative_dir + '/', relative_dir + '0')
+        else:
+            condition, params = "path != ''", ()
+        with self.index.connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT path, total_bytes, total_files, total_dirs FROM dirs
+                WHERE {condition}
+                ORDER BY total_bytes DESC LIMIT ?
+                """,
+                params + (limit,)
+            ).fetchall()
+        return [
+            {'path': path, 'size': total_bytes, 'files': total_files, 'folders': total_dirs}
+            for path, total_bytes, total_files, total_dirs in rows
+        ]
+
+
+directory_sizes = DirectorySizes(filename_index)
@@ -0,0 +1,276 @@
+import os
+import stat as stat_module
+import sqlite3
+import hashlib
+import collections
+from contextlib import contextmanager
+
+from config import VOLUME, HASH_CACHE_FILE
+from app.jobs.engine import native_executor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    partial TEXT,
+    full TEXT,
+    path TEXT NOT NULL,
+    PRIMARY KEY (dev, inode)
+);
+CREATE INDEX IF NOT EXISTS hashes_full ON hashes (size, full);
+"""
+
+ALGORITHM = 'blake2b'
+DIGEST_SIZE = 20  # bytes
+READ_SIZE = 1024 * 1024
+PARTIAL_SIZE = 64 * 1024  # bytes hashed from each end of a file for its partial hash
+COMMIT_EVERY = 100  # digests stored per transaction, so a cancelled run keeps its work
+
+
+class FileChanged(Exception):
+    """The file was modified while it was being hashed."""
+
+
+def hash_file(path, kind):
+    """
+    Return (hex digest, bytes read) of the file at path.
+
+    kind 'full' hashes the whole file; 'partial' hashes its first and last
+    PARTIAL_SIZE bytes, which for files up to twice that size is the whole
+    file, so their partial digest is also their full one. hashlib releases
+    the GIL while hashing, so files hashed on different pool threads are
+    hashed in parallel. Raises FileChanged if the file's size or mtime moved
+    while it was read.
+    """
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    read = 0
+    with open(path, 'rb') as f:
+        before = os.fstat(f.fileno())
+        if kind == 'partial' and before.st_size > 2 * PARTIAL_SIZE:
+            for offset in (0, before.st_size - PARTIAL_SIZE):
+                data = os.pread(f.fileno(), PARTIAL_SIZE, offset)
+                digest.update(data)
+                read += len(data)
+        else:
+            while True:
+                data = f.read(READ_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+                read += len(data)
+        after = os.fstat(f.fileno())
+    if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+        raise FileChanged(path)
+    return digest.hexdigest(), read
+
+
+def is_small(size):
+    """True if the partial hash of a file of this size already covers all of it."""
+    return size <= 2 * PARTIAL_SIZE
+
+
+class HashCache:
+    """
+    Content digests of the files in VOLUME, cached in SQLite under DATA_DIR.
+
+    A file's partial and full digests are stored under its device and inode
+    and reused while its size and mtime are unchanged, so renames and moves
+    within the volume keep their digests and an edited file is hashed again.
+    Hashing runs on native threads; only the calling thread touches the
+    database.
+    """
+
+    def __init__(self, path=HASH_CACHE_FILE, volume=VOLUME):
+        self.path = path
+        self.volume = volume
+        self.logger = None
+        self._executor = None
+
+    def init_app(self, app):
+        self.logger = app.logger
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self.connect() as conn:
+                conn.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            app.logger.warning(f"Hash cache unavailable: {e}")
+
+    @contextmanager
+    def connect(self):
+        """Open a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def has_size(self, size):
+        """True if some file of this size has a full digest, i.e. find() could match it."""
+        with self.connect() as conn:
+            row = conn.execute('SELECT 1 FROM hashes WHERE size = ? AND full IS NOT NULL LIMIT 1', (size,)).fetchone()
+        return row is not None
+
+    def find(self, size, digest):
+        """
+        Return (relative path, stat) of a file with this size and full digest, or None.
+
+        Only files that are still where they were hashed and unchanged since
+        count, so a stale cache entry can never stand in for different data.
+        """
+        with self.connect() as conn:
+            rows = conn.execute(
+                'SELECT dev, inode, mtime_ns, path FROM hashes WHERE size = ? AND full = ?', (size, digest)
+            ).fetchall()
+        for dev, inode, mtime_ns, relative_path in rows:
+            try:
+                stat = os.lstat(os.path.join(self.volume, relative_path))
+            except OSError:
+                continue
+            if (stat_module.S_ISREG(stat.st_mode)
+                    and (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns) == (dev, inode, size, mtime_ns)):
+                return relative_path, stat
+        return None
+
+    def hash_later(self, relative_path):
+        """Compute the full digest of a file in the background, e.g. one just uploaded."""
+        # Created on first use so a preloading gunicorn master never forks threads
+        if self._executor is None:
+            self._executor = native_executor(1)
+        self._executor.submit(self._hash_one, relative_path)
+
+    def _hash_one(self, relative_path):
+        try:
+            stat = os.stat(os.path.join(self.volume, relative_path))
+            self.digests([(relative_path, stat)], 'full', workers=1)
+        except Exception as e:
+            self.logger.warning(f"Could not hash {relative_path}: {e}")
+
+    def digests(self, files, kind, workers=4, progress=None):
+        """
+        Return {relative path: digest} for files, a list of (relative path, stat).
+
+        Cached digests are used where the file is unchanged; the rest are
+        computed on `workers` threads, at most two per thread in flight, and
+        stored. progress(bytes read) is called after each hashed file and
+        may raise to stop. Files that can't be read or that change while
+        being hashed are left out.
+        """
+        results = {}
+        pending = []
+        with self.connect() as conn:
+            for relative_path, stat in files:
+                row = conn.execute(
+                    'SELECT size, mtime_ns, partial, full FROM hashes WHERE dev = ? AND inode = ?',
+                    (stat.st_dev, stat.st_ino)
+                ).fetchone()
+                cached = None
+                if row is not None and (row[0], row[1]) == (stat.st_size, stat.st_mtime_ns):
+                    cached = row[2] if kind == 'partial' else row[3]
+                    if cached is None and kind == 'full' and is_small(stat.st_size):
+                        cached = row[2]
+                if cached is not None:
+                    results[relative_path] = cached
+                else:
+                    pending.append((relative_path, stat))
+
+            executor = native_executor(workers)
+            in_flight = collections.deque()
+            queue = iter(pending)
+            stored = 0
+            try:
+                while True:
+                    while len(in_flight) < workers * 2:
+                        item = next(queue, None)
+                        if item is None:
+                            break
+                        path = os.path.join(self.volume, item[0])
+                        in_flight.append((item, executor.submit(hash_file, path, kind)))
+                    if not in_flight:
+                        break
+
+                    (relative_path, stat), future = in_flight.popleft()
+                    try:
+                        digest, read = future.result()
+                    except (OSError, FileChanged) as e:
+                        self.logger.warning(f"Could not hash {relative_path}: {e}")
+                        continue
+                    results[relative_path] = digest
+                    self._store(conn, relative_path, stat, kind, digest)
+                    stored += 1
+                    if stored % COMMIT_EVERY == 0:
+                        conn.commit()
+                    if progress is not None:
+                        progress(read)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def _store(self, conn, relative_path, stat, kind, digest):
+        # Small files' partial digest is their full one too
+        partial = digest if kind == 'partial' or is_small(stat.st_size) else None
+        full = digest if kind == 'full' or is_small(stat.st_size) else None
+        conn.execute(
+            """
+            INSERT INTO hashes (dev, inode, size, mtime_ns, partial, full, path)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (dev, inode) DO UPDATE SET
+                partial = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns
+                          THEN coalesce(excluded.partial, partial) ELSE excluded.partial END,
+                full = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns
+                       THEN coalesce(excluded.full, full) ELSE excluded.full END,
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                path = excluded.path
+            """,
+            (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, partial, full, relative_path)
+        )
+
+
+hash_cache = HashCache()
+
+
+def walk_files(volume, root, min_size):
+    """
+    Yield (relative path, stat) of the regular files of at least min_size bytes under root.
+
+    Symlinks are skipped and hard links to a file already seen are left
+    out, since they take no extra space.
+    """
+    seen = set()
+    stack = [root]
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(volume, relative_dir)) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(relative_path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.st_size < min_size or (stat.st_dev, stat.st_ino) in seen:
+                continue
+            seen.add((stat.st_dev, stat.st_ino))
+            yield relative_path, stat
+
+
+def regroup(files, digests):
+    """Split files into the groups of two or more that share size and digest."""
+    groups = collections.defaultdict(list)
+    for relative_path, stat in files:
+        if relative_path in digests:
+            groups[stat.st_size, digests[relative_path]].append((relative_path, stat))
+    return [files for files in groups.values() if len(files) > 1]
@@ -0,0 +1,144 @@
+import os
+import fcntl
+import tempfile
+
+
+class StaleVersion(Exception):
+    """The file changed since the version the edits were made against."""
+
+    def __init__(self, current):
+        super().__init__(f"The file is now at version {current}.")
+        self.current = current
+
+
+def parse_edits(edits):
+    """
+    Validate line edits and return them as (start, end, lines) tuples.
+
+    Each edit replaces lines [start, end) of the base version (0-based,
+    splitting the file on '\\n') with `lines`. Edits must be sorted and must
+    not overlap; start == end inserts. Raises ValueError otherwise.
+    """
+    if not isinstance(edits, list):
+        raise ValueError("edits must be a list.")
+    parsed = []
+    previous_end = 0
+    for edit in edits:
+        try:
+            start, end, lines = edit['start'], edit['end'], edit['lines']
+        except (TypeError, KeyError):
+            raise ValueError("Each edit needs start, end and lines.")
+        if not (isinstance(start, int) and isinstance(end, int) and isinstance(lines, list)
+                and all(isinstance(line, str) for line in lines)):
+            raise ValueError("Edit start and end must be integers and lines a list of strings.")
+        if not previous_end <= start <= end:
+            raise ValueError("Edits must be sorted and must not overlap.")
+        parsed.append((start, end, lines))
+        previous_end = end
+    return parsed
+
+
+def split_lines(f):
+    """
+    Yield the lines of the binary file f without their '\\n', like str.split('\\n').
+
+    There is always one more line than there are newlines: the last one is
+    empty when the file ends with a newline.
+    """
+    last = b''
+    for chunk in f:
+        if chunk.endswith(b'\n'):
+            yield chunk[:-1]
+        else:
+            last = chunk
+    yield last
+
+
+def apply_edits(src, dst, edits):
+    """
+    Copy the binary file src to dst with parsed edits applied.
+
+    Lines outside the edits are copied byte for byte, whatever their
+    encoding; only the replacement lines are encoded (UTF-8). Raises
+    ValueError if an edit reaches past the end of src.
+    """
+    written = 0
+
+    def write(line):
+        nonlocal written
+        if written:
+            dst.write(b'\n')
+        dst.write(line)
+        written += 1
+
+    pending = iter(edits)
+    edit = next(pending, None)
+    skip_until = 0
+    count = 0
+    for index, line in enumerate(split_lines(src)):
+        while edit is not None and edit[0] == index:
+            for new_line in edit[2]:
+                write(new_line.encode('utf-8'))
+            skip_until = edit[1]
+            edit = next(pending, None)
+        if index >= skip_until:
+            write(line)
+        count = index + 1
+
+    # Insertions after the last line
+    while edit is not None and edit[0] == count == edit[1]:
+        for new_line in edit[2]:
+            write(new_line.encode('utf-8'))
+        edit = next(pending, None)
+    if edit is not None or skip_until > count:
+        raise ValueError("Edits reach past the end of the file.")
+
+
+def save_atomically(path, base_version, current_version, write_body):
+    """
+    Replace path with what write_body(src, dst) writes, if it is still at base_version.
+
+    The new content goes into a temp file in the same directory, which is
+    fsynced, given the original's mode and owner, and renamed over path, so
+    a crash leaves either the old or the new file, never a truncated one.
+    Saves of the same file are serialised with an flock, and the version is
+    checked again once it is held; base_version None skips the check.
+    Raises StaleVersion when the file moved on.
+    """
+    directory, name = os.path.split(path)
+    with open(path, 'rb') as src:
+        fcntl.flock(src, fcntl.LOCK_EX)
+        try:
+            stat = os.stat(path)
+            version = current_version(stat)
+            # A save that renamed over path while we waited leaves us holding the old inode
+            if stat.st_ino != os.fstat(src.fileno()).st_ino or (base_version is not None and base_version != version):
+                raise StaleVersion(version)
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as dst:
+                    write_body(src, dst)
+                    dst.flush()
+                    os.fchmod(dst.fileno(), stat.st_mode & 0o7777)
+                    try:
+                        os.fchown(dst.fileno(), stat.st_uid, stat.st_gid)
+                    except PermissionError:
+                        pass
+                    os.fsync(dst.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+        finally:
+            fcntl.flock(src, fcntl.LOCK_UN)
+
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return current_version(os.stat(path))
@@ -0,0 +1,241 @@
+import os
+import json
+import zlib
+import bisect
+import hashlib
+import threading
+import collections
+
+from config import LINE_INDEX_DIR
+
+BLOCK_SIZE = 1024 * 1024  # bytes per line index entry
+READ_SIZE = 64 * 1024
+CHECK_SIZE = 4096  # bytes before the indexed end compared before extending an index
+MEMORY_CACHE_SIZE = 32  # line indexes kept per worker
+
+
+class LineIndex:
+    """
+    Newline counts of a file at every BLOCK_SIZE boundary.
+
+    counts[i] is the number of newlines before byte i * BLOCK_SIZE, so the
+    line at any offset, and the offset of any line, is found by reading a
+    single block. A 2 GB file needs about two thousand entries, built at
+    the speed bytes.count() runs through the file.
+
+    Indexes are stored as JSON in LINE_INDEX_DIR and cached per worker,
+    valid while the file's inode, size and mtime match. A file that only
+    grew (a log being appended to) has its index extended from where it
+    ended, once the CRC of the last CHECK_SIZE indexed bytes confirms the
+    old content is unchanged; anything else is rebuilt.
+    """
+
+    def __init__(self, inode, size, mtime_ns, counts, newlines, partial_last_line, check_crc):
+        self.inode = inode
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.counts = counts
+        self.newlines = newlines  # newlines in the whole indexed size
+        self.partial_last_line = partial_last_line  # the file doesn't end with a newline
+        self.check_crc = check_crc
+
+    def matches(self, stat):
+        return (self.inode, self.size, self.mtime_ns) == (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    @property
+    def total_lines(self):
+        """Lines in the file, counting a last line without a newline."""
+        return self.newlines + (1 if self.partial_last_line else 0)
+
+    def line_of(self, fd, offset):
+        """Return the 0-based number of the line containing byte offset."""
+        block = min(offset // BLOCK_SIZE, len(self.counts) - 1)
+        start = block * BLOCK_SIZE
+        return self.counts[block] + os.pread(fd, offset - start, start).count(b'\n')
+
+    def offset_of(self, fd, line):
+        """Return the byte offset at which 0-based line starts, or the file size past the end."""
+        if line <= 0:
+            return 0
+        if line > self.newlines:
+            return self.size
+        # The block holding the line-th newline is the last one with fewer newlines before it
+        block = bisect.bisect_left(self.counts, line) - 1
+        start = block * BLOCK_SIZE
+        data = os.pread(fd, min(BLOCK_SIZE, self.size - start), start)
+        position = -1
+        for _ in range(line - self.counts[block]):
+            position = data.index(b'\n', position + 1)
+        return start + position + 1
+
+    def to_json(self):
+        return {
+            'inode': self.inode, 'size': self.size, 'mtime_ns': self.mtime_ns, 'counts': self.counts,
+            'newlines': self.newlines, 'partial_last_line': self.partial_last_line, 'check_crc': self.check_crc,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['inode'], data['size'], data['mtime_ns'], data['counts'], data['newlines'],
+                   data['partial_last_line'], data['check_crc'])
+
+    @classmethod
+    def build(cls, fd, stat, previous=None):
+        """Index the file open as fd, continuing from previous if it is a prefix of it."""
+        counts, newlines, position = [0], 0, 0
+        if previous is not None:
+            counts = previous.counts[:previous.size // BLOCK_SIZE + 1]
+            position = (len(counts) - 1) * BLOCK_SIZE
+            newlines = counts[-1]
+
+        last = b''
+        while position < stat.st_size:
+            data = os.pread(fd, min(BLOCK_SIZE, stat.st_size - position), position)
+            if not data:
+                break
+            newlines += data.count(b'\n')
+            position += len(data)
+            last = data
+            if position % BLOCK_SIZE == 0 and position < stat.st_size:
+                counts.append(newlines)
+
+        partial_last_line = bool(last) and not last.endswith(b'\n')
+        return cls(stat.st_ino, position, stat.st_mtime_ns, counts, newlines, partial_last_line, crc_before(fd, position))
+
+
+def crc_before(fd, end):
+    start = max(0, end - CHECK_SIZE)
+    return zlib.crc32(os.pread(fd, end - start, start))
+
+
+class LineIndexCache:
+    """Line indexes by path: per-worker LRU in front of JSON files shared by the workers."""
+
+    def __init__(self, directory=LINE_INDEX_DIR):
+        self.directory = directory
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def _file(self, path):
+        return os.path.join(self.directory, hashlib.sha256(path.encode('utf-8', 'surrogateescape')).hexdigest() + '.json')
+
+    def _load(self, path):
+        with self.lock:
+            if path in self.entries:
+                self.entries.move_to_end(path)
+                return self.entries[path]
+        try:
+            with open(self._file(path)) as f:
+                return LineIndex.from_json(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _store(self, path, index):
+        with self.lock:
+            self.entries[path] = index
+            self.entries.move_to_end(path)
+            while len(self.entries) > MEMORY_CACHE_SIZE:
+                self.entries.popitem(last=False)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._file(path) + f'.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(index.to_json(), f)
+            os.replace(tmp_path, self._file(path))
+        except OSError:
+            # Only a cache; the index is rebuilt next time
+            pass
+
+    def get(self, path, fd, stat, build=True):
+        """
+        Return a current index of the file open as fd.
+
+        A cached index is reused or extended when possible. Otherwise the
+        file is indexed if build is set, and None is returned if not.
+        """
+        index = self._load(path)
+        if index is not None and index.matches(stat):
+            return index
+        previous = None
+        if (index is not None and index.inode == stat.st_ino and index.size <= stat.st_size
+                and crc_before(fd, index.size) == index.check_crc):
+            previous = index
+        elif not build:
+            return None
+        index = LineIndex.build(fd, stat, previous)
+        self._store(path, index)
+        return index
+
+
+line_indexes = LineIndexCache()
+
+
+def read_forward(fd, offset, size, max_lines, max_bytes):
+    """
+    Read whole lines from offset: at most max_lines of them and max_bytes in total.
+
+    Returns (data, end). A single line longer than max_bytes is cut.
+    """
+    chunks = []
+    lines = 0
+    position = offset
+    limit = min(size, offset + max_bytes)
+    while position < limit and lines < max_lines:
+        data = os.pread(fd, min(READ_SIZE, limit - position), position)
+        if not data:
+            break
+        cut = -1
+        for _ in range(max_lines - lines):
+            cut = data.find(b'\n', cut + 1)
+            if cut == -1:
+                break
+            lines += 1
+        if lines >= max_lines and cut != -1:
+            data = data[:cut + 1]
+        chunks.append(data)
+        position += len(data)
+
+    data = b''.join(chunks)
+    if position < size and not data.endswith(b'\n'):
+        # Stopped by max_bytes inside a line: end on the last complete one if there is any
+        last = data.rfind(b'\n')
+        if last != -1:
+            data = data[:last + 1]
+    return data, offset + len(data)
+
+
+def read_backward(fd, end, max_lines, max_bytes):
+    """
+    Read the whole lines just before end: at most max_lines of them and max_bytes in total.
+
+    Returns (data, start). end is expected to be a line start or the file size.
+    """
+    chunks = []
+    newlines = 0
+    position = end
+    floor = max(0, end - max_bytes)
+    while position > floor:
+        start = max(floor, position - READ_SIZE)
+        data = os.pread(fd, position - start, start)
+        chunks.append(data)
+        position = start
+        # The newline ending the previous window doesn't start a line of this one
+        newlines += data.count(b'\n', 0, len(data) - 1 if start + len(data) == end else len(data))
+        if newlines >= max_lines:
+            break
+
+    data = b''.join(reversed(chunks))
+    # Keep the last max_lines lines, starting right after a newline (or at byte 0)
+    cut = len(data) - 1 if data.endswith(b'\n') else len(data)
+    for _ in range(max_lines):
+        cut = data.rfind(b'\n', 0, cut)
+        if cut == -1:
+            break
+    if cut != -1:
+        data = data[cut + 1:]
+    elif position > 0:
+        # Stopped by max_bytes: drop the partial first line if a whole one follows
+        first = data.find(b'\n')
+        if first != -1 and first + 1 < len(data):
+            data = data[first + 1:]
+    return data, end - len(data)
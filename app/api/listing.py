@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import binascii
+import threading
+from collections import OrderedDict
+
+from app.metrics.collectors import FILESYSTEM_DURATION
+
+SORT_OPTIONS = ('name_asc', 'name_desc', 'date_asc', 'date_desc', 'size_asc', 'size_desc')
+
+# Entries are stored as (name, is_dir, size, mtime) tuples to keep the cache compact
+NAME, IS_DIR, SIZE, MTIME = range(4)
+
+SORT_KEYS = {
+    'name': lambda entry: (entry[NAME].lower(), entry[NAME]),
+    'date': lambda entry: (entry[MTIME], entry[NAME].lower()),
+    'size': lambda entry: (entry[SIZE], entry[NAME].lower()),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(offset, name):
+    data = json.dumps({'o': offset, 'n': name}).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return int(data['o']), str(data['n'])
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+class DirectoryListing:
+    """
+    Snapshot of one directory taken with a single os.scandir pass.
+
+    Sorted views are built on first use and kept with the snapshot, so
+    re-sorting and fetching later pages never touch the disk again.
+    """
+
+    def __init__(self, path, mtime_ns, entries):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.entries = entries
+        self.scanned_at = time.monotonic()
+        self._sorted = {}
+        self._positions = {}
+        self._digest = None
+
+    @classmethod
+    def scan(cls, path, mtime_ns):
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    # d_type answers is_dir()/is_file() without a stat call
+                    if entry.is_dir():
+                        entries.append((entry.name, True, 0, int(entry.stat().st_mtime)))
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        entries.append((entry.name, False, stat.st_size, int(stat.st_mtime)))
+                except OSError:
+                    continue
+        return cls(path, mtime_ns, entries)
+
+    @property
+    def digest(self):
+        """
+        Hash of the snapshot's contents.
+
+        It only depends on what is in the directory, so it stays the same
+        across rescans and gunicorn workers as long as nothing changed.
+        """
+        if self._digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            for name, is_dir, size, mtime in self.sorted('name_asc'):
+                h.update(f"{name}\0{int(is_dir)}\0{size}\0{mtime}\n".encode('utf-8', 'surrogateescape'))
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def sorted(self, sort):
+        """Return the entries ordered by sort, directories first."""
+        if sort not in self._sorted:
+            field, order = sort.rsplit('_', 1)
+            key = SORT_KEYS[field]
+            reverse = order == 'desc'
+            directories = sorted((e for e in self.entries if e[IS_DIR]), key=key, reverse=reverse)
+            files = sorted((e for e in self.entries if not e[IS_DIR]), key=key, reverse=reverse)
+            self._sorted[sort] = directories + files
+        return self._sorted[sort]
+
+    def resolve_cursor(self, sort, cursor):
+        """
+        Return the index to continue from for a cursor issued by encode_cursor().
+
+        The cursor carries both the offset and the name of the last entry
+        served. If the directory changed since, the listing is re-anchored on
+        that name so pages neither repeat nor skip entries that still exist.
+        """
+        offset, name = decode_cursor(cursor)
+        entries = self.sorted(sort)
+        if 0 < offset <= len(entries) and entries[offset - 1][NAME] == name:
+            return offset
+        if sort not in self._positions:
+            self._positions[sort] = {entry[NAME]: i for i, entry in enumerate(entries)}
+        position = self._positions[sort].get(name)
+        if position is not None:
+            return position + 1
+        return min(max(offset, 0), len(entries))
+
+
+class ListingCache:
+    """
+    Per-process LRU cache of DirectoryListing snapshots.
+
+    A snapshot is reused while its directory's mtime is unchanged, so a cache
+    hit costs one stat. Since editing a file in place doesn't touch the
+    directory mtime, snapshots are also dropped after LIST_CACHE_TTL seconds.
+    The cache holds at most LIST_CACHE_MAX_ENTRIES entries across all
+    directories.
+    """
+
+    def __init__(self):
+        self.ttl = 30
+        self.max_entries = 500_000
+        self._listings = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config['LIST_CACHE_TTL']
+        self.max_entries = app.config['LIST_CACHE_MAX_ENTRIES']
+
+    def get(self, path):
+        with FILESYSTEM_DURATION.time(operation='list_stat'):
+            mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            listing = self._listings.get(path)
+            if (listing is not None and listing.mtime_ns == mtime_ns
+                    and time.monotonic() - listing.scanned_at < self.ttl):
+                self._listings.move_to_end(path)
+                return listing
+
+        with FILESYSTEM_DURATION.time(operation='list_scan'):
+            listing = DirectoryListing.scan(path, mtime_ns)
+        with self._lock:
+            self._discard(path)
+            if len(listing.entries) <= self.max_entries:
+                self._listings[path] = listing
+                self._size += len(listing.entries)
+                while self._size > self.max_entries:
+                    self._discard(next(iter(self._listings)))
+        return listing
+
+    def invalidate(self, path):
+        with self._lock:
+            self._discard(path)
+
+    def _discard(self, path):
+        listing = self._listings.pop(path, None)
+        if listing is not None:
+            self._size -= len(listing.entries)
+
+
+listing_cache = ListingCache()
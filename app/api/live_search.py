@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import collections
+import concurrent.futures
+
+from app.jobs.engine import native_executor
+from .search_index import join_relative, name_matches
+
+
+def scan_directory(volume, relative_dir, query, mode, list_subdirs):
+    """
+    List one directory on a pool thread.
+
+    Returns (subdirectories to descend into, matches), where matches are
+    ('directory', path) or ('file', entry dict) in listing order. Symlinked
+    directories are matched but not followed, like os.walk.
+    """
+    subdirs = []
+    matches = []
+    try:
+        with os.scandir(os.path.join(volume, relative_dir)) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    if is_dir and list_subdirs and not entry.is_symlink():
+                        subdirs.append(entry.name)
+                    if not name_matches(entry.name, query, mode):
+                        continue
+                    relative_path = join_relative(relative_dir, entry.name)
+                    if is_dir:
+                        matches.append(('directory', relative_path))
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                matches.append(('file', {
+                    'name': entry.name,
+                    'size': stat.st_size,
+                    'lastModified': int(stat.st_mtime),
+                    'path': relative_path
+                }))
+    except OSError:
+        pass
+    return subdirs, matches
+
+
+def parallel_walk(volume, root, query, mode, limit=None, max_depth=None, time_budget=None, workers=8):
+    """
+    Generate NDJSON search results for the tree under root as they are found.
+
+    Directories are listed with os.scandir on `workers` native threads, at
+    most two per thread in flight; pending directories are kept on a stack
+    so the frontier stays small even in wide trees. Each listed directory
+    yields one chunk holding its matches, one JSON object per line:
+    {"type": "directory", "path": ...} or {"type": "file", ...}. The walk
+    stops at `limit` matches, below `max_depth` levels under root and after
+    `time_budget` seconds, and ends with a {"type": "done"} line saying
+    whether it stopped early. Closing the generator (the client went away)
+    cancels whatever is still queued.
+    """
+    start = time.monotonic()
+    deadline = start + time_budget if time_budget else None
+    found = 0
+    stopped = None
+    stack = [(root, 0)]
+    in_flight = collections.deque()
+    executor = native_executor(workers)
+
+    def submit():
+        while stack and len(in_flight) < workers * 2:
+            relative_dir, depth = stack.pop()
+            list_subdirs = max_depth is None or depth < max_depth
+            future = executor.submit(scan_directory, volume, relative_dir, query, mode, list_subdirs)
+            in_flight.append((relative_dir, depth, future))
+
+    try:
+        submit()
+        while in_flight:
+            relative_dir, depth, future = in_flight.popleft()
+            try:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                subdirs, matches = future.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                stopped = 'time_budget'
+                break
+
+            lines = []
+            for kind, match in matches:
+                if limit is not None and found >= limit:
+                    stopped = 'limit'
+                    break
+                found += 1
+                if kind == 'directory':
+                    lines.append(json.dumps({'type': 'directory', 'path': match}))
+                else:
+                    lines.append(json.dumps(dict(match, type='file')))
+            if lines:
+                yield '\n'.join(lines) + '\n'
+            if stopped:
+                break
+
+            stack.extend((join_relative(relative_dir, name), depth + 1) for name in reversed(subdirs))
+            submit()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    yield json.dumps({
+        'type': 'done',
+        'source': 'walk',
+        'found': found,
+        'truncated': stopped is not None,
+        'reason': stopped,
+        'elapsed_ms': round((time.monotonic() - start) * 1000),
+    }) + '\n'
@@ -1,11 +1,26 @@
-from flask import Blueprint, request, jsonify, abort, current_app
-from flask_login import login_required
+from flask import Blueprint, Response, request, jsonify, abort, current_app
+from flask_login import login_required, current_user
 import os
+import json
+import time
+import hashlib
 import pathlib
 import shutil
 from werkzeug.utils import secure_filename
 
 from config import VOLUME
+from .search_index import filename_index, name_matches, SEARCH_MODES
+from .content_index import content_index
+from .live_search import parallel_walk
+from .file_windows import line_indexes, read_forward, read_backward
+from .file_saves import parse_edits, apply_edits, save_atomically, StaleVersion
+from .listing import listing_cache, encode_cursor, InvalidCursor, SORT_OPTIONS
+from .changes import change_feed
+from .dir_sizes import directory_sizes
+from app.jobs.engine import job_manager
+from app.jobs.operations import move_paths, copy_paths
+from app.jobs import fastcopy
+from app.metrics.collectors import FILESYSTEM_DURATION
 
 api_bp = Blueprint('api', __name__)
 
@@ -19,6 +34,28 @@ def secure_path(path):
         abort(403)
     return abs_path
 
+def file_etag(stat):
+    """
+    Strong validator for a file built from its inode, size and mtime.
+    """
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+def not_modified(etag):
+    """
+    Return a 304 response if the client already holds the representation tagged etag.
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 def secure_relative_path(relative_path):
     """
     Secure each part of the relative path to prevent directory traversal.
@@ -32,30 +69,62 @@ def secure_relative_path(relative_path):
 @login_required
 def list_directory():
     path = request.args.get('path', '')
+    sort = request.args.get('sort', 'name_asc')
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    with_sizes = request.args.get('sizes', 'false').lower() in ('1', 'true', 'yes')
     current_app.logger.info(f"Listing directory: {path}")
     try:
+        if sort not in SORT_OPTIONS:
+            current_app.logger.error(f"Invalid sort option: {sort}")
+            return jsonify({'error': f"Sort must be one of: {', '.join(SORT_OPTIONS)}."}), 400
+
+        if limit is not None and limit <= 0:
+            current_app.logger.error(f"Invalid page size: {limit}")
+            return jsonify({'error': 'Limit must be a positive integer.'}), 400
+
         current_dir = secure_path(path)
         if not os.path.exists(current_dir):
             current_app.logger.error(f"Directory not found: {current_dir}")
             return jsonify({'error': 'Directory not found'}), 404
 
+        listing = listing_cache.get(current_dir)
+        sizes_version = directory_sizes.version() if with_sizes else None
+        etag = hashlib.blake2b(
+            '\0'.join([listing.digest, path, sort, str(limit), cursor or '', str(sizes_version)]
+                      ).encode('utf-8', 'surrogateescape'),
+            digest_size=16
+        ).hexdigest()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        entries = listing.sorted(sort)
+        try:
+            start = listing.resolve_cursor(sort, cursor) if cursor else 0
+        except InvalidCursor:
+            current_app.logger.error(f"Invalid listing cursor: {cursor}")
+            return jsonify({'error': 'Invalid cursor.'}), 400
+        end = len(entries) if limit is None else start + limit
+        page = entries[start:end]
+
+        relative_dir = os.path.relpath(current_dir, VOLUME).replace("\\", "/")
+        relative_dir = '' if relative_dir == '.' else relative_dir + '/'
+
         directories = []
         files = []
-        for item in os.listdir(current_dir):
-            item_path = os.path.join(current_dir, item)
-            if os.path.isdir(item_path):
-                directories.append(item)
-            elif os.path.isfile(item_path):
-                stat = os.stat(item_path)
+        for name, is_dir, size, mtime in page:
+            if is_dir:
+                directories.append(name)
+            else:
                 files.append({
-                    'name': item,
-                    'size': stat.st_size,
-                    'lastModified': int(stat.st_mtime),
-                    'path': os.path.relpath(item_path, VOLUME).replace("\\", "/")
+                    'name': name,
+                    'size': size,
+                    'lastModified': mtime,
+                    'path': relative_dir + name
                 })
 
-        directories.sort()
-        files.sort(key=lambda x: x['name'].lower())
+        next_cursor = encode_cursor(end, page[-1][0]) if page and end < len(entries) else None
 
         breadcrumb = [{'name': 'Root', 'path': ''}]
         if path:
@@ -65,16 +134,103 @@ def list_directory():
                 accumulated_path = os.path.join(accumulated_path, part)
                 breadcrumb.append({'name': part, 'path': accumulated_path.replace("\\", "/")})
 
-        return jsonify({
+        data = {
             'directories': directories,
             'files': files,
-            'breadcrumb': breadcrumb
-        })
+            'breadcrumb': breadcrumb,
+            'total': len(entries),
+            'next_cursor': next_cursor
+        }
+        if sizes_version is not None:
+            # Only totals already computed by the background scan are included
+            data['directory_sizes'] = directory_sizes.get(relative_dir.rstrip('/'), directories)
+        return with_etag(jsonify(data), etag)
 
     except Exception as e:
         current_app.logger.exception(f"Error listing directory {path}: {e}")
         return jsonify({'error': 'An error occurred while listing the directory.', 'message': str(e)}), 500
 
+@api_bp.route('/events', methods=['GET'])
+@login_required
+def directory_events():
+    """
+    Server-sent events describing changes to one directory as they happen.
+    """
+    path = request.args.get('path', '')
+    if not change_feed.enabled:
+        return jsonify({'error': 'Change notifications are not available.'}), 503
+
+    directory = secure_path(path)
+    if not os.path.isdir(directory):
+        current_app.logger.error(f"Directory not found: {directory}")
+        return jsonify({'error': 'Directory not found'}), 404
+
+    try:
+        subscription = change_feed.subscribe(directory)
+    except OSError as e:
+        # Typically fs.inotify.max_user_watches or max_user_instances reached
+        current_app.logger.warning(f"Could not watch {directory}: {e}")
+        return jsonify({'error': 'Change notifications are not available.', 'message': str(e)}), 503
+
+    response = Response(change_feed.stream(subscription), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_bp.route('/largest_folders', methods=['GET'])
+@login_required
+def largest_folders():
+    path = request.args.get('path', '')
+    limit = request.args.get('limit', 20, type=int)
+    if limit <= 0 or limit > 1000:
+        return jsonify({'error': 'Limit must be between 1 and 1000.'}), 400
+
+    try:
+        directory = secure_path(path)
+        if not os.path.isdir(directory):
+            current_app.logger.error(f"Directory not found: {directory}")
+            return jsonify({'error': 'Directory not found'}), 404
+
+        if directory_sizes.version() is None:
+            return jsonify({'error': 'Folder sizes are still being calculated.'}), 503
+
+        relative_dir = os.path.relpath(directory, VOLUME).replace("\\", "/")
+        relative_dir = '' if relative_dir == '.' else relative_dir
+        return jsonify({'path': relative_dir, 'folders': directory_sizes.largest(relative_dir, limit)}), 200
+
+    except Exception as e:
+        current_app.logger.exception(f"Error listing largest folders under {path}: {e}")
+        return jsonify({'error': 'An error occurred while listing the largest folders.', 'message': str(e)}), 500
+
+def walk_search(query, mode='substring', limit=None):
+    """
+    Search VOLUME by walking it; used until the filename index has been built.
+    """
+    matched_directories = []
+    matched_files = []
+    for root, dirs, files in os.walk(VOLUME):
+        for dir in dirs:
+            if name_matches(dir, query, mode):
+                if limit is not None and len(matched_directories) + len(matched_files) >= limit:
+                    return matched_directories, matched_files, True
+                relative_path = os.path.relpath(os.path.join(root, dir), VOLUME).replace("\\", "/")
+                matched_directories.append(relative_path)
+
+        for file in files:
+            if name_matches(file, query, mode):
+                if limit is not None and len(matched_directories) + len(matched_files) >= limit:
+                    return matched_directories, matched_files, True
+                file_path = os.path.join(root, file)
+                relative_path = os.path.relpath(file_path, VOLUME).replace("\\", "/")
+                stat = os.stat(file_path)
+                matched_files.append({
+                    'name': file,
+                    'size': stat.st_size,
+                    'lastModified': int(stat.st_mtime),
+                    'path': relative_path
+                })
+    return matched_directories, matched_files, False
+
 @api_bp.route('/search', methods=['GET'])
 @login_required
 def search():
@@ -83,28 +239,24 @@ def search():
         current_app.logger.error("No search query provided.")
         return jsonify({'error': 'No search query provided.'}), 400
 
-    current_app.logger.info(f"Performing search for query: {query}")
-    matched_directories = []
-    matched_files = []
+    mode = request.args.get('mode', 'substring')
+    if mode not in SEARCH_MODES + ('content',):
+        current_app.logger.error(f"Invalid search mode: {mode}")
+        return jsonify({'error': f"Search mode must be one of: {', '.join(SEARCH_MODES + ('content',))}."}), 400
+
+    if mode == 'content':
+        return content_search(query)
+
+    limit = request.args.get('limit', current_app.config['SEARCH_RESULT_LIMIT'], type=int)
+
+    current_app.logger.info(f"Performing {mode} search for query: {query}")
 
     try:
-        for root, dirs, files in os.walk(VOLUME):
-            for dir in dirs:
-                if query in dir.lower():
-                    relative_path = os.path.relpath(os.path.join(root, dir), VOLUME).replace("\\", "/")
-                    matched_directories.append(relative_path)
-
-            for file in files:
-                if query in file.lower():
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, VOLUME).replace("\\", "/")
-                    stat = os.stat(file_path)
-                    matched_files.append({
-                        'name': file,
-                        'size': stat.st_size,
-                        'lastModified': int(stat.st_mtime),
-                        'path': relative_path
-                    })
+        if filename_index.is_ready():
+            matched_directories, matched_files, truncated = filename_index.search(query, mode, limit)
+        else:
+            with FILESYSTEM_DURATION.time(operation='search_walk'):
+                matched_directories, matched_files, truncated = walk_search(query, mode, limit)
 
         breadcrumb = [{'name': 'Root', 'path': ''}, {'name': f"Search Results for '{query}'", 'path': ''}]
 
@@ -112,12 +264,111 @@ def search():
         return jsonify({
             'directories': matched_directories,
             'files': matched_files,
-            'breadcrumb': breadcrumb
+            'breadcrumb': breadcrumb,
+            'truncated': truncated
         })
     except Exception as e:
         current_app.logger.exception(f"Error during search: {e}")
         return jsonify({'error': 'An error occurred during the search.', 'message': str(e)}), 500
     
+def indexed_results(query, mode, limit):
+    """
+    The filename index's results for query in the NDJSON format of parallel_walk().
+    """
+    start = time.monotonic()
+    directories, files, truncated = filename_index.search(query, mode, limit)
+    for path in directories:
+        yield json.dumps({'type': 'directory', 'path': path}) + '\n'
+    for file in files:
+        yield json.dumps(dict(file, type='file')) + '\n'
+    yield json.dumps({
+        'type': 'done',
+        'source': 'index',
+        'found': len(directories) + len(files),
+        'truncated': truncated,
+        'reason': 'limit' if truncated else None,
+        'elapsed_ms': round((time.monotonic() - start) * 1000),
+    }) + '\n'
+
+@api_bp.route('/search/live', methods=['GET'])
+@login_required
+def live_search():
+    """
+    Stream search results as NDJSON while they are found.
+
+    Searches of the whole volume are answered from the filename index once
+    it is built. Otherwise, and for searches scoped with path or max_depth,
+    the tree is walked in parallel within a time budget.
+    """
+    query = request.args.get('query', '').lower()
+    if not query:
+        current_app.logger.error("No search query provided.")
+        return jsonify({'error': 'No search query provided.'}), 400
+
+    mode = request.args.get('mode', 'substring')
+    if mode not in SEARCH_MODES:
+        current_app.logger.error(f"Invalid search mode: {mode}")
+        return jsonify({'error': f"Search mode must be one of: {', '.join(SEARCH_MODES)}."}), 400
+
+    path = request.args.get('path', '').strip('/')
+    root = secure_path(path)
+    if not os.path.isdir(root):
+        return jsonify({'error': 'The specified path is not a directory.'}), 400
+    relative_root = os.path.relpath(root, VOLUME).replace("\\", "/")
+    if relative_root == '.':
+        relative_root = ''
+
+    limit = request.args.get('limit', current_app.config['SEARCH_RESULT_LIMIT'], type=int)
+    max_depth = request.args.get('max_depth', type=int)
+    if max_depth is not None and max_depth < 0:
+        return jsonify({'error': 'max_depth must not be negative.'}), 400
+    time_budget = request.args.get('time_budget', current_app.config['LIVE_SEARCH_TIME_BUDGET'], type=float)
+    time_budget = min(max(time_budget, 0.1), current_app.config['LIVE_SEARCH_MAX_TIME_BUDGET'])
+
+    if relative_root == '' and max_depth is None and filename_index.is_ready():
+        current_app.logger.info(f"Streaming indexed {mode} search for query: {query}")
+        results = indexed_results(query, mode, limit)
+    else:
+        current_app.logger.info(f"Streaming live {mode} search for query: {query} under '{relative_root}'")
+        results = parallel_walk(VOLUME, relative_root, query, mode, limit, max_depth, time_budget,
+                                current_app.config['LIVE_SEARCH_WORKERS'])
+
+    response = Response(results, mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-store'
+    # Let a buffering reverse proxy pass results through as they are found
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def content_search(query):
+    """
+    Search file contents through the content index; there is no fallback walk.
+    """
+    if not content_index.enabled:
+        return jsonify({'error': 'Content search is not enabled on this server.'}), 400
+    if not content_index.is_ready():
+        return jsonify({'error': 'The content index is still being built. Try again later.'}), 503
+
+    limit = request.args.get('limit', current_app.config['CONTENT_SEARCH_LIMIT'], type=int)
+    current_app.logger.info(f"Performing content search for query: {query}")
+
+    try:
+        with FILESYSTEM_DURATION.time(operation='content_search'):
+            matched_files, truncated = content_index.search(query, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error during content search: {e}")
+        return jsonify({'error': 'An error occurred during the search.', 'message': str(e)}), 500
+
+    breadcrumb = [{'name': 'Root', 'path': ''}, {'name': f"Files containing '{query}'", 'path': ''}]
+    current_app.logger.info(f"Content search found {len(matched_files)} files.")
+    return jsonify({
+        'directories': [],
+        'files': matched_files,
+        'breadcrumb': breadcrumb,
+        'truncated': truncated
+    })
+
 @api_bp.route('/get_file_content', methods=['GET'])
 @login_required
 def get_file_content():
@@ -131,10 +382,23 @@ def get_file_content():
         if not os.path.isfile(secure_file_path):
             return jsonify({'error': 'The specified path is not a file.'}), 400
 
-        with open(secure_file_path, 'r', encoding='utf-8') as f:
+        stat = os.stat(secure_file_path)
+        if stat.st_size > current_app.config['EDITOR_MAX_FILE_SIZE']:
+            return jsonify({
+                'error': 'The file is too large to edit; read it with /api/file_window.',
+                'size': stat.st_size
+            }), 413
+
+        etag = file_etag(stat)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        # newline='' keeps '\r\n' so line numbers match the file for delta saves
+        with open(secure_file_path, 'r', encoding='utf-8', newline='') as f:
             content = f.read()
 
-        return jsonify({'content': content}), 200
+        return with_etag(jsonify({'content': content, 'version': etag}), etag), 200
 
     except UnicodeDecodeError:
         current_app.logger.error(f"Encoding error when reading file: {path}")
@@ -143,40 +407,145 @@ def get_file_content():
         current_app.logger.exception(f"Error fetching file content for {path}: {e}")
         return jsonify({'error': 'An error occurred while fetching file content.', 'message': str(e)}), 500
 
-@api_bp.route('/save_file_content', methods=['POST'])
+@api_bp.route('/file_window', methods=['GET'])
 @login_required
-def save_file_content():
+def file_window():
+    """
+    Return a window of whole lines of a text file, for viewing files of any size.
+
+    The window is chosen by one of line (0-based; uses the file's line
+    index, built on first use), offset (lines starting at a byte offset,
+    usually the end of the previous window), before (lines ending at a byte
+    offset, usually the start of the previous window) or tail (the last
+    lines), and holds at most `lines` lines and FILE_WINDOW_MAX_BYTES bytes.
+    first_line and total_lines are included when they are known without
+    indexing the file. Passing back file_id makes a window of a file that
+    was replaced or truncated (a rotated log) answer with reset instead.
+    """
+    path = request.args.get('path', '')
+    if not path:
+        return jsonify({'error': 'No file path provided.'}), 400
+    config = current_app.config
+    max_lines = min(max(request.args.get('lines', config['FILE_WINDOW_LINES'], type=int), 1),
+                    config['FILE_WINDOW_MAX_LINES'])
+    max_bytes = config['FILE_WINDOW_MAX_BYTES']
+    secure_file_path = secure_path(path)
+    if not os.path.isfile(secure_file_path):
+        return jsonify({'error': 'The specified path is not a file.'}), 400
+
     try:
-        if not request.is_json:
-            current_app.logger.error("Request content type is not JSON.")
-            return jsonify({'error': 'Invalid content type. JSON expected.'}), 400
+        with open(secure_file_path, 'rb') as f:
+            fd = f.fileno()
+            stat = os.fstat(fd)
+            size = stat.st_size
+            file_id = f"{stat.st_ino:x}"
+            expected_id = request.args.get('file_id')
+
+            line = request.args.get('line', type=int)
+            offset = request.args.get('offset', type=int)
+            before = request.args.get('before', type=int)
+            if 'tail' in request.args:
+                before = size
+            if (expected_id and expected_id != file_id) or max(offset or 0, before or 0) > size:
+                return jsonify({'reset': True, 'file_id': file_id, 'size': size})
+
+            index = line_indexes.get(secure_file_path, fd, stat, build=line is not None)
+            first_line = None
+            if line is not None:
+                first_line = min(max(line, 0), index.total_lines)
+                start = index.offset_of(fd, first_line)
+                data, end = read_forward(fd, start, size, max_lines, max_bytes)
+            elif before is not None:
+                data, start = read_backward(fd, before, max_lines, max_bytes)
+                end = before
+            else:
+                start = max(offset or 0, 0)
+                data, end = read_forward(fd, start, size, max_lines, max_bytes)
+
+            if first_line is None and start == 0:
+                first_line = 0
+            elif first_line is None and index is not None:
+                first_line = index.line_of(fd, start)
+
+        response = jsonify({
+            'text': data.decode('utf-8', errors='replace'),
+            'offset': start,
+            'end': end,
+            'size': size,
+            'file_id': file_id,
+            'first_line': first_line,
+            'total_lines': index.total_lines if index is not None else None,
+            'bof': start == 0,
+            'eof': end >= size,
+        })
+        response.headers['Cache-Control'] = 'no-store'
+        return response
 
-        data = request.get_json()
-        if not data:
-            current_app.logger.error("No JSON payload received.")
-            return jsonify({'error': 'Invalid or missing JSON payload.'}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error reading a window of {path}: {e}")
+        return jsonify({'error': 'An error occurred while reading the file.', 'message': str(e)}), 500
 
-        path = data.get('path', '').strip()
-        content = data.get('content', '')
+@api_bp.route('/save_file_content', methods=['POST'])
+@login_required
+def save_file_content():
+    """
+    Save a file atomically, either whole or as line edits against the version that was opened.
+
+    The JSON body has path plus either content (the whole new text) or
+    edits: a sorted list of {start, end, lines} replacing lines
+    [start, end) of base_version, the version get_file_content returned.
+    The new file is streamed into a temp file next to the old one and
+    renamed over it. If the file changed since base_version the save is
+    refused with 409 and the current version, so the client can reload
+    instead of overwriting someone else's changes.
+    """
+    if not request.is_json:
+        current_app.logger.error("Request content type is not JSON.")
+        return jsonify({'error': 'Invalid content type. JSON expected.'}), 400
 
-        if not path:
-            return jsonify({'error': 'No file path provided.'}), 400
+    data = request.get_json()
+    if not data:
+        current_app.logger.error("No JSON payload received.")
+        return jsonify({'error': 'Invalid or missing JSON payload.'}), 400
 
-        secure_file_path = secure_path(path)
+    path = data.get('path', '').strip()
+    if not path:
+        return jsonify({'error': 'No file path provided.'}), 400
+
+    secure_file_path = secure_path(path)
 
+    try:
         if not os.path.isfile(secure_file_path):
             return jsonify({'error': 'The specified path is not a file.'}), 400
 
-        with open(secure_file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        base_version = data.get('base_version')
+        if 'edits' in data:
+            if not base_version:
+                return jsonify({'error': 'Edits need the base_version they were made against.'}), 400
+            edits = parse_edits(data['edits'])
+            write_body = lambda src, dst: apply_edits(src, dst, edits)
+        else:
+            content = data.get('content', '')
+            if not isinstance(content, str):
+                return jsonify({'error': 'content must be a string.'}), 400
+            write_body = lambda src, dst: dst.write(content.encode('utf-8'))
+
+        with FILESYSTEM_DURATION.time(operation='save_file'):
+            version = save_atomically(secure_file_path, base_version, file_etag, write_body)
+        listing_cache.invalidate(os.path.dirname(secure_file_path))
 
         current_app.logger.info(f"File saved: {secure_file_path}")
-        return jsonify({'message': 'File saved successfully.'}), 200
+        return jsonify({'message': 'File saved successfully.', 'version': version}), 200
 
+    except StaleVersion as e:
+        current_app.logger.info(f"Refused stale save of {secure_file_path}: {e}")
+        return jsonify({'error': 'The file changed since it was opened.', 'version': e.current}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.exception(f"Error saving file content for {path}: {e}")
         return jsonify({'error': 'An error occurred while saving file content.', 'message': str(e)}), 500
-    
+
 @api_bp.route('/move_items', methods=['POST'])
 @login_required
 def move_items():
@@ -205,6 +574,8 @@ def move_items():
 
         moved = []
         errors = []
+        cross_device = []
+        destination_device = os.stat(secure_destination_path).st_dev
 
         for source_path in source_paths:
             secure_source_path = secure_path(source_path)
@@ -220,6 +591,10 @@ def move_items():
                 continue
 
             try:
+                if os.lstat(secure_source_path).st_dev != destination_device:
+                    # Not a rename: the data has to be copied, which can take a long time
+                    cross_device.append((source_path, secure_source_path, destination))
+                    continue
                 shutil.move(secure_source_path, destination)
                 current_app.logger.info(f"Moved {secure_source_path} to {destination}")
                 moved.append(source_path)
@@ -227,11 +602,94 @@ def move_items():
                 current_app.logger.exception(f"Error moving {source_path} to {destination}: {e}")
                 errors.append({'path': source_path, 'error': 'Failed to move item.'})
 
-        if errors:
+        if cross_device:
+            job = job_manager.submit('move', f"Move {len(cross_device)} item(s) to /{destination_path}", current_user.id,
+                                     move_paths, cross_device)
+            return jsonify({'message': 'Move started.', 'moved': moved, 'errors': errors, 'job': job.record}), 202
+        elif errors:
             return jsonify({'message': 'Some items were not moved.', 'moved': moved, 'errors': errors}), 207
         else:
             return jsonify({'message': 'All items moved successfully.', 'moved': moved}), 200
 
     except Exception as e:
         current_app.logger.exception(f"Error moving items: {e}")
-        return jsonify({'error': 'An error occurred while moving items.', 'message': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': 'An error occurred while moving items.', 'message': str(e)}), 500
+
+@api_bp.route('/copy_items', methods=['POST'])
+@login_required
+def copy_items():
+    try:
+        if not request.is_json:
+            current_app.logger.error("Request content type is not JSON.")
+            return jsonify({'error': 'Invalid content type. JSON expected.'}), 400
+
+        data = request.get_json()
+        current_app.logger.debug(f"Received copy_items data: {data}")
+        source_paths = data.get('source_paths', [])
+        destination_path = data.get('destination_path', '')
+
+        if not source_paths:
+            current_app.logger.error("No source paths provided.")
+            return jsonify({'error': 'No source paths provided.'}), 400
+
+        if not isinstance(source_paths, list):
+            source_paths = [source_paths]
+
+        secure_destination_path = VOLUME if destination_path == '' else secure_path(destination_path)
+
+        if not os.path.isdir(secure_destination_path):
+            current_app.logger.error("Target directory does not exist.")
+            return jsonify({'error': 'Target directory does not exist.'}), 400
+
+        copied = []
+        errors = []
+        background = []
+
+        for source_path in source_paths:
+            secure_source_path = secure_path(source_path)
+            item_name = os.path.basename(secure_source_path)
+            destination = os.path.join(secure_destination_path, item_name)
+
+            if not os.path.lexists(secure_source_path):
+                errors.append({'path': source_path, 'error': 'Item does not exist.'})
+                continue
+
+            if os.path.abspath(destination).startswith(os.path.abspath(secure_source_path) + os.sep):
+                errors.append({'path': source_path, 'error': 'Cannot copy a directory into itself or its subdirectory.'})
+                continue
+
+            if os.path.lexists(destination):
+                errors.append({'path': source_path, 'error': 'Destination already exists.'})
+                continue
+
+            try:
+                if os.path.islink(secure_source_path):
+                    os.symlink(os.readlink(secure_source_path), destination)
+                elif os.path.isdir(secure_source_path) or \
+                        os.path.getsize(secure_source_path) > current_app.config['COPY_INLINE_MAX_SIZE']:
+                    # Trees and large files are copied by a job with progress reporting
+                    background.append((source_path, secure_source_path, destination))
+                    continue
+                else:
+                    copy_method = fastcopy.copy_file(secure_source_path, destination)
+                    current_app.logger.info(f"Copied {secure_source_path} to {destination} using {copy_method}")
+                copied.append(source_path)
+            except Exception as e:
+                current_app.logger.exception(f"Error copying {source_path} to {destination}: {e}")
+                errors.append({'path': source_path, 'error': 'Failed to copy item.'})
+
+        if copied:
+            listing_cache.invalidate(secure_destination_path)
+
+        if background:
+            job = job_manager.submit('copy', f"Copy {len(background)} item(s) to /{destination_path}", current_user.id,
+                                     copy_paths, background)
+            return jsonify({'message': 'Copy started.', 'copied': copied, 'errors': errors, 'job': job.record}), 202
+        elif errors:
+            return jsonify({'message': 'Some items were not copied.', 'copied': copied, 'errors': errors}), 207
+        else:
+            return jsonify({'message': 'All items copied successfully.', 'copied': copied}), 200
+
+    except Exception as e:
+        current_app.logger.exception(f"Error copying items: {e}")
+        return jsonify({'error': 'An error occurred while copying items.', 'message': str(e)}), 500
@@ -0,0 +1,338 @@
+import os
+import time
+import fcntl
+import fnmatch
+import sqlite3
+from contextlib import contextmanager
+
+from config import VOLUME, SEARCH_INDEX_FILE
+from app.metrics.collectors import FILESYSTEM_DURATION
+from app.jobs.engine import native_thread
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    is_link INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    UNIQUE (parent, name)
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    dirty INTEGER NOT NULL,
+    total_bytes INTEGER NOT NULL DEFAULT 0,
+    total_files INTEGER NOT NULL DEFAULT 0,
+    total_dirs INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS dirs_total_bytes ON dirs (total_bytes);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+-- Names are lowercased in Python, since SQLite's LIKE only folds ASCII case
+CREATE VIRTUAL TABLE IF NOT EXISTS entry_names USING fts5(
+    name_lower, content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entry_names (rowid, name_lower) VALUES (new.id, new.name_lower);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entry_names (entry_names, rowid, name_lower) VALUES ('delete', old.id, old.name_lower);
+END;
+"""
+
+SEARCH_MODES = ('substring', 'prefix', 'glob')
+
+
+def join_relative(parent, name):
+    return f"{parent}/{name}" if parent else name
+
+
+def like_pattern(query, mode):
+    """
+    Translate a query into a LIKE pattern that selects a superset of the matches.
+
+    '%' and '_' in the query are left unescaped because an ESCAPE clause stops
+    FTS5 from using the trigram index; false positives are removed afterwards
+    by name_matches().
+    """
+    if mode == 'prefix':
+        return f"{query}%"
+    if mode == 'glob':
+        pattern = []
+        i = 0
+        while i < len(query):
+            char = query[i]
+            if char == '*':
+                pattern.append('%')
+            elif char == '?':
+                pattern.append('_')
+            elif char == '[':
+                end = query.find(']', i + 2)
+                if end == -1:
+                    pattern.append(char)
+                else:
+                    pattern.append('_')
+                    i = end
+            else:
+                pattern.append(char)
+            i += 1
+        return ''.join(pattern)
+    return f"%{query}%"
+
+
+def name_matches(name, query, mode):
+    """Case-insensitive match of a single file or directory name."""
+    name = name.lower()
+    if mode == 'prefix':
+        return name.startswith(query)
+    if mode == 'glob':
+        return fnmatch.fnmatchcase(name, query)
+    return query in name
+
+
+class FilenameIndex:
+    """
+    Persistent filename index of VOLUME kept in SQLite under DATA_DIR.
+
+    Names are indexed with the FTS5 trigram tokenizer so substring, prefix and
+    glob queries don't need to walk the volume. One process at a time (guarded
+    by an flock next to the database) keeps the index current by rescanning
+    only directories whose mtime changed since the last pass; the other
+    gunicorn workers just read from it.
+    """
+
+    def __init__(self, path=SEARCH_INDEX_FILE, volume=VOLUME):
+        self.path = path
+        self.volume = volume
+        self.interval = 60
+        self.enabled = False
+        self.logger = None
+        self.rescan_hooks = []
+        self._lock_file = None
+
+    def init_app(self, app):
+        self.logger = app.logger
+        self.interval = app.config['SEARCH_INDEX_INTERVAL']
+        if not app.config['SEARCH_INDEX']:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self.connect() as conn:
+                conn.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            app.logger.warning(f"Filename index disabled: {e}")
+            return
+
+        self.enabled = True
+        native_thread(self._run, 'filename-index')
+
+    @contextmanager
+    def connect(self):
+        """Open a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def is_ready(self):
+        """True once a complete scan of the volume has been committed."""
+        if not self.enabled:
+            return False
+        try:
+            with self.connect() as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def search(self, query, mode='substring', limit=None):
+        """
+        Return (directories, files, truncated) for names matching query.
+
+        Directories are relative paths; files carry name, size, lastModified
+        and path, exactly like the live walk in search().
+        """
+        query = query.lower()
+        directories = []
+        files = []
+        truncated = False
+
+        with self.connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT e.parent, e.name, e.is_dir
+                FROM entry_names JOIN entries e ON e.id = entry_names.rowid
+                WHERE entry_names.name_lower LIKE ?
+                """,
+                (like_pattern(query, mode),)
+            )
+            for parent, name, is_dir in rows:
+                if not name_matches(name, query, mode):
+                    continue
+                if limit is not None and len(directories) + len(files) >= limit:
+                    truncated = True
+                    break
+
+                relative_path = join_relative(parent, name)
+                if is_dir:
+                    directories.append(relative_path)
+                    continue
+
+                # Sizes are re-read for the (bounded) result set only, since
+                # modifying a file doesn't change its directory's mtime.
+                try:
+                    stat = os.stat(os.path.join(self.volume, relative_path))
+                except OSError:
+                    continue
+                files.append({
+                    'name': name,
+                    'size': stat.st_size,
+                    'lastModified': int(stat.st_mtime),
+                    'path': relative_path
+                })
+
+        return directories, files, truncated
+
+    def _run(self):
+        while True:
+            if self._acquire_lock():
+                try:
+                    with FILESYSTEM_DURATION.time(operation='index_rescan'):
+                        self.rescan()
+                except Exception as e:
+                    self.logger.exception(f"Error updating filename index: {e}")
+            time.sleep(self.interval)
+
+    def _acquire_lock(self):
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def rescan(self):
+        """
+        Bring the index in line with VOLUME.
+
+        Every directory is stat'ed, but only directories whose mtime or inode
+        changed (entries added, removed or renamed, or the directory replaced)
+        are listed again and flagged dirty for the rescan hooks. Directories
+        that disappeared are dropped along with their children.
+        """
+        start = time.monotonic()
+        changed = 0
+        with self.connect() as conn:
+            known = {path: (mtime_ns, inode) for path, mtime_ns, inode in
+                     conn.execute('SELECT path, mtime_ns, inode FROM dirs')}
+            seen = set()
+            stack = ['']
+            while stack:
+                relative_dir = stack.pop()
+                absolute_dir = os.path.join(self.volume, relative_dir)
+                try:
+                    stat = os.stat(absolute_dir)
+                except OSError:
+                    continue
+                seen.add(relative_dir)
+
+                if known.get(relative_dir) != (stat.st_mtime_ns, stat.st_ino):
+                    try:
+                        subdirs = self._scan_directory(conn, relative_dir, absolute_dir)
+                    except OSError as e:
+                        self.logger.warning(f"Filename index could not list {absolute_dir}: {e}")
+                        continue
+                    conn.execute(
+                        """
+                        INSERT INTO dirs (path, mtime_ns, inode, dirty) VALUES (?, ?, ?, 1)
+                        ON CONFLICT (path) DO UPDATE SET
+                            mtime_ns = excluded.mtime_ns, inode = excluded.inode, dirty = 1
+                        """,
+                        (relative_dir, stat.st_mtime_ns, stat.st_ino)
+                    )
+                    changed += 1
+                    if changed % 500 == 0:
+                        conn.commit()
+                else:
+                    subdirs = [name for (name,) in conn.execute(
+                        'SELECT name FROM entries WHERE parent = ? AND is_dir = 1 AND is_link = 0',
+                        (relative_dir,)
+                    )]
+
+                stack.extend(join_relative(relative_dir, name) for name in subdirs)
+                # Yield to other greenlets when running under gevent
+                time.sleep(0)
+
+            for relative_dir in known.keys() - seen:
+                conn.execute('DELETE FROM entries WHERE parent = ?', (relative_dir,))
+                conn.execute('DELETE FROM dirs WHERE path = ?', (relative_dir,))
+
+            for hook in self.rescan_hooks:
+                hook(conn)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)",
+                (str(int(time.time())),)
+            )
+
+        if changed:
+            self.logger.info(
+                f"Filename index rescanned {changed} directories in {time.monotonic() - start:.2f}s."
+            )
+
+    def _scan_directory(self, conn, relative_dir, absolute_dir):
+        """Replace the indexed children of one directory; return its subdirectories."""
+        indexed = {
+            name: (is_dir, is_link, size, mtime)
+            for name, is_dir, is_link, size, mtime in conn.execute(
+                'SELECT name, is_dir, is_link, size, mtime FROM entries WHERE parent = ?',
+                (relative_dir,)
+            )
+        }
+        subdirs = []
+        with os.scandir(absolute_dir) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    is_link = entry.is_symlink()
+                    stat = entry.stat(follow_symlinks=False) if is_dir else entry.stat()
+                except OSError:
+                    continue
+
+                row = (int(is_dir), int(is_link), 0 if is_dir else stat.st_size, int(stat.st_mtime))
+                if is_dir and not is_link:
+                    subdirs.append(entry.name)
+                if indexed.pop(entry.name, None) != row:
+                    conn.execute(
+                        """
+                        INSERT INTO entries (parent, name, name_lower, is_dir, is_link, size, mtime)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (parent, name) DO UPDATE SET
+                            is_dir = excluded.is_dir, is_link = excluded.is_link,
+                            size = excluded.size, mtime = excluded.mtime
+                        """,
+                        (relative_dir, entry.name, entry.name.lower()) + row
+                    )
+
+        for name in indexed:
+            conn.execute('DELETE FROM entries WHERE parent = ? AND name = ?', (relative_dir, name))
+        return subdirs
+
+
+filename_index = FilenameIndex()
@@ -0,0 +1,213 @@
+"""
+Build step for the files under app/static.
+
+Every file is content-hashed and copied into a build directory together
+with gzip and (when the brotli package is installed) brotli variants of the
+compressible ones. url() references in stylesheets are rewritten to the
+hashed URLs of the files they point at, so fonts and images are cached as
+long as the stylesheet. Directories listed in TREES are loaded by relative
+paths from the browser (Monaco's AMD loader), so they also get one hash
+covering all their files.
+
+The result is described by manifest.json in the build directory. It is
+normally produced when the Docker image is built:
+
+    python -c "from app.assets.pipeline import main; main()"
+
+and otherwise on first start, or whenever the sources changed since.
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import fcntl
+import shutil
+import hashlib
+import posixpath
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from config import STATIC_BUILD_DIR
+
+PIPELINE_VERSION = 1  # bump when the build output format changes
+URL_PREFIX = '/assets'
+HASH_LENGTH = 16
+MANIFEST = 'manifest.json'
+
+TREES = ('js/vendor/monaco/vs',)
+COMPRESSIBLE = {'.js', '.css', '.html', '.svg', '.json', '.map', '.txt', '.xml', '.ttf', '.eot', '.ico'}
+MIN_COMPRESS_SIZE = 512
+MIN_SAVING = 0.05  # variants saving less than this fraction are not kept
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def asset_url(digest, relative_path):
+    return f"{URL_PREFIX}/{digest}/{relative_path}"
+
+
+def source_files(static_dir):
+    """Return the relative paths of all files under static_dir, sorted."""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        dirnames.sort()
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            files.append(os.path.relpath(path, static_dir).replace("\\", "/"))
+    return sorted(files)
+
+
+def source_signature(static_dir):
+    """Digest of the names, sizes and mtimes of the sources; changes when any of them does."""
+    digest = hashlib.sha256(f"v{PIPELINE_VERSION} brotli={brotli is not None}\n".encode())
+    for relative_path in source_files(static_dir):
+        stat = os.stat(os.path.join(static_dir, relative_path))
+        digest.update(f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def rewrite_css(relative_path, text, hashes):
+    """Point the relative url() references of a stylesheet at hashed URLs."""
+    base = posixpath.dirname(relative_path)
+
+    def replace(match):
+        reference = match.group(2).strip()
+        if reference.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        target, _, fragment = reference.partition('#')
+        target = target.partition('?')[0]
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        if resolved not in hashes:
+            return match.group(0)
+        url = asset_url(hashes[resolved], resolved)
+        if fragment:
+            url += '#' + fragment
+        return f'url("{url}")'
+
+    return CSS_URL.sub(replace, text)
+
+
+def compressed_variants(relative_path, data):
+    """Return {encoding: bytes} of the variants worth serving."""
+    if os.path.splitext(relative_path)[1].lower() not in COMPRESSIBLE or len(data) < MIN_COMPRESS_SIZE:
+        return {}
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {
+        encoding: variant for encoding, variant in variants.items()
+        if len(variant) <= len(data) * (1 - MIN_SAVING)
+    }
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(static_dir, build_dir, signature):
+    """Hash, rewrite and compress every asset into build_dir/<signature>; return the manifest."""
+    output_dir = os.path.join(build_dir, signature)
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    files = source_files(static_dir)
+    # Stylesheets last, so everything they reference is already hashed
+    files.sort(key=lambda relative_path: relative_path.endswith('.css'))
+
+    hashes = {}
+    entries = {}
+    for relative_path in files:
+        with open(os.path.join(static_dir, relative_path), 'rb') as f:
+            data = f.read()
+        if relative_path.endswith('.css'):
+            data = rewrite_css(relative_path, data.decode('utf-8'), hashes).encode('utf-8')
+        digest = content_hash(data)
+        hashes[relative_path] = digest
+
+        write_file(os.path.join(output_dir, relative_path), data)
+        variants = compressed_variants(relative_path, data)
+        for encoding, variant in variants.items():
+            suffix = '.br' if encoding == 'br' else '.gz'
+            write_file(os.path.join(output_dir, relative_path + suffix), variant)
+        entries[relative_path] = {
+            'hash': digest,
+            'size': len(data),
+            'encodings': {encoding: len(variant) for encoding, variant in variants.items()},
+        }
+
+    trees = {}
+    for tree in TREES:
+        digest = hashlib.sha256()
+        for relative_path in files:
+            if relative_path.startswith(tree + '/'):
+                digest.update(f"{relative_path}\0{hashes[relative_path]}\n".encode())
+        trees[tree] = digest.hexdigest()[:HASH_LENGTH]
+
+    return {'signature': signature, 'directory': signature, 'files': entries, 'trees': trees}
+
+
+def load_manifest(build_dir):
+    try:
+        with open(os.path.join(build_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_built(static_dir, build_dir=STATIC_BUILD_DIR, logger=None):
+    """
+    Return the manifest for the current sources, building it first if needed.
+
+    Workers starting together take an exclusive lock, so the first one
+    builds and the others load its result.
+    """
+    signature = source_signature(static_dir)
+    manifest = load_manifest(build_dir)
+    if manifest and manifest.get('signature') == signature:
+        return manifest
+
+    os.makedirs(build_dir, exist_ok=True)
+    with open(os.path.join(build_dir, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        manifest = load_manifest(build_dir)
+        if manifest and manifest.get('signature') == signature:
+            return manifest
+
+        if logger:
+            logger.info("Building static assets...")
+        manifest = build(static_dir, build_dir, signature)
+        tmp_path = os.path.join(build_dir, MANIFEST + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(build_dir, MANIFEST))
+
+        # Builds of older sources are no longer referenced
+        for name in os.listdir(build_dir):
+            path = os.path.join(build_dir, name)
+            if name != manifest['directory'] and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        if logger:
+            logger.info(f"Built {len(manifest['files'])} static assets into {build_dir}.")
+        return manifest
+
+
+def main():
+    static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+    build_dir = sys.argv[1] if len(sys.argv) > 1 else STATIC_BUILD_DIR
+    manifest = ensure_built(static_dir, build_dir)
+    compressed = sum(1 for entry in manifest['files'].values() if entry['encodings'])
+    print(f"{len(manifest['files'])} assets ({compressed} compressed) in {build_dir}")
+
+
+if __name__ == '__main__':
+    main()
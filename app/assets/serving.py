@@ -0,0 +1,126 @@
+import os
+import mimetypes
+
+from flask import url_for
+from werkzeug.wrappers import Request, Response
+from werkzeug.wsgi import wrap_file
+from werkzeug.http import parse_accept_header
+
+from config import STATIC_BUILD_DIR
+from .pipeline import URL_PREFIX, asset_url, ensure_built
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+class StaticAssets:
+    """
+    Serves the fingerprinted build of app/static under /assets/<hash>/<path>.
+
+    Requests are answered by a WSGI middleware in front of Flask, so they
+    never open a session, load the user or run any before_request hook. A
+    URL whose hash matches the current build is cached by browsers for a
+    year; a stale hash (a page rendered before a deploy) still gets the
+    current file, but revalidated. Templates build the URLs with
+    asset_url() and asset_tree_url().
+    """
+
+    def __init__(self, build_dir=STATIC_BUILD_DIR):
+        self.build_dir = build_dir
+        self.manifest = None
+        self.directory = None
+        self.logger = None
+
+    def init_app(self, app):
+        self.logger = app.logger
+        app.add_template_global(self.url, 'asset_url')
+        app.add_template_global(self.tree_url, 'asset_tree_url')
+        if not app.config['STATIC_PIPELINE']:
+            return
+        try:
+            self.manifest = ensure_built(app.static_folder, self.build_dir, app.logger)
+        except OSError as e:
+            # Read-only image without a prebuilt manifest: fall back to /static
+            app.logger.warning(f"Static asset build unavailable, serving /static unhashed: {e}")
+            return
+        self.directory = os.path.join(self.build_dir, self.manifest['directory'])
+        app.wsgi_app = self.middleware(app.wsgi_app)
+
+    def url(self, filename):
+        """Hashed URL of a file under app/static, or its plain /static URL without a build."""
+        entry = self.manifest['files'].get(filename) if self.manifest else None
+        if entry is None:
+            return url_for('static', filename=filename)
+        return asset_url(entry['hash'], filename)
+
+    def tree_url(self, directory):
+        """URL a whole TREES directory can be loaded from by relative paths."""
+        digest = self.manifest['trees'].get(directory) if self.manifest else None
+        if digest is None:
+            return url_for('static', filename=directory)
+        return asset_url(digest, directory)
+
+    def _fresh(self, digest, relative_path, entry):
+        if digest == entry['hash']:
+            return True
+        return any(
+            relative_path.startswith(tree + '/') and digest == tree_hash
+            for tree, tree_hash in self.manifest['trees'].items()
+        )
+
+    @staticmethod
+    def _encoding(environ, entry):
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        for encoding in ('br', 'gzip'):
+            if encoding in entry['encodings'] and accepted[encoding]:
+                return encoding
+        return None
+
+    def respond(self, environ, path):
+        digest, _, relative_path = path[len(URL_PREFIX) + 1:].partition('/')
+        entry = self.manifest['files'].get(relative_path)
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return Response(status=405, headers={'Allow': 'GET, HEAD'})
+        if entry is None:
+            return Response('Not Found', status=404, mimetype='text/plain')
+
+        encoding = self._encoding(environ, entry)
+        response = Response(mimetype=mimetypes.guess_type(relative_path)[0] or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        # Every variant of a file is listed, so caches keep them apart
+        if entry['encodings']:
+            response.headers['Vary'] = 'Accept-Encoding'
+        if self._fresh(digest, relative_path, entry):
+            response.headers['Cache-Control'] = IMMUTABLE
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        etag = f"{entry['hash']}-{encoding or 'identity'}"
+        response.set_etag(etag)
+
+        if Request(environ).if_none_match.contains(etag):
+            response.status_code = 304
+            return response
+        response.content_length = entry['encodings'][encoding] if encoding else entry['size']
+        if environ['REQUEST_METHOD'] == 'GET':
+            # Opened last: HEAD and 304 responses never iterate (and close) the body
+            f = open(os.path.join(self.directory, relative_path) + SUFFIXES.get(encoding, ''), 'rb')
+            response.response = wrap_file(environ, f)
+            response.direct_passthrough = True
+        return response
+
+    def middleware(self, wsgi_app):
+        def app(environ, start_response):
+            path = environ.get('PATH_INFO', '')
+            if not path.startswith(URL_PREFIX + '/'):
+                return wsgi_app(environ, start_response)
+            try:
+                response = self.respond(environ, path)
+            except OSError as e:
+                self.logger.error(f"Error serving asset {path}: {e}")
+                response = Response('Not Found', status=404, mimetype='text/plain')
+            return response(environ, start_response)
+        return app
+
+
+static_assets = StaticAssets()
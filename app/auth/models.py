@@ -1,12 +1,97 @@
 import os
 import json
+import time
 import secrets
+import tempfile
+import threading
 from werkzeug.security import generate_password_hash
 from config import DATA_DIR, CREDENTIALS_FILE
 
-def user_exists():
+CHECK_INTERVAL = 1.0  # seconds a process trusts its cached credentials before re-checking the file
+
+
+class CredentialStore:
+    """
+    Process-local cache of credentials.json.
+
+    The parsed file is kept in memory together with the (mtime, inode, size)
+    it was read from. Lookups within CHECK_INTERVAL of the last check are a
+    plain attribute read; after that one stat() decides whether the file
+    changed. Writes go to a temporary file that is renamed over the old one,
+    so other workers never read a half-written file and always see a new
+    inode. Password checks pass fresh=True to skip the interval.
+    """
+
+    def __init__(self, path=CREDENTIALS_FILE, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._user = None
+        self._version = None
+        self._checked_at = float('-inf')
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def get(self, fresh=False):
+        """Return the user data (not to be modified), or None if there is no user."""
+        now = time.monotonic()
+        if not fresh and now - self._checked_at < self.check_interval:
+            return self._user
+        with self._lock:
+            version = self._file_version()
+            if version != self._version:
+                # A write racing this read is caught by the next check: its
+                # rename gives the file a version we haven't recorded
+                self._user = self._read() if version else None
+                self._version = version
+            self._checked_at = now
+            return self._user
+
+    def write(self, user):
+        """Atomically replace the credentials file and the cached copy."""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.credentials-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(user, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._user = user
+            self._version = self._file_version()
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Force the next lookup to check the file."""
+        self._checked_at = float('-inf')
+
+
+credential_store = CredentialStore()
+
+
+def user_exists(fresh=False):
     """Check if the user credentials file exists."""
-    return os.path.exists(CREDENTIALS_FILE)
+    return credential_store.get(fresh) is not None
 
 def create_user(username, password):
     """Create a new user with hashed password and secret key."""
@@ -17,22 +102,17 @@ def create_user(username, password):
         'password': generate_password_hash(password),
         'secret_key': secrets.token_hex(16),
     }
-    with open(CREDENTIALS_FILE, 'w') as f:
-        json.dump(user_data, f)
+    credential_store.write(user_data)
 
-def get_user():
+def get_user(fresh=False):
     """Retrieve user data from the credentials file."""
-    if not user_exists():
-        return None
-    with open(CREDENTIALS_FILE, 'r') as f:
-        return json.load(f)
+    return credential_store.get(fresh)
 
 def update_password(new_password):
     """Update the user's password."""
-    if not user_exists():
+    user = get_user(fresh=True)
+    if user is None:
         return False
-    user = get_user()
-    user['password'] = generate_password_hash(new_password)
-    with open(CREDENTIALS_FILE, 'w') as f:
-        json.dump(user, f)
-    return True
\ No newline at end of file
+    user = dict(user, password=generate_password_hash(new_password))
+    credential_store.write(user)
+    return True
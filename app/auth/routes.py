@@ -27,7 +27,10 @@ from flask import current_app
 
 @auth_bp.before_app_request
 def require_login():
-    allowed_routes = {'auth.login', 'auth.setup', 'static'}
+    if request.endpoint == 'static':
+        return
+    # metrics.metrics checks its own bearer token or session
+    allowed_routes = {'auth.login', 'auth.setup', 'metrics.metrics'}
     if user_exists():
         if request.endpoint == 'auth.setup':
             return redirect(url_for('auth.login'))
@@ -44,7 +47,7 @@ def add_header(response):
 
 @auth_bp.route('/setup', methods=['GET', 'POST'])
 def setup():
-    if user_exists():
+    if user_exists(fresh=True):
         current_app.logger.info("Setup attempted after user exists. Redirecting to login.")
         return redirect(url_for('auth.login'))
     
@@ -67,7 +70,7 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
-        user = get_user()
+        user = get_user(fresh=True)
         if (user and 
             form.username.data == user['username'] and 
             check_password(form.password.data, user['password'])):
@@ -88,7 +91,7 @@ def login():
 def change_password():
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        user = get_user()
+        user = get_user(fresh=True)
         if user and check_password(form.current_password.data, user['password']):
             success = update_password(form.new_password.data)
             if success:
@@ -0,0 +1,302 @@
+import os
+import re
+import json
+import time
+import secrets
+import threading
+import concurrent.futures
+
+from config import JOBS_DIR, ARCHIVES_DIR
+from app.metrics.collectors import JOBS
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+SAVE_INTERVAL = 0.5  # seconds between progress writes
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def archive_file(job_id):
+    """Where an archive job stores the archive it builds."""
+    return os.path.join(ARCHIVES_DIR, f"{job_id}.zip")
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def process_start_time(pid):
+    """Start time of process pid in clock ticks since boot, or None without /proc."""
+    try:
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime is field 22; counting starts after the command name, which may contain spaces
+    return int(stat[stat.rindex(b')') + 2:].split()[19])
+
+
+def process_alive(pid, start_time):
+    """
+    True if process pid is running and is the one that started at start_time.
+
+    PIDs repeat across container restarts, where the workers get the same
+    low numbers every boot, so the PID alone would keep a dead job running.
+    """
+    if not pid_alive(pid):
+        return False
+    return start_time is None or process_start_time(pid) == start_time
+
+
+def native_executor(max_workers):
+    """
+    Thread pool whose workers are real OS threads.
+
+    Under gunicorn's gevent worker the threading module is monkey-patched, so a
+    plain ThreadPoolExecutor would run jobs as greenlets and a long rmtree or
+    copy would stall every request in the worker. gevent's own pool runs them
+    on native threads instead.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from gevent.threadpool import ThreadPoolExecutor
+            return ThreadPoolExecutor(max_workers=max_workers)
+    except ImportError:
+        pass
+    return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+
+def native_thread(target, name):
+    """
+    Run target, a loop meant to last as long as the process, on a native daemon thread.
+
+    Under gevent a threading.Thread is a greenlet, and a background loop
+    reading files and writing SQLite would stall the worker's requests
+    between its rare yields.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from gevent.threadpool import ThreadPool
+            pool = ThreadPool(1)
+            pool.spawn(target)
+            return pool
+    except ImportError:
+        pass
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+class Job:
+    """
+    One background operation and its persistent record.
+
+    The record is a JSON file in DATA_DIR/jobs that any gunicorn worker can
+    read. Only the worker running the job writes it; cancellation is requested
+    by creating a '<id>.cancel' marker next to it.
+    """
+
+    def __init__(self, record):
+        self.record = record
+        self._saved_at = 0
+
+    @property
+    def id(self):
+        return self.record['id']
+
+    @property
+    def path(self):
+        return os.path.join(JOBS_DIR, f"{self.id}.json")
+
+    @property
+    def cancel_marker(self):
+        return os.path.join(JOBS_DIR, f"{self.id}.cancel")
+
+    @classmethod
+    def create(cls, type, description, owner):
+        return cls({
+            'id': secrets.token_hex(16),
+            'type': type,
+            'description': description,
+            'owner': owner,
+            'status': 'queued',
+            'pid': os.getpid(),
+            'pid_start': process_start_time(os.getpid()),
+            'created': int(time.time()),
+            'started': None,
+            'finished': None,
+            'items_total': None,
+            'items_done': 0,
+            'bytes_total': None,
+            'bytes_done': 0,
+            'errors': [],
+            'result': None,
+            'error': None,
+        })
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.record, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.monotonic()
+
+    def set_totals(self, items=None, bytes=None):
+        self.record['items_total'] = items
+        self.record['bytes_total'] = bytes
+        self.save()
+
+    def advance(self, items=0, bytes=0):
+        """
+        Record progress and raise JobCancelled if a cancel was requested.
+
+        Operations call this between units of work; the record and the cancel
+        marker are only touched every SAVE_INTERVAL seconds.
+        """
+        self.record['items_done'] += items
+        self.record['bytes_done'] += bytes
+        if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+            self.save()
+            self.check_cancelled()
+
+    def check_cancelled(self):
+        if os.path.exists(self.cancel_marker):
+            raise JobCancelled()
+
+    def add_error(self, path, error):
+        self.record['errors'].append({'path': path, 'error': error})
+
+    def start(self):
+        self.record['status'] = 'running'
+        self.record['started'] = int(time.time())
+        self.save()
+
+    def finish(self, status, result=None, error=None):
+        self.record['status'] = status
+        self.record['finished'] = int(time.time())
+        self.record['result'] = result
+        self.record['error'] = error
+        self.save()
+        try:
+            os.unlink(self.cancel_marker)
+        except FileNotFoundError:
+            pass
+
+
+class JobManager:
+    """
+    Runs Jobs on a bounded pool of native threads inside an app context.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.max_workers = 2
+        self._executor = None
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config['JOB_WORKERS']
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        os.makedirs(ARCHIVES_DIR, exist_ok=True)
+        self._mark_interrupted()
+
+    @property
+    def executor(self):
+        # Created on first use so a preloading gunicorn master never forks threads
+        if self._executor is None:
+            self._executor = native_executor(self.max_workers)
+        return self._executor
+
+    def submit(self, type, description, owner, func, *args):
+        """
+        Queue func(job, *args) and return the new Job.
+
+        func may return a JSON-serialisable result, which is stored on the
+        record when the job completes.
+        """
+        self.prune(self.app.config['JOB_RECORD_TTL'])
+        job = Job.create(type, description, owner)
+        job.save()
+        self.executor.submit(self._run, job, func, args)
+        self.app.logger.info(f"Queued {type} job {job.id}: {description}")
+        return job
+
+    def _run(self, job, func, args):
+        with self.app.app_context():
+            try:
+                job.check_cancelled()
+                job.start()
+                result = func(job, *args)
+                job.finish('completed', result)
+                self.app.logger.info(f"Job {job.id} completed: {job.record['description']}")
+            except JobCancelled:
+                job.finish('cancelled')
+                self.app.logger.info(f"Job {job.id} cancelled: {job.record['description']}")
+            except Exception as e:
+                self.app.logger.exception(f"Job {job.id} failed: {e}")
+                job.finish('failed', error=str(e))
+            finally:
+                JOBS.inc(type=job.record['type'], status=job.record['status'])
+
+    def get(self, id):
+        if not JOB_ID_PATTERN.match(id):
+            return None
+        try:
+            with open(os.path.join(JOBS_DIR, f"{id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def list(self):
+        jobs = []
+        for name in os.listdir(JOBS_DIR):
+            if name.endswith('.json'):
+                record = self.get(name[:-5])
+                if record:
+                    jobs.append(record)
+        jobs.sort(key=lambda record: record['created'], reverse=True)
+        return jobs
+
+    def cancel(self, id):
+        record = self.get(id)
+        if record is None:
+            return None
+        if record['status'] not in FINISHED_STATES:
+            with open(os.path.join(JOBS_DIR, f"{id}.cancel"), 'w'):
+                pass
+        return record
+
+    def prune(self, max_age):
+        """Delete finished job records older than max_age seconds."""
+        cutoff = time.time() - max_age
+        for record in self.list():
+            if record['status'] in FINISHED_STATES and (record['finished'] or 0) < cutoff:
+                for suffix in ('.json', '.cancel'):
+                    try:
+                        os.unlink(os.path.join(JOBS_DIR, record['id'] + suffix))
+                    except FileNotFoundError:
+                        pass
+                try:
+                    os.unlink(archive_file(record['id']))
+                except FileNotFoundError:
+                    pass
+
+    def _mark_interrupted(self):
+        # Jobs whose worker died (restart, OOM, timeout) will never finish
+        for record in self.list():
+            if record['status'] not in FINISHED_STATES and not process_alive(record['pid'], record.get('pid_start')):
+                job = Job(record)
+                job.finish('failed', error='Interrupted by a server restart.')
+
+
+job_manager = JobManager()
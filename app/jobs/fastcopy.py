@@ -0,0 +1,163 @@
+import os
+import errno
+import fcntl
+import shutil
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+KERNEL_CHUNK_SIZE = 64 * 1024 * 1024  # 64 MB per copy_file_range/sendfile call
+BUFFER_SIZE = 1024 * 1024  # 1 MB
+
+# errno values meaning "this method doesn't work for these two files"
+UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+               errno.ENOTTY, errno.EBADF, errno.EPERM, errno.ETXTBSY}
+
+
+def reflink(fsrc, fdst):
+    """
+    Share fsrc's extents with fdst (btrfs, XFS, bcachefs, ...).
+
+    Returns False when the filesystem can't clone, which includes every
+    cross-filesystem copy.
+    """
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError as e:
+        if e.errno in UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _kernel_copy(copy, fsrc, fdst, size, progress):
+    """
+    Drive copy_file_range or sendfile until size bytes are copied.
+
+    Returns False if the very first call is refused, or copies nothing as
+    copy_file_range does on some FUSE and network filesystems, in which
+    case nothing has been written and the caller can try the next method.
+    Raises OSError if the source ends before size.
+    """
+    src, dst = fsrc.fileno(), fdst.fileno()
+    offset = 0
+    while offset < size:
+        try:
+            copied = copy(src, dst, offset, min(KERNEL_CHUNK_SIZE, size - offset))
+        except OSError as e:
+            if offset == 0 and e.errno in UNSUPPORTED:
+                return False
+            raise
+        if copied == 0:
+            if offset == 0:
+                return False
+            raise OSError(f"Copy ended after {offset} of {size} bytes.")
+        offset += copied
+        if progress:
+            progress(copied)
+    return True
+
+
+def _copy_file_range(src, dst, offset, count):
+    return os.copy_file_range(src, dst, count, offset, offset)
+
+
+def _sendfile(src, dst, offset, count):
+    os.lseek(dst, offset, os.SEEK_SET)
+    return os.sendfile(dst, src, offset, count)
+
+
+def _buffered_copy(fsrc, fdst, progress):
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    while True:
+        read = fsrc.readinto(buffer)
+        if not read:
+            break
+        fdst.write(view[:read])
+        if progress:
+            progress(read)
+
+
+def copy_data(fsrc, fdst, progress=None):
+    """
+    Copy the contents of fsrc into the empty file fdst; return the method used.
+
+    Methods are tried from cheapest to most expensive: a reflink clone, then
+    copy_file_range and sendfile, which keep the data inside the kernel, and
+    only then a read/write loop through a reused buffer. progress, if given,
+    is called with the number of bytes copied after each step and may raise
+    to abort the copy.
+    """
+    size = os.fstat(fsrc.fileno()).st_size
+    if size and reflink(fsrc, fdst):
+        if progress:
+            progress(size)
+        return 'reflink'
+    if hasattr(os, 'copy_file_range') and _kernel_copy(_copy_file_range, fsrc, fdst, size, progress):
+        return 'copy_file_range'
+    if hasattr(os, 'sendfile') and _kernel_copy(_sendfile, fsrc, fdst, size, progress):
+        return 'sendfile'
+    _buffered_copy(fsrc, fdst, progress)
+    return 'buffered'
+
+
+def copy_file(src, dst, progress=None):
+    """
+    Copy src to the new file dst along with its permissions and timestamps.
+
+    dst is opened exclusively, so an existing file is never overwritten.
+    Returns the method copy_data() used.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        method = copy_data(fsrc, fdst, progress)
+    shutil.copystat(src, dst)
+    return method
+
+
+def clone_file(src, dst):
+    """
+    Reflink src to the new file dst along with its permissions and timestamps.
+
+    Returns False, leaving no dst behind, if the filesystem can't clone.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        cloned = reflink(fsrc, fdst)
+    if not cloned:
+        os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def copy_range(fsrc, fdst, src_offset, dst_offset, count):
+    """
+    Copy count bytes of fsrc at src_offset to fdst at dst_offset; return the bytes copied.
+
+    copy_file_range keeps the data in the kernel, and on filesystems that
+    can it shares whole blocks instead of copying them; where it is refused
+    or copies nothing the bytes go through pread/pwrite. Neither file's
+    position is used or moved. Fewer than count bytes are copied only if
+    fsrc ends first.
+    """
+    src, dst = fsrc.fileno(), fdst.fileno()
+    kernel = hasattr(os, 'copy_file_range')
+    copied = 0
+    while copied < count:
+        step = min(count - copied, KERNEL_CHUNK_SIZE)
+        done = None
+        if kernel:
+            try:
+                done = os.copy_file_range(src, dst, step, src_offset + copied, dst_offset + copied)
+            except OSError as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+            # Some FUSE and network filesystems copy nothing without an error
+            if not done:
+                kernel = False
+                done = None
+        if done is None:
+            data = os.pread(src, min(step, BUFFER_SIZE), src_offset + copied)
+            done = os.pwrite(dst, data, dst_offset + copied) if data else 0
+        if done == 0:
+            break
+        copied += done
+    return copied
@@ -0,0 +1,247 @@
+import os
+import shutil
+import collections
+
+from flask import current_app
+
+from config import VOLUME
+from app.main.archive import stream_archive, walk_entries
+from app.api.file_hashes import ALGORITHM, hash_cache, walk_files, regroup, is_small
+from .engine import archive_file
+from . import fastcopy
+from app.metrics.collectors import FILESYSTEM_DURATION
+
+def tree_totals(paths, with_sizes=False):
+    """
+    Count the items (and optionally bytes) under paths without following symlinks.
+    """
+    with FILESYSTEM_DURATION.time(operation='job_totals'):
+        return _tree_totals(paths, with_sizes)
+
+
+def _tree_totals(paths, with_sizes):
+    items = 0
+    size = 0
+    stack = list(paths)
+    while stack:
+        path = stack.pop()
+        items += 1
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            items += 1
+                            if with_sizes:
+                                size += entry.stat(follow_symlinks=False).st_size
+            elif with_sizes:
+                size += os.lstat(path).st_size
+        except OSError:
+            continue
+    return items, size
+
+
+def remove_tree(job, path):
+    """shutil.rmtree with progress reporting and cancellation between entries."""
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            os.unlink(os.path.join(root, name))
+            job.advance(items=1)
+        for name in dirs:
+            dir_path = os.path.join(root, name)
+            if os.path.islink(dir_path):
+                os.unlink(dir_path)
+            else:
+                os.rmdir(dir_path)
+            job.advance(items=1)
+    os.rmdir(path)
+    job.advance(items=1)
+
+
+def delete_paths(job, items):
+    """
+    Job body for deleting (relative path, absolute path) items.
+    """
+    total_items, _ = tree_totals([path for _, path in items])
+    job.set_totals(items=total_items)
+
+    deleted = []
+    for relative_path, path in items:
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                remove_tree(job, path)
+                current_app.logger.info(f"Deleted directory and its contents: {path}")
+            else:
+                os.remove(path)
+                job.advance(items=1)
+                current_app.logger.info(f"Deleted file: {path}")
+            deleted.append(relative_path)
+        except OSError as e:
+            current_app.logger.exception(f"Error deleting item {relative_path}: {e}")
+            job.add_error(relative_path, 'Failed to delete item.')
+    return {'deleted': deleted}
+
+
+def copy_file(job, src, dst):
+    """
+    Copy one file's data and metadata, reporting bytes as they are written.
+    """
+    copy_method = fastcopy.copy_file(src, dst, progress=lambda copied: job.advance(bytes=copied))
+    current_app.logger.debug(f"Copied {src} to {dst} using {copy_method}")
+    job.advance(items=1)
+    return dst
+
+
+def copy_tree(job, src, dst):
+    """
+    Copy src to dst, removing the partial copy if it fails or is cancelled.
+    """
+    try:
+        if os.path.isdir(src) and not os.path.islink(src):
+            shutil.copytree(src, dst, symlinks=True, copy_function=lambda s, d: copy_file(job, s, d))
+            job.advance(items=1)
+        elif os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+            job.advance(items=1)
+        else:
+            copy_file(job, src, dst)
+    except BaseException:
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst, ignore_errors=True)
+        elif os.path.lexists(dst):
+            os.unlink(dst)
+        raise
+
+
+def move_paths(job, items):
+    """
+    Job body for moving (relative path, source, destination) items across filesystems.
+
+    Each item is copied in full before its source is removed, so a failed or
+    cancelled move leaves the source untouched.
+    """
+    total_items, total_bytes = tree_totals([source for _, source, _ in items], with_sizes=True)
+    job.set_totals(items=total_items * 2, bytes=total_bytes)
+
+    moved = []
+    for relative_path, source, destination in items:
+        if os.path.lexists(destination):
+            job.add_error(relative_path, 'Destination already exists.')
+            continue
+        try:
+            copy_tree(job, source, destination)
+            if os.path.isdir(source) and not os.path.islink(source):
+                remove_tree(job, source)
+            else:
+                os.remove(source)
+                job.advance(items=1)
+            current_app.logger.info(f"Moved {source} to {destination}")
+            moved.append(relative_path)
+        except OSError as e:
+            current_app.logger.exception(f"Error moving {relative_path} to {destination}: {e}")
+            job.add_error(relative_path, 'Failed to move item.')
+    return {'moved': moved}
+
+
+def copy_paths(job, items):
+    """
+    Job body for copying (relative path, source, destination) items.
+    """
+    total_items, total_bytes = tree_totals([source for _, source, _ in items], with_sizes=True)
+    job.set_totals(items=total_items, bytes=total_bytes)
+
+    copied = []
+    for relative_path, source, destination in items:
+        if os.path.lexists(destination):
+            job.add_error(relative_path, 'Destination already exists.')
+            continue
+        try:
+            copy_tree(job, source, destination)
+            current_app.logger.info(f"Copied {source} to {destination}")
+            copied.append(relative_path)
+        except OSError as e:
+            current_app.logger.exception(f"Error copying {relative_path} to {destination}: {e}")
+            job.add_error(relative_path, 'Failed to copy item.')
+    return {'copied': copied}
+
+
+def archive_paths(job, paths, filename, archive_format, level, workers):
+    """
+    Job body that writes an archive of paths to the job's archive file.
+    """
+    total_items, total_bytes = tree_totals(paths, with_sizes=True)
+    job.set_totals(items=total_items, bytes=total_bytes)
+
+    def entries():
+        for path, arcname in walk_entries(paths, include_dirs=True):
+            yield path, arcname
+            try:
+                job.advance(items=1, bytes=0 if arcname.endswith('/') else os.path.getsize(path))
+            except OSError:
+                job.advance(items=1)
+
+    path = archive_file(job.id)
+    try:
+        with open(path, 'wb') as f:
+            for chunk in stream_archive(entries(), archive_format, level, workers):
+                f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return {'filename': filename, 'format': archive_format, 'size': os.path.getsize(path),
+            'download_url': f"/api/jobs/{job.id}/download"}
+
+
+def find_duplicates(job, root, min_size, workers, limit):
+    """
+    Job body reporting the sets of identical files under root.
+
+    Files are narrowed in stages so most are never read in full: only
+    files sharing a size get a partial hash (of their first and last
+    64 KB), and only files sharing size and partial hash get a
+    full hash. Digests come from and go to the hash cache, so a repeated
+    report only reads files that changed. Groups are reported largest waste
+    first, at most `limit` of them.
+    """
+    by_size = collections.defaultdict(list)
+    scanned = 0
+    for relative_path, stat in walk_files(VOLUME, root, min_size):
+        by_size[stat.st_size].append((relative_path, stat))
+        scanned += 1
+        job.advance(items=1)
+    job.set_totals(items=scanned)
+
+    def progress(read):
+        job.advance(bytes=read)
+
+    candidates = [file for files in by_size.values() if len(files) > 1 for file in files]
+    partial = hash_cache.digests(candidates, 'partial', workers, progress)
+    groups = regroup(candidates, partial)
+
+    needs_full = [file for files in groups if not is_small(files[0][1].st_size) for file in files]
+    full = hash_cache.digests(needs_full, 'full', workers, progress)
+    duplicates = [files for files in groups if is_small(files[0][1].st_size)] + regroup(needs_full, full)
+    digests = {**partial, **full}
+
+    report = []
+    for files in duplicates:
+        size = files[0][1].st_size
+        report.append({
+            'size': size,
+            'digest': f"{ALGORITHM}:{digests[files[0][0]]}",
+            'paths': sorted(relative_path for relative_path, _ in files),
+            'wasted': size * (len(files) - 1),
+        })
+    report.sort(key=lambda group: group['wasted'], reverse=True)
+    return {
+        'root': root,
+        'files_scanned': scanned,
+        'partial_hash_candidates': len(candidates),
+        'full_hash_candidates': len(needs_full),
+        'duplicate_files': sum(len(group['paths']) - 1 for group in report),
+        'wasted_bytes': sum(group['wasted'] for group in report),
+        'groups': report[:limit],
+        'truncated': len(report) > limit,
+    }
@@ -0,0 +1,115 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required, current_user
+import os
+
+from config import VOLUME
+from app.api.routes import secure_path
+from app.main.offload import send_download
+from app.main.archive import ARCHIVE_FORMATS, archive_format, compression_level
+from .engine import job_manager, archive_file, FINISHED_STATES
+from .operations import archive_paths, find_duplicates
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('', methods=['GET'])
+@login_required
+def list_jobs():
+    jobs = job_manager.list()
+    if request.args.get('active'):
+        jobs = [job for job in jobs if job['status'] not in FINISHED_STATES]
+    return jsonify({'jobs': jobs}), 200
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify(job), 200
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    if job['status'] in FINISHED_STATES:
+        return jsonify({'error': f"Job has already {job['status']}."}), 409
+    current_app.logger.info(f"User '{current_user.id}' requested cancellation of job {job_id}")
+    return jsonify({'message': 'Cancellation requested.'}), 202
+
+@jobs_bp.route('/archive', methods=['POST'])
+@login_required
+def create_archive_job():
+    try:
+        if not request.is_json:
+            current_app.logger.error("Request content type is not JSON.")
+            return jsonify({'error': 'Invalid content type. JSON expected.'}), 400
+
+        data = request.get_json()
+        selected_paths = data.get('selected_paths', [])
+        if not selected_paths:
+            current_app.logger.error("No files or directories selected for archiving.")
+            return jsonify({'error': 'No files or directories selected.'}), 400
+        try:
+            fmt = archive_format(data)
+            level = compression_level(data, fmt)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        absolute_paths = [secure_path(path) for path in selected_paths]
+        extension = ARCHIVE_FORMATS[fmt][0]
+        if len(absolute_paths) == 1:
+            filename = f"{current_user.id}-{os.path.basename(absolute_paths[0]) or 'all'}{extension}"
+        else:
+            filename = f"{current_user.id}-selected{extension}"
+
+        job = job_manager.submit('archive', f"Archive {len(absolute_paths)} item(s)", current_user.id,
+                                 archive_paths, absolute_paths, filename, fmt, level,
+                                 current_app.config['ARCHIVE_WORKERS'])
+        return jsonify({'message': 'Archive creation started.', 'job': job.record}), 202
+
+    except Exception as e:
+        current_app.logger.exception(f"Error starting archive job: {e}")
+        return jsonify({'error': 'An error occurred while starting the archive.', 'message': str(e)}), 500
+
+@jobs_bp.route('/duplicates', methods=['POST'])
+@login_required
+def create_duplicates_job():
+    """Start a report of the identical files under path (default: the whole volume)."""
+    data = request.get_json(silent=True) or {}
+    path = data.get('path', '').strip('/')
+    try:
+        min_size = int(data.get('min_size', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'min_size must be an integer.'}), 400
+
+    absolute_path = secure_path(path)
+    if not os.path.isdir(absolute_path):
+        return jsonify({'error': 'The specified path is not a directory.'}), 400
+    path = os.path.relpath(absolute_path, VOLUME)
+    if path == '.':
+        path = ''
+
+    try:
+        job = job_manager.submit('duplicates', f"Find duplicates in /{path}", current_user.id,
+                                 find_duplicates, path, max(min_size, 1),
+                                 current_app.config['HASH_WORKERS'], current_app.config['DUPLICATES_REPORT_LIMIT'])
+        return jsonify({'message': 'Duplicate search started.', 'job': job.record}), 202
+
+    except Exception as e:
+        current_app.logger.exception(f"Error starting duplicates job: {e}")
+        return jsonify({'error': 'An error occurred while starting the duplicate search.', 'message': str(e)}), 500
+
+@jobs_bp.route('/<job_id>/download', methods=['GET'])
+@login_required
+def download_archive(job_id):
+    job = job_manager.get(job_id)
+    if job is None or job['type'] != 'archive':
+        return jsonify({'error': 'Job not found.'}), 404
+    if job['status'] != 'completed':
+        return jsonify({'error': 'The archive is not ready.'}), 409
+
+    current_app.logger.info(f"Serving archive of job {job_id}: {job['result']['filename']}")
+    mimetype = ARCHIVE_FORMATS[job['result'].get('format', 'zip')][1]
+    return send_download(archive_file(job_id), mimetype, job['result']['filename'])
@@ -0,0 +1,351 @@
+import os
+import math
+import time
+import zlib
+import collections
+
+from flask import current_app
+
+from config import VOLUME
+from app.jobs.engine import native_executor
+from app.metrics.collectors import ARCHIVE_INPUT_BYTES, ARCHIVE_OUTPUT_BYTES, ARCHIVE_DURATION, ARCHIVE_SIZE
+from .zipstream import ZipMember, STORED, DEFLATED, end_records
+from . import tarstream
+
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+DEFLATE_WINDOW = 32 * 1024  # history carried from one block into the next
+
+# Formats that are already compressed and only waste CPU when deflated again
+COMPRESSED_EXTENSIONS = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif', '.avif', '.jxl',
+    '.mp4', '.m4v', '.mov', '.mkv', '.webm', '.avi', '.wmv', '.flv',
+    '.mp3', '.m4a', '.aac', '.ogg', '.oga', '.opus', '.flac', '.wma',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.txz', '.zst', '.lz4', '.lzma', '.7z', '.rar',
+    '.jar', '.apk', '.whl', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub',
+    '.woff', '.woff2',
+})
+ENTROPY_SAMPLES = 3  # windows spread over the file
+ENTROPY_SAMPLE_SIZE = 16 * 1024
+ENTROPY_THRESHOLD = 7.5  # bits per byte above which deflate gains next to nothing
+
+# format: (file extension, mimetype)
+ARCHIVE_FORMATS = {
+    'zip': ('.zip', 'application/zip'),
+    'tar': ('.tar', 'application/x-tar'),
+    'tar.gz': ('.tar.gz', 'application/gzip'),
+    'tar.zst': ('.tar.zst', 'application/zstd'),
+}
+
+
+def archive_format(params):
+    """
+    Return the format requested in params, 'zip' by default.
+
+    Raises ValueError for unknown formats and for tar.zst when zstandard
+    isn't installed.
+    """
+    name = params.get('format') or 'zip'
+    if name not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format '{name}'; use one of {', '.join(ARCHIVE_FORMATS)}.")
+    if name == 'tar.zst' and tarstream.zstandard is None:
+        raise ValueError("tar.zst archives are not available on this server.")
+    return name
+
+
+def compression_level(params, archive_format='zip'):
+    """
+    Return the compression_level requested in params, or the configured default.
+
+    Raises ValueError unless it is an integer from 0 (store only) to 9, or
+    from 1 to 19 for tar.zst, given as a number or a string of digits.
+    Plain tar ignores it.
+    """
+    if archive_format == 'tar.zst':
+        default, lowest, highest = current_app.config['ARCHIVE_ZSTD_LEVEL'], 1, 19
+    else:
+        default, lowest, highest = current_app.config['ARCHIVE_COMPRESSION_LEVEL'], 0, 9
+    level = params.get('compression_level', default)
+    if isinstance(level, str) and level.strip().isascii() and level.strip().isdigit():
+        level = int(level)
+    # bool is an int subclass, but true isn't a level
+    if not isinstance(level, int) or isinstance(level, bool) or not lowest <= level <= highest:
+        suffix = ' for tar.zst' if archive_format == 'tar.zst' else ''
+        raise ValueError(f"Compression level must be an integer between {lowest} and {highest}{suffix}, got {level!r}.")
+    return level
+
+
+def archive_name(path):
+    """
+    Return the name of an absolute path inside an archive, relative to VOLUME.
+    """
+    return os.path.relpath(path, VOLUME).replace("\\", "/")
+
+
+def walk_entries(paths, include_dirs=False):
+    """
+    Lazily yield (absolute path, archive name) pairs for the given paths.
+
+    Directories are walked as the archive is written, so nothing is collected
+    up front. Directory entries end with '/' and are only yielded when
+    include_dirs is set.
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            yield path, archive_name(path)
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                if include_dirs:
+                    for dir in dirs:
+                        dir_path = os.path.join(root, dir)
+                        yield dir_path, archive_name(dir_path) + '/'
+
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    yield file_path, archive_name(file_path)
+
+
+def entropy(data):
+    """Shannon entropy of data in bits per byte."""
+    counts = collections.Counter(data)
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in counts.values())
+
+
+def looks_compressed(path, size):
+    """
+    Guess whether deflating path is a waste of time.
+
+    Known compressed formats are decided by extension; anything else large
+    enough to matter is sampled at a few offsets, since a high byte entropy
+    means the data is compressed or encrypted already.
+    """
+    if os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return True
+    if size < ENTROPY_SAMPLES * ENTROPY_SAMPLE_SIZE:
+        return False
+    step = (size - ENTROPY_SAMPLE_SIZE) // (ENTROPY_SAMPLES - 1)
+    with open(path, 'rb') as f:
+        sample = b''.join(
+            os.pread(f.fileno(), ENTROPY_SAMPLE_SIZE, i * step) for i in range(ENTROPY_SAMPLES)
+        )
+    return bool(sample) and entropy(sample) > ENTROPY_THRESHOLD
+
+
+def deflate_block(data, level, history, final):
+    """
+    Raw-deflate one block of a member.
+
+    Blocks end on a sync flush, which leaves the stream byte-aligned and
+    open, so independently compressed blocks concatenate into one valid
+    deflate stream. Priming each block with the previous block's last 32 KB
+    keeps the ratio close to compressing the file in one go.
+    """
+    if history:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=history)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def stream_zip(entries, level=6, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Generate a ZIP archive of the given entries chunk by chunk.
+
+    Files are read chunk_size bytes at a time. Those worth compressing are
+    deflated at level (0 stores everything) in blocks spread over workers
+    native threads (zlib releases the GIL), with a bounded number of blocks
+    in flight; output is still yielded strictly in archive order, so memory
+    use stays at a few chunks per worker regardless of the archive size.
+    Already-compressed files are stored. ZIP64 records are used for large
+    members, large offsets and archives with more than 65535 entries.
+    """
+    start = time.perf_counter()
+    read = 0
+    written = 0
+    members = []
+    # Archive bytes in order: (kind, member, bytes or Future of bytes)
+    pending = collections.deque()
+    window = max(2, workers * 2)
+    executor = native_executor(workers) if workers > 1 and level > 0 else None
+
+    def emit(limit):
+        nonlocal written
+        while len(pending) > limit:
+            kind, member, payload = pending.popleft()
+            if kind == 'header':
+                member.offset = written
+                data = member.local_header()
+            elif kind == 'descriptor':
+                data = member.data_descriptor()
+            else:
+                data = payload if isinstance(payload, bytes) else payload.result()
+                member.compress_size += len(data)
+            written += len(data)
+            if data:
+                yield data
+
+    def compress(data, history, final):
+        if executor is None:
+            return deflate_block(data, level, history, final)
+        return executor.submit(deflate_block, data, level, history, final)
+
+    try:
+        for path, arcname in entries:
+            try:
+                stat = os.stat(path)
+                is_dir = arcname.endswith('/')
+                if is_dir:
+                    src = None
+                    method = STORED
+                else:
+                    src = open(path, 'rb')
+                    compressible = level > 0 and stat.st_size > 0 and not looks_compressed(path, stat.st_size)
+                    method = DEFLATED if compressible else STORED
+            except OSError as e:
+                current_app.logger.warning(f"Skipping {arcname} in ZIP: {e}")
+                continue
+
+            member = ZipMember(arcname, stat.st_mtime, stat.st_mode, stat.st_size, method)
+            members.append(member)
+            pending.append(('header', member, None))
+            if src is None:
+                yield from emit(window)
+                continue
+
+            member.size = 0
+            with src:
+                chunk = src.read(chunk_size)
+                history = b''
+                if method == DEFLATED and not chunk:
+                    # Emptied since it was stat'ed; a deflate stream still needs its final block
+                    pending.append(('data', member, compress(b'', None, True)))
+                while chunk:
+                    following = src.read(chunk_size)
+                    member.crc = zlib.crc32(chunk, member.crc)
+                    member.size += len(chunk)
+                    read += len(chunk)
+                    if method == DEFLATED:
+                        pending.append(('data', member, compress(chunk, history, not following)))
+                        history = chunk[-DEFLATE_WINDOW:]
+                    else:
+                        pending.append(('data', member, chunk))
+                    yield from emit(window)
+                    chunk = following
+
+            pending.append(('descriptor', member, None))
+            yield from emit(window)
+            current_app.logger.debug(f"Added to ZIP: {arcname}")
+
+        yield from emit(0)
+        directory_offset = written
+        directory = b''.join(member.central_header() for member in members)
+        directory += end_records(len(members), directory_offset, len(directory))
+        written += len(directory)
+        yield directory
+        ARCHIVE_DURATION.observe(time.perf_counter() - start, format='zip')
+        ARCHIVE_SIZE.observe(written, format='zip')
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        # Counted even for aborted downloads, so rate() gives the real throughput
+        ARCHIVE_INPUT_BYTES.inc(read, format='zip')
+        ARCHIVE_OUTPUT_BYTES.inc(written, format='zip')
+
+
+def stream_tar(entries, archive_format='tar', level=6, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Generate a tar, tar.gz or tar.zst archive of the given entries chunk by chunk.
+
+    Members keep their permissions, owner ids and mtimes. Output is
+    gathered into chunks of about chunk_size bytes, so small files don't
+    turn into a stream of tiny writes. Compression runs on one native
+    thread (zstd on `workers` threads of its own) while the next chunk is
+    read, keeping the worker responsive; at most two chunks are in flight.
+    A file that shrinks while being read is padded with zeros and one that
+    grows is cut at its stat'ed size, as the header already holds the size.
+    """
+    start = time.perf_counter()
+    read = 0
+    written = 0
+    compress = tarstream.compressor(archive_format, level, workers)
+    executor = native_executor(1) if compress is not None else None
+    pending = collections.deque()
+    buffered = []
+    buffered_size = 0
+    offset = 0  # uncompressed tar offset
+
+    def submit(data, final=False):
+        if executor is None:
+            pending.append(data)
+        elif final:
+            pending.append(executor.submit(lambda: compress.compress(data) + compress.flush()))
+        else:
+            pending.append(executor.submit(compress.compress, data))
+
+    def emit(limit):
+        nonlocal written
+        while len(pending) > limit:
+            payload = pending.popleft()
+            data = payload if isinstance(payload, bytes) else payload.result()
+            written += len(data)
+            if data:
+                yield data
+
+    def add(data):
+        nonlocal buffered_size, offset
+        buffered.append(data)
+        buffered_size += len(data)
+        offset += len(data)
+        if buffered_size >= chunk_size:
+            yield from flush()
+
+    def flush(final=False):
+        nonlocal buffered, buffered_size
+        submit(b''.join(buffered), final)
+        buffered, buffered_size = [], 0
+        yield from emit(0 if final else 1)
+
+    try:
+        for path, arcname in entries:
+            try:
+                stat = os.stat(path)
+                src = None if arcname.endswith('/') else open(path, 'rb')
+            except OSError as e:
+                current_app.logger.warning(f"Skipping {arcname} in {archive_format}: {e}")
+                continue
+
+            yield from add(tarstream.tar_header(arcname, stat))
+            if src is None:
+                continue
+            remaining = stat.st_size
+            with src:
+                while remaining > 0:
+                    chunk = src.read(min(chunk_size, remaining))
+                    if not chunk:
+                        current_app.logger.warning(f"{arcname} shrank while being archived; padding it with zeros")
+                        while remaining > 0:
+                            yield from add(bytes(min(chunk_size, remaining)))
+                            remaining -= min(chunk_size, remaining)
+                        break
+                    remaining -= len(chunk)
+                    read += len(chunk)
+                    yield from add(chunk)
+            yield from add(tarstream.padding(stat.st_size))
+            current_app.logger.debug(f"Added to {archive_format}: {arcname}")
+
+        yield from add(tarstream.end_of_archive(offset))
+        yield from flush(final=True)
+        ARCHIVE_DURATION.observe(time.perf_counter() - start, format=archive_format)
+        ARCHIVE_SIZE.observe(written, format=archive_format)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        ARCHIVE_INPUT_BYTES.inc(read, format=archive_format)
+        ARCHIVE_OUTPUT_BYTES.inc(written, format=archive_format)
+
+
+def stream_archive(entries, archive_format='zip', level=6, workers=1):
+    """Generate an archive of entries in any of ARCHIVE_FORMATS."""
+    if archive_format == 'zip':
+        return stream_zip(entries, level, workers)
+    return stream_tar(entries, archive_format, level, workers)
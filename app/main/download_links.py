@@ -0,0 +1,57 @@
+import os
+import re
+import json
+import time
+import secrets
+
+from config import DOWNLOAD_LINKS_DIR
+
+LINK_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def link_file(link_id):
+    return os.path.join(DOWNLOAD_LINKS_DIR, f"{link_id}.json")
+
+
+def create_link(username, paths, filename):
+    """
+    Remember a selection under a random id and return the id.
+
+    Browsers only resume or split downloads of plain GET URLs, so the
+    selection is stored server-side instead of being posted again.
+    """
+    os.makedirs(DOWNLOAD_LINKS_DIR, exist_ok=True)
+    link_id = secrets.token_hex(16)
+    tmp_path = link_file(link_id) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'user': username, 'paths': paths, 'filename': filename, 'created': int(time.time())}, f)
+    os.replace(tmp_path, link_file(link_id))
+    return link_id
+
+
+def load_link(link_id, max_age):
+    """Return the link record, or None if it doesn't exist or expired."""
+    if not LINK_ID_PATTERN.match(link_id):
+        return None
+    try:
+        with open(link_file(link_id)) as f:
+            link = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if link['created'] < time.time() - max_age:
+        return None
+    return link
+
+
+def prune_links(max_age):
+    """Delete links older than max_age seconds."""
+    if not os.path.isdir(DOWNLOAD_LINKS_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(DOWNLOAD_LINKS_DIR):
+        path = os.path.join(DOWNLOAD_LINKS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,103 @@
+import os
+import ssl
+import select
+from urllib.parse import quote
+
+from flask import Response, current_app, request, send_file
+from werkzeug.http import parse_content_range_header
+
+SENDFILE_CHUNK_SIZE = 64 * 1024 * 1024  # bytes per os.sendfile() call between yields to the hub
+
+
+def sendfile_body(sock, path, offset, count):
+    """
+    Send count bytes of path from offset straight to the client socket.
+
+    The empty first chunk makes gunicorn write the status line and headers;
+    the body then goes out with os.sendfile, without passing through Python.
+    gevent's socket.sendfile copies through userspace and werkzeug's range
+    wrapper can't be sent with sendfile at all, hence doing it here. Waiting
+    on select() is cooperative under gevent's monkey patching.
+    """
+    with open(path, 'rb') as f:
+        yield b''
+        out_fd = sock.fileno()
+        sent = 0
+        while sent < count:
+            try:
+                n = os.sendfile(out_fd, f.fileno(), offset + sent, min(count - sent, SENDFILE_CHUNK_SIZE))
+            except BlockingIOError:
+                select.select([], [out_fd], [])
+                continue
+            if n == 0:
+                # The file was truncated while being sent; the client sees a short body
+                raise OSError(f"{path} ended {count - sent} bytes early")
+            sent += n
+
+
+def accel_location(path):
+    """Return the internal proxy URL of path, or None if it's outside every mapped root."""
+    real_path = os.path.realpath(path)
+    for root, location in current_app.config['DOWNLOAD_ACCEL_LOCATIONS'].items():
+        root = os.path.realpath(root)
+        if real_path.startswith(root + os.sep):
+            relative_path = os.path.relpath(real_path, root).replace("\\", "/")
+            return location.rstrip('/') + '/' + quote(relative_path)
+    return None
+
+
+def send_download(path, mimetype, download_name):
+    """
+    send_file() for downloads, handed off according to DOWNLOAD_OFFLOAD.
+
+    'x-accel' (nginx) and 'x-sendfile' (Apache, lighttpd, Caddy) return an
+    empty response naming the file, and the proxy serves it with sendfile
+    and its own Range and conditional handling. 'sendfile' keeps serving
+    from the worker but with os.sendfile on gunicorn's socket. Anything
+    else, or a server that doesn't expose its socket, uses send_file.
+    """
+    mode = current_app.config['DOWNLOAD_OFFLOAD']
+
+    if mode in ('x-accel', 'x-sendfile'):
+        response = Response(mimetype=mimetype)
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        if mode == 'x-sendfile':
+            response.headers['X-Sendfile'] = os.path.realpath(path)
+            return response
+        location = accel_location(path)
+        if location is not None:
+            response.headers['X-Accel-Redirect'] = location
+            return response
+        current_app.logger.warning(f"No X-Accel location maps {path}; serving it from the worker.")
+
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True
+    )
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+
+    sock = request.environ.get('gunicorn.socket')
+    # POST downloads (download_selected) get the same 200 as GET; HEAD has no body
+    if mode != 'sendfile' or sock is None or request.method == 'HEAD' or not response.content_length:
+        return response
+    # Under gunicorn --certfile the socket speaks TLS, which raw file bytes would corrupt
+    if isinstance(sock, ssl.SSLSocket):
+        return response
+    if response.status_code == 206:
+        content_range = parse_content_range_header(response.headers.get('Content-Range'))
+        offset = content_range.start
+    elif response.status_code == 200:
+        offset = 0
+    else:
+        return response
+
+    # Swap the body for a sendfile of the same bytes; send_file already
+    # worked out the status, Content-Length and Content-Range
+    response.response.close()
+    response.response = sendfile_body(sock, path, offset, response.content_length)
+    response.direct_passthrough = True
+    return response
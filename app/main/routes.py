@@ -1,16 +1,40 @@
-from flask import Blueprint, render_template, request, jsonify, send_file, Response, current_app, send_from_directory
+from flask import Blueprint, render_template, request, jsonify, Response, current_app, send_from_directory, stream_with_context
 from flask_login import login_required, current_user
 import os
-import io
-import zipfile
-import shutil
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 
 from config import VOLUME
 from app.api.routes import secure_path, secure_relative_path
+from app.api.listing import listing_cache
+from app.uploads.streaming import DirectUploadFile
+from app.jobs.engine import job_manager
+from app.jobs.operations import delete_paths
+from .archive import ARCHIVE_FORMATS, stream_archive, walk_entries, archive_format, compression_level
+from .offload import send_download
+from .zip_layout import ZipLayout, ArchiveChanged
+from .download_links import create_link, load_link, prune_links
+from app.metrics.collectors import ARCHIVE_OUTPUT_BYTES
 
 main_bp = Blueprint('main', __name__)
 
+def archive_response(entries, basename, archive_format, level):
+    """
+    Stream an archive of entries to the client while it is being built.
+    """
+    extension, mimetype = ARCHIVE_FORMATS[archive_format]
+    filename = basename + extension
+    current_app.logger.info(f"Streaming {archive_format} file: {filename} (compression level {level})")
+    workers = current_app.config['ARCHIVE_WORKERS']
+    return Response(
+        stream_with_context(stream_archive(entries, archive_format, level, workers)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Content-Type-Options': 'nosniff'
+        }
+    )
+
 @main_bp.route('/')
 @login_required
 def index():
@@ -25,34 +49,16 @@ def download_all():
             current_app.logger.error("Backup directory not found.")
             return jsonify({'error': 'Backup directory not found.'}), 500
 
+        try:
+            fmt = archive_format(request.args)
+            level = compression_level(request.args, fmt)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         username = current_user.id
         current_app.logger.info(f"User '{username}' is downloading all backups.")
 
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for root, dirs, files in os.walk(VOLUME):
-                for dir in dirs:
-                    dir_path = os.path.join(root, dir)
-                    relative_dir_path = os.path.relpath(dir_path, VOLUME).replace("\\", "/") + '/'
-                    zip_file.writestr(relative_dir_path, '')
-
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    relative_file_path = os.path.relpath(file_path, VOLUME).replace("\\", "/")
-                    zip_file.write(file_path, relative_file_path)
-                    current_app.logger.debug(f"Added to ZIP: {relative_file_path}")
-
-        zip_buffer.seek(0)
-        zip_filename = f"{username}-all.zip"
-        current_app.logger.info(f"Serving ZIP file: {zip_filename}")
-        return Response(
-            zip_buffer,
-            mimetype='application/zip',
-            headers={
-                'Content-Disposition': f'attachment; filename="{zip_filename}"',
-                'Content-Length': str(zip_buffer.getbuffer().nbytes)
-            }
-        )
+        return archive_response(walk_entries([VOLUME], include_dirs=True), f"{username}-all", fmt, level)
 
     except Exception as e:
         current_app.logger.exception(f"Error creating ZIP: {e}")
@@ -71,9 +77,16 @@ def download_selected():
             selected_paths = data.get('selected_paths', [])
             current_app.logger.debug(f"Request JSON Data: {data}")
         else:
+            data = request.form
             selected_paths = request.form.getlist('selected_paths')
             current_app.logger.debug(f"Request Form Data: {selected_paths}")
 
+        try:
+            fmt = archive_format(data)
+            level = compression_level(data, fmt)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         current_app.logger.debug(f"Received selected_paths: {selected_paths}")
 
         if not selected_paths:
@@ -90,75 +103,113 @@ def download_selected():
             selected_path = absolute_paths[0]
             if os.path.isfile(selected_path):
                 current_app.logger.info(f"Serving single file: {selected_path}")
-                response = send_file(
-                    selected_path,
-                    mimetype='application/octet-stream',
-                    as_attachment=True,
-                    download_name=os.path.basename(selected_path),
-                    conditional=True
-                )
-                response.headers['X-Content-Type-Options'] = 'nosniff'
-                return response
+                return send_download(selected_path, 'application/octet-stream', os.path.basename(selected_path))
             elif os.path.isdir(selected_path):
-                zip_buffer = io.BytesIO()
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    for root, dirs, files in os.walk(selected_path):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            relative_path = os.path.relpath(file_path, VOLUME).replace("\\", "/")
-                            zip_file.write(file_path, relative_path)
-                            current_app.logger.debug(f"Added to ZIP: {relative_path}")
-                zip_buffer.seek(0)
-                zip_filename = f"{username}-{os.path.basename(selected_path)}.zip"
-                current_app.logger.info(f"Serving ZIP file: {zip_filename}")
-                response = Response(
-                    zip_buffer,
-                    mimetype='application/zip',
-                    headers={
-                        'Content-Disposition': f'attachment; filename="{zip_filename}"',
-                        'Content-Length': str(zip_buffer.getbuffer().nbytes),
-                        'X-Content-Type-Options': 'nosniff'
-                    }
-                )
-                return response
+                basename = f"{username}-{os.path.basename(selected_path)}"
+                return archive_response(walk_entries([selected_path]), basename, fmt, level)
             else:
                 current_app.logger.error(f"Selected path is neither a file nor a directory: {selected_path}")
                 return jsonify({'error': "Selected path is neither a file nor a directory."}), 400
 
-        # Multiple items download as ZIP
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for selected_path in absolute_paths:
-                if os.path.isfile(selected_path):
-                    relative_path = os.path.relpath(selected_path, VOLUME).replace("\\", "/")
-                    zip_file.write(selected_path, relative_path)
-                    current_app.logger.debug(f"Added to ZIP: {relative_path}")
-                elif os.path.isdir(selected_path):
-                    for root, dirs, files in os.walk(selected_path):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            relative_path = os.path.relpath(file_path, VOLUME).replace("\\", "/")
-                            zip_file.write(file_path, relative_path)
-                            current_app.logger.debug(f"Added to ZIP: {relative_path}")
-
-        zip_buffer.seek(0)
-        zip_filename = f"{username}-selected.zip"
-        current_app.logger.info(f"Serving ZIP file: {zip_filename}")
-        response = Response(
-            zip_buffer,
-            mimetype='application/zip',
-            headers={
-                'Content-Disposition': f'attachment; filename="{zip_filename}"',
-                'Content-Length': str(zip_buffer.getbuffer().nbytes),
-                'X-Content-Type-Options': 'nosniff'
-            }
-        )
-        return response
+        # Multiple items download as an archive
+        return archive_response(walk_entries(absolute_paths), f"{username}-selected", fmt, level)
 
     except Exception as e:
         current_app.logger.exception(f"Error creating ZIP for selected items: {e}")
         return jsonify({'error': 'An error occurred while creating ZIP.', 'message': str(e)}), 500
 
+@main_bp.route('/download_link', methods=['POST'])
+@login_required
+def create_download_link():
+    """
+    Turn a selection into a GET URL serving a resumable, store-only ZIP.
+    """
+    try:
+        if not request.is_json:
+            current_app.logger.error("Request content type is not JSON.")
+            return jsonify({'error': 'Invalid content type. JSON expected.'}), 400
+
+        selected_paths = request.get_json().get('selected_paths', [])
+        if not selected_paths:
+            current_app.logger.error("No files or directories selected for download.")
+            return jsonify({'error': 'No files or directories selected for download.'}), 400
+
+        absolute_paths = [secure_path(path) for path in selected_paths]
+        if len(absolute_paths) == 1:
+            filename = f"{current_user.id}-{os.path.basename(absolute_paths[0]) or 'all'}.zip"
+        else:
+            filename = f"{current_user.id}-selected.zip"
+
+        prune_links(current_app.config['DOWNLOAD_LINK_TTL'])
+        link_id = create_link(current_user.id, absolute_paths, filename)
+        current_app.logger.info(f"User '{current_user.id}' created download link {link_id} for: {selected_paths}")
+        return jsonify({'url': f"/download/{link_id}/{quote(filename)}"}), 201
+
+    except Exception as e:
+        current_app.logger.exception(f"Error creating download link: {e}")
+        return jsonify({'error': 'An error occurred while creating the download link.', 'message': str(e)}), 500
+
+@main_bp.route('/download/<link_id>/<path:filename>', methods=['GET'])
+@login_required
+def download_link(link_id, filename):
+    """
+    Serve a download link as a store-only ZIP with Content-Length and Range support.
+
+    The archive layout is recomputed from stat data on every request, so a
+    resumed or split download gets the same bytes as long as nothing in the
+    selection changed; If-Range with the ETag protects against mixing
+    ranges of two different archives.
+    """
+    link = load_link(link_id, current_app.config['DOWNLOAD_LINK_TTL'])
+    if link is None or link['user'] != current_user.id:
+        return jsonify({'error': 'Download link not found or expired.'}), 404
+
+    try:
+        layout = ZipLayout(walk_entries([path for path in link['paths'] if os.path.exists(path)], include_dirs=True))
+    except OSError as e:
+        current_app.logger.exception(f"Error preparing download link {link_id}: {e}")
+        return jsonify({'error': 'An error occurred while preparing the download.', 'message': str(e)}), 500
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="{link["filename"]}"',
+        'X-Content-Type-Options': 'nosniff',
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{layout.etag}"',
+    }
+    if request.if_none_match.contains(layout.etag):
+        return Response(status=304, headers=headers)
+
+    start, stop, status = 0, layout.size, 200
+    if_range = request.if_range
+    range_allowed = if_range.etag is None and if_range.date is None or if_range.etag == layout.etag
+    if request.range is not None and len(request.range.ranges) == 1 and range_allowed:
+        byte_range = request.range.range_for_length(layout.size)
+        if byte_range is None:
+            headers['Content-Range'] = f"bytes */{layout.size}"
+            return Response(status=416, headers=headers)
+        start, stop = byte_range
+        status = 206
+        headers['Content-Range'] = f"bytes {start}-{stop - 1}/{layout.size}"
+
+    current_app.logger.info(f"Serving download link {link_id}: bytes {start}-{stop - 1} of {layout.size}")
+
+    def generate():
+        sent = 0
+        try:
+            for chunk in layout.stream(start, stop):
+                sent += len(chunk)
+                yield chunk
+        except ArchiveChanged as e:
+            # Ending the response early tells the client to retry; the ETag has changed by then
+            current_app.logger.warning(f"Aborting download link {link_id}: {e}")
+            raise
+        finally:
+            ARCHIVE_OUTPUT_BYTES.inc(sent, format='zip_store')
+
+    response = Response(stream_with_context(generate()), status=status, mimetype='application/zip', headers=headers)
+    response.content_length = stop - start
+    return response
+
 @main_bp.route('/upload', methods=['POST'])
 @login_required
 def upload_files():
@@ -177,6 +228,7 @@ def upload_files():
             current_app.logger.error("No files uploaded.")
             return jsonify({'error': 'No files uploaded.'}), 400
 
+        uploaded = []
         for file in uploaded_files:
             if file.filename == '':
                 current_app.logger.warning("Empty filename detected.")
@@ -197,10 +249,21 @@ def upload_files():
                 current_app.logger.error(f'File "{file_path}" already exists.')
                 return jsonify({'error': f'File "{filename}" already exists in the target directory.'}), 400
 
-            file.save(file_path)
-            current_app.logger.info(f"Uploaded file: {file_path}")
+            if isinstance(file.stream, DirectUploadFile):
+                try:
+                    file.stream.commit(file_path)
+                except FileExistsError:
+                    current_app.logger.error(f'File "{file_path}" appeared while uploading.')
+                    return jsonify({'error': f'File "{filename}" already exists in the target directory.'}), 400
+                digest = file.stream.sha256.hexdigest()
+            else:
+                file.save(file_path)
+                digest = None
+            listing_cache.invalidate(final_dir)
+            uploaded.append({'path': os.path.relpath(file_path, VOLUME).replace("\\", "/"), 'sha256': digest})
+            current_app.logger.info(f"Uploaded file: {file_path} (sha256 {digest})")
 
-        return jsonify({'message': 'Files uploaded successfully.'}), 200
+        return jsonify({'message': 'Files uploaded successfully.', 'files': uploaded}), 200
 
     except Exception as e:
         current_app.logger.exception(f"Error uploading files to {path}: {e}")
@@ -225,23 +288,25 @@ def delete_item():
 
         deleted = []
         errors = []
+        directories = []
 
         for path in paths:
             current_app.logger.info(f"User '{current_user.id}' attempting to delete: {path}")
             destination_path = secure_path(path)
 
-            if not os.path.exists(destination_path):
+            if not os.path.lexists(destination_path):
                 current_app.logger.error(f"Item does not exist: {destination_path}")
                 errors.append({'path': path, 'error': 'Item does not exist.'})
                 continue
 
             try:
-                if os.path.isfile(destination_path):
+                if os.path.isdir(destination_path) and not os.path.islink(destination_path):
+                    # Directory trees can take arbitrarily long to remove
+                    directories.append((path, destination_path))
+                    continue
+                elif os.path.isfile(destination_path) or os.path.islink(destination_path):
                     os.remove(destination_path)
                     current_app.logger.info(f"Deleted file: {destination_path}")
-                elif os.path.isdir(destination_path):
-                    shutil.rmtree(destination_path)
-                    current_app.logger.info(f"Deleted directory and its contents: {destination_path}")
                 else:
                     current_app.logger.error(f"Selected path is neither a file nor a directory: {destination_path}")
                     errors.append({'path': path, 'error': 'Neither file nor directory.'})
@@ -251,7 +316,11 @@ def delete_item():
                 current_app.logger.exception(f"Error deleting item {path}: {e}")
                 errors.append({'path': path, 'error': 'Failed to delete item.'})
 
-        if errors:
+        if directories:
+            job = job_manager.submit('delete', f"Delete {len(directories)} folder(s)", current_user.id,
+                                     delete_paths, directories)
+            return jsonify({'message': 'Folder deletion started.', 'deleted': deleted, 'errors': errors, 'job': job.record}), 202
+        elif errors:
             return jsonify({'message': 'Some items were not deleted.', 'deleted': deleted, 'errors': errors}), 207
         else:
             return jsonify({'message': 'All items deleted successfully.', 'deleted': deleted}), 200
@@ -0,0 +1,64 @@
+import stat as stat_module
+import tarfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+RECORD_SIZE = tarfile.RECORDSIZE
+END_OF_ARCHIVE = b'\0' * (2 * BLOCK_SIZE)
+
+
+def tar_header(arcname, stat):
+    """
+    Return the header block(s) of a member, in POSIX (pax) format.
+
+    Permissions, owner ids and the mtime come from stat. Names and sizes
+    that don't fit the ustar fields get pax extended headers, so long
+    paths and files over 8 GB need no special casing.
+    """
+    info = tarfile.TarInfo(arcname.rstrip('/'))
+    info.mode = stat_module.S_IMODE(stat.st_mode)
+    info.uid = stat.st_uid
+    info.gid = stat.st_gid
+    info.mtime = int(stat.st_mtime)
+    if arcname.endswith('/'):
+        info.type = tarfile.DIRTYPE
+        info.size = 0
+    else:
+        info.type = tarfile.REGTYPE
+        info.size = stat.st_size
+    return info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+
+
+def padding(size):
+    """Zero bytes that round member data of size up to a whole block."""
+    return b'\0' * (-size % BLOCK_SIZE)
+
+
+def end_of_archive(offset):
+    """The two zero blocks that end an archive, padded to a whole record like tarfile does."""
+    end = offset + len(END_OF_ARCHIVE)
+    return END_OF_ARCHIVE + b'\0' * (-end % RECORD_SIZE)
+
+
+def compressor(archive_format, level, threads=0):
+    """
+    Return an object with compress() and flush() for the format, or None for plain tar.
+
+    gzip output has no name and a zero mtime, so identical trees give
+    identical archives. zstd compresses on `threads` worker threads of its
+    own when threads > 1.
+    """
+    if archive_format == 'tar':
+        return None
+    if archive_format == 'tar.gz':
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if archive_format == 'tar.zst':
+        if zstandard is None:
+            raise ValueError("tar.zst archives need the zstandard package.")
+        return zstandard.ZstdCompressor(level=level, threads=threads if threads > 1 else 0).compressobj()
+    raise ValueError(f"Unknown archive format: {archive_format}")
@@ -0,0 +1,253 @@
+import os
+import bisect
+import sqlite3
+import hashlib
+import zlib
+from contextlib import contextmanager
+
+from config import DATA_DIR
+from app.jobs.engine import native_executor
+from .zipstream import ZipMember, STORED, end_records
+
+READ_SIZE = 1024 * 1024
+CRC_BATCH = 500  # computed CRCs written to the cache per transaction
+CRC_WORKERS = 4  # threads reading files for CRCs a range request skipped
+CRC_CACHE_FILE = os.path.join(DATA_DIR, 'archive_crcs.db')
+
+
+class ArchiveChanged(Exception):
+    """A file changed after the archive layout was computed."""
+
+
+class CrcCache:
+    """
+    CRC-32 of files, keyed by path and valid while size, mtime and inode match.
+
+    Range requests for a stored archive may need the CRC of a member whose
+    data they don't cover (in its data descriptor or the central directory).
+    CRCs computed while streaming are kept here, in SQLite so every gunicorn
+    worker can use them, and a resumed download rarely has to read a file
+    just for its checksum.
+    """
+
+    def __init__(self, path=CRC_CACHE_FILE):
+        self.path = path
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS crcs '
+                '(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, crc INTEGER)'
+            )
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, files):
+        """Return {path: crc} for the (path, stat) pairs whose cached CRC is still valid."""
+        found = {}
+        with self.connect() as conn:
+            for path, stat in files:
+                row = conn.execute(
+                    'SELECT crc FROM crcs WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+                    (path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                ).fetchone()
+                if row:
+                    found[path] = row[0]
+        return found
+
+    def put_many(self, files):
+        """Store the CRCs of (path, stat, crc) triples."""
+        if not files:
+            return
+        with self.connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO crcs (path, size, mtime_ns, inode, crc) VALUES (?, ?, ?, ?, ?)',
+                [(path, stat.st_size, stat.st_mtime_ns, stat.st_ino, crc) for path, stat, crc in files]
+            )
+
+
+crc_cache = CrcCache()
+
+
+def file_crc(member):
+    """Read member's file and return its CRC-32; run on a native thread."""
+    crc = 0
+    with open(member.path, 'rb') as f:
+        ZipLayout._check_unchanged(member, os.fstat(f.fileno()))
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+class StoredMember(ZipMember):
+    def __init__(self, path, arcname, stat):
+        super().__init__(arcname, stat.st_mtime, stat.st_mode, stat.st_size, STORED)
+        self.path = path
+        self.stat = stat
+        self.compress_size = self.size
+        self.crc = None if not self.is_dir and self.size else 0
+
+
+class ZipLayout:
+    """
+    Byte-exact plan of a store-only ZIP archive, computed from stat data.
+
+    Members are stored (never compressed) in a fixed order and always carry
+    a data descriptor, so every header, data and descriptor offset and the
+    archive's total size are known before anything is read. Any byte range
+    can then be produced by seeking straight into the members it covers,
+    which is what makes Content-Length, Range and resumable downloads work.
+    The ETag changes whenever a name, size, mode or mtime does.
+    """
+
+    def __init__(self, entries):
+        self.members = []
+        for path, arcname in sorted(entries, key=lambda entry: entry[1]):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self.members.append(StoredMember(path, arcname, stat))
+
+        # Segments in archive order: (start offset, kind, member)
+        self.segments = []
+        offset = 0
+        for member in self.members:
+            member.offset = offset
+            self.segments.append((offset, 'header', member))
+            offset += member.local_header_size()
+            if member.is_dir:
+                continue
+            self.segments.append((offset, 'data', member))
+            offset += member.size
+            self.segments.append((offset, 'descriptor', member))
+            offset += member.data_descriptor_size()
+        self.directory_offset = offset
+        self.directory_size = sum(member.central_header_size() for member in self.members)
+        self.segments.append((offset, 'directory', None))
+        self.size = offset + self.directory_size + len(end_records(len(self.members), offset, self.directory_size))
+        self._starts = [segment[0] for segment in self.segments]
+        self._computed = []  # (path, stat, crc) not yet written to the cache
+        self._pending = {}  # path: future of a CRC being computed in the background
+        self._executor = None
+
+        digest = hashlib.sha256()
+        for member in self.members:
+            stat = member.stat
+            digest.update(f"{member.name.hex()}:{stat.st_size}:{stat.st_mtime_ns}:{stat.st_mode}\n".encode())
+        self.etag = digest.hexdigest()[:32]
+
+    def _start_crcs(self, members):
+        """
+        Start computing the CRCs of members that aren't cached, on native threads.
+
+        Reading a large file in the request greenlet would stall the worker,
+        so files are read in the background while the request waits or
+        keeps streaming.
+        """
+        missing = [member for member in members if member.crc is None and member.path not in self._pending]
+        if not missing:
+            return
+        cached = crc_cache.get_many([(member.path, member.stat) for member in missing])
+        for member in missing:
+            if member.path in cached:
+                member.crc = cached[member.path]
+                continue
+            # Created on first use; most requests never need it
+            if self._executor is None:
+                self._executor = native_executor(CRC_WORKERS)
+            self._pending[member.path] = self._executor.submit(file_crc, member)
+
+    def _load_crcs(self, members):
+        """Fill in the CRCs of members from the cache, reading the files that aren't in it."""
+        self._start_crcs(members)
+        for member in members:
+            if member.crc is None:
+                member.crc = self._pending.pop(member.path).result()
+                self._computed.append((member.path, member.stat, member.crc))
+        self._save_crcs()
+
+    @staticmethod
+    def _check_unchanged(member, stat):
+        # Same size but a new mtime would still invalidate CRCs computed earlier
+        if (stat.st_size, stat.st_mtime_ns) != (member.stat.st_size, member.stat.st_mtime_ns):
+            raise ArchiveChanged(f"{member.name.decode()} changed while being archived")
+
+    def _data(self, member, start, end):
+        """Yield bytes [start, end) of member's data; computes its CRC if that's all of it."""
+        whole = start == 0 and end == member.size and member.crc is None and member.path not in self._pending
+        crc = 0
+        with open(member.path, 'rb') as f:
+            self._check_unchanged(member, os.fstat(f.fileno()))
+            position = start
+            while position < end:
+                chunk = os.pread(f.fileno(), min(READ_SIZE, end - position), position)
+                if not chunk:
+                    raise ArchiveChanged(f"{member.name.decode()} was truncated while being archived")
+                if whole:
+                    crc = zlib.crc32(chunk, crc)
+                position += len(chunk)
+                yield chunk
+        if whole:
+            member.crc = crc
+            self._computed.append((member.path, member.stat, crc))
+            if len(self._computed) >= CRC_BATCH:
+                self._save_crcs()
+
+    def _save_crcs(self):
+        computed, self._computed = self._computed, []
+        try:
+            crc_cache.put_many(computed)
+        except sqlite3.Error:
+            # Only a cache; the archive itself is unaffected
+            pass
+
+    def _directory(self):
+        self._load_crcs(self.members)
+        directory = b''.join(member.central_header() for member in self.members)
+        return directory + end_records(len(self.members), self.directory_offset, self.directory_size)
+
+    def stream(self, start=0, end=None):
+        """Generate the archive bytes from start up to (not including) end."""
+        end = self.size if end is None else end
+        try:
+            yield from self._stream(start, end)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self._pending = {}
+            self._save_crcs()
+
+    def _stream(self, start, end):
+        index = bisect.bisect_right(self._starts, start) - 1
+        position = start
+        while position < end and index < len(self.segments):
+            segment_start, kind, member = self.segments[index]
+            if kind == 'header':
+                data = member.local_header()
+            elif kind == 'descriptor':
+                self._load_crcs([member])
+                data = member.data_descriptor()
+            elif kind == 'directory':
+                data = self._directory()
+            else:
+                if position > segment_start:
+                    # Resumed inside this member: its descriptor will need the CRC
+                    self._start_crcs([member])
+                data_end = min(end - segment_start, member.size)
+                for chunk in self._data(member, position - segment_start, data_end):
+                    position += len(chunk)
+                    yield chunk
+                index += 1
+                continue
+            chunk = data[position - segment_start:end - segment_start]
+            position += len(chunk)
+            if chunk:
+                yield chunk
+            index += 1
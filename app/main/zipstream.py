@@ -0,0 +1,136 @@
+import time
+import struct
+import zipfile
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+STORED = zipfile.ZIP_STORED
+DEFLATED = zipfile.ZIP_DEFLATED
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+VERSION = 20
+ZIP64_VERSION = 45
+CREATE_SYSTEM_UNIX = 3
+DIRECTORY_ATTRIBUTE = 0x10  # MS-DOS directory bit
+
+LOCAL_HEADER = struct.Struct('<4sHHHHHLLLHH')
+CENTRAL_HEADER = struct.Struct('<4sBBHHHHHLLLHHHHHLL')
+DATA_DESCRIPTOR = struct.Struct('<4sLLL')
+DATA_DESCRIPTOR64 = struct.Struct('<4sLQQ')
+END_RECORD = struct.Struct('<4sHHHHLLH')
+END_RECORD64 = struct.Struct('<4sQHHLLQQQQ')
+END_LOCATOR64 = struct.Struct('<4sLQL')
+
+
+def dos_datetime(timestamp):
+    """Return the MS-DOS (date, time) of a timestamp, clamped to 1980-2107 like zipfile does."""
+    year, month, day, hour, minute, second = time.localtime(timestamp)[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    elif year > 2107:
+        year, month, day, hour, minute, second = 2107, 12, 31, 23, 59, 59
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+class ZipMember:
+    """
+    One archive member and its ZIP records.
+
+    Files are always written with a data descriptor after their data, so
+    the CRC and compressed size only have to be known once the data has
+    been sent. Whether a member needs ZIP64 records is decided up front
+    from the size it is expected to have, as zipfile does.
+    """
+
+    def __init__(self, name, mtime, mode, size=0, method=STORED):
+        self.is_dir = name.endswith('/')
+        self.name = name.encode('utf-8')
+        self.date, self.time = dos_datetime(mtime)
+        self.method = STORED if self.is_dir else method
+        self.external_attr = (mode & 0xFFFF) << 16 | (DIRECTORY_ATTRIBUTE if self.is_dir else 0)
+        self.size = 0 if self.is_dir else size
+        self.compress_size = 0
+        self.crc = 0
+        self.offset = 0
+        self.flags = 0 if name.isascii() else FLAG_UTF8
+        if not self.is_dir:
+            self.flags |= FLAG_DATA_DESCRIPTOR
+        # Deflate can grow incompressible data slightly
+        expected = self.size * 1.05 if self.method == DEFLATED else self.size
+        self.zip64 = expected >= ZIP64_LIMIT
+
+    @property
+    def version(self):
+        return ZIP64_VERSION if self.zip64 else VERSION
+
+    def local_header_size(self):
+        return LOCAL_HEADER.size + len(self.name) + (20 if self.zip64 else 0)
+
+    def data_descriptor_size(self):
+        if self.is_dir:
+            return 0
+        return DATA_DESCRIPTOR64.size if self.zip64 else DATA_DESCRIPTOR.size
+
+    def central_header_size(self):
+        fields = sum(value >= ZIP64_LIMIT for value in (self.size, self.compress_size, self.offset))
+        return CENTRAL_HEADER.size + len(self.name) + (4 + 8 * fields if fields else 0)
+
+    def local_header(self):
+        if self.zip64:
+            # Sizes follow in the descriptor; the extra field only marks them as 64-bit
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            sizes = (ZIP64_LIMIT, ZIP64_LIMIT)
+        else:
+            extra = b''
+            sizes = (0, 0)
+        return LOCAL_HEADER.pack(
+            b'PK\x03\x04', self.version, self.flags, self.method, self.time, self.date,
+            0, *sizes, len(self.name), len(extra)
+        ) + self.name + extra
+
+    def data_descriptor(self):
+        if self.is_dir:
+            return b''
+        if self.zip64:
+            return DATA_DESCRIPTOR64.pack(b'PK\x07\x08', self.crc, self.compress_size, self.size)
+        if self.size >= ZIP64_LIMIT or self.compress_size >= ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(f"{self.name.decode()} grew past 4 GB while being archived")
+        return DATA_DESCRIPTOR.pack(b'PK\x07\x08', self.crc, self.compress_size, self.size)
+
+    def central_header(self):
+        fields = []
+        size, compress_size, offset = self.size, self.compress_size, self.offset
+        if size >= ZIP64_LIMIT:
+            fields.append(size)
+            size = ZIP64_LIMIT
+        if compress_size >= ZIP64_LIMIT:
+            fields.append(compress_size)
+            compress_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            fields.append(offset)
+            offset = ZIP64_LIMIT
+        extra = struct.pack(f'<HH{len(fields)}Q', 1, 8 * len(fields), *fields) if fields else b''
+        version = ZIP64_VERSION if fields or self.zip64 else VERSION
+        return CENTRAL_HEADER.pack(
+            b'PK\x01\x02', version, CREATE_SYSTEM_UNIX, version, self.flags, self.method,
+            self.time, self.date, self.crc, compress_size, size,
+            len(self.name), len(extra), 0, 0, 0, self.external_attr, offset
+        ) + self.name + extra
+
+
+def end_records(count, directory_offset, directory_size):
+    """Return the end of central directory records, with ZIP64 ones when needed."""
+    records = b''
+    if count >= ZIP_FILECOUNT_LIMIT or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+        zip64_offset = directory_offset + directory_size
+        records = END_RECORD64.pack(
+            b'PK\x06\x06', END_RECORD64.size - 12, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+            count, count, directory_size, directory_offset
+        ) + END_LOCATOR64.pack(b'PK\x06\x07', 0, zip64_offset, 1)
+        count = min(count, ZIP_FILECOUNT_LIMIT)
+        directory_offset = min(directory_offset, ZIP64_LIMIT)
+        directory_size = min(directory_size, ZIP64_LIMIT)
+    return records + END_RECORD.pack(
+        b'PK\x05\x06', 0, 0, count, count, directory_size, directory_offset, 0
+    )
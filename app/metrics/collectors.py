@@ -0,0 +1,111 @@
+import time
+
+from flask import request, g
+
+from .registry import registry, Counter, Gauge, Histogram
+
+SIZE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 ** 2, 16 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3, 16 * 1024 ** 3)
+
+REQUESTS = Counter(
+    registry, 'dve_http_requests_total', 'HTTP requests handled.',
+    ('method', 'endpoint', 'status')
+)
+REQUEST_DURATION = Histogram(
+    registry, 'dve_http_request_duration_seconds',
+    'Time from the start of a request until its response body was sent.',
+    ('method', 'endpoint')
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    registry, 'dve_http_requests_in_flight', 'Requests currently being handled by each worker.',
+    ('endpoint',)
+)
+REQUEST_BYTES = Counter(
+    registry, 'dve_http_request_bytes_total', 'Request body bytes received.',
+    ('endpoint',)
+)
+RESPONSE_BYTES = Counter(
+    registry, 'dve_http_response_bytes_total', 'Response body bytes sent, including streamed bodies.',
+    ('endpoint',)
+)
+FILESYSTEM_DURATION = Histogram(
+    registry, 'dve_filesystem_operation_seconds',
+    'Time spent walking or stat-ing the volume, by operation.',
+    ('operation',)
+)
+ARCHIVE_INPUT_BYTES = Counter(
+    registry, 'dve_archive_input_bytes_total', 'File bytes read into archives.',
+    ('format',)
+)
+ARCHIVE_OUTPUT_BYTES = Counter(
+    registry, 'dve_archive_output_bytes_total', 'Archive bytes produced.',
+    ('format',)
+)
+ARCHIVE_DURATION = Histogram(
+    registry, 'dve_archive_duration_seconds', 'Time taken to produce an archive.',
+    ('format',)
+)
+ARCHIVE_SIZE = Histogram(
+    registry, 'dve_archive_size_bytes', 'Size of produced archives.',
+    ('format',), buckets=SIZE_BUCKETS
+)
+JOBS = Counter(
+    registry, 'dve_jobs_total', 'Background jobs finished, by type and final status.',
+    ('type', 'status')
+)
+
+
+class CountingIterable:
+    """Wraps a streamed response body to count the bytes actually sent."""
+
+    def __init__(self, iterable, endpoint):
+        self.iterable = iterable
+        self.endpoint = endpoint
+
+    def __iter__(self):
+        sent = 0
+        try:
+            for chunk in self.iterable:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            RESPONSE_BYTES.inc(sent, endpoint=self.endpoint)
+
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+
+
+def endpoint_label():
+    return request.endpoint or 'unmatched'
+
+
+def init_app(app):
+    registry.init_app(app)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_endpoint = endpoint_label()
+        REQUESTS_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+        if request.content_length:
+            REQUEST_BYTES.inc(request.content_length, endpoint=g.metrics_endpoint)
+
+    @app.after_request
+    def finish_request_metrics(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        endpoint = g.metrics_endpoint
+        method = request.method
+        REQUESTS.inc(method=method, endpoint=endpoint, status=response.status_code)
+
+        if response.is_streamed and response.content_length is None:
+            response.response = CountingIterable(response.response, endpoint)
+        elif response.content_length:
+            RESPONSE_BYTES.inc(response.content_length, endpoint=endpoint)
+
+        def finished():
+            REQUEST_DURATION.observe(time.perf_counter() - start, method=method, endpoint=endpoint)
+            REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+        response.call_on_close(finished)
+        return response
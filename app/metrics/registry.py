@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+
+from config import METRICS_DIR
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+FLUSH_INTERVAL = 5  # seconds between writes of this process's metrics file
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.update(self, self.key(labels), lambda value: (value or 0) + amount)
+
+
+class Gauge(Metric):
+    """
+    Gauge reported per process with a 'pid' label.
+
+    Values of processes that exited are dropped instead of summed.
+    """
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self.registry.update(self, self.key(labels), lambda value: (value or 0) + amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        self.registry.update(self, self.key(labels), lambda _: value)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(registry, name, documentation, labelnames)
+
+    def observe(self, value, **labels):
+        def add(state):
+            state = state or {'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+            return state
+        self.registry.update(self, self.key(labels), add)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class MultiProcessRegistry:
+    """
+    Metrics shared by every gunicorn worker through files in METRICS_DIR.
+
+    Each process keeps its own values in memory and writes them to
+    '<pid>.json' every FLUSH_INTERVAL seconds. A scrape reads all files and
+    adds them up. Counters and histograms of workers that exited are folded
+    into 'exited.json' when a new process starts, so restarts don't reset
+    them; gauges of exited workers are discarded.
+    """
+
+    def __init__(self, path=METRICS_DIR):
+        self.path = path
+        self.metrics = {}
+        self._values = {}  # metric name -> {label key: value}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None
+        self.pid = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def init_app(self, app):
+        self.pid = os.getpid()
+        os.makedirs(self.path, exist_ok=True)
+        self._collect_exited()
+
+    def update(self, metric, key, func):
+        with self._lock:
+            values = self._values.setdefault(metric.name, {})
+            values[key] = func(values.get(key))
+            self._dirty = True
+        if self._flusher is None:
+            # Started on first use so each worker runs its own
+            self._flusher = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def flush(self):
+        """Write this process's values to its file if anything changed."""
+        if self.pid is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                name: [[list(key), value] for key, value in values.items()]
+                for name, values in self._values.items()
+            }
+            self._dirty = False
+        path = self._file(f"{self.pid}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {name: {tuple(map(tuple, key)): value for key, value in samples}
+                for name, samples in data.items()}
+
+    def _merge(self, total, values, include_gauges=True):
+        for name, samples in values.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.type == 'gauge' and not include_gauges):
+                continue
+            merged = total.setdefault(name, {})
+            for key, value in samples.items():
+                if metric.type == 'histogram':
+                    state = merged.setdefault(key, {'buckets': [0] * len(metric.buckets), 'sum': 0, 'count': 0})
+                    state['buckets'] = [a + b for a, b in zip(state['buckets'], value['buckets'])]
+                    state['sum'] += value['sum']
+                    state['count'] += value['count']
+                else:
+                    merged[key] = merged.get(key, 0) + value
+
+    def _collect_exited(self):
+        with open(self._file('.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            exited = self._load(self._file('exited.json'))
+            collected = []
+            for name in os.listdir(self.path):
+                if not name.endswith('.json') or not name[:-5].isdigit():
+                    continue
+                pid = int(name[:-5])
+                # A file carrying our own pid before we recorded anything
+                # was left by an earlier process that had the same pid
+                if (pid == self.pid and not self._values) or not pid_alive(pid):
+                    self._merge(exited, self._load(self._file(name)), include_gauges=False)
+                    collected.append(name)
+            if collected:
+                tmp_path = self._file('exited.json.tmp')
+                with open(tmp_path, 'w') as f:
+                    json.dump({name: [[list(key), value] for key, value in samples.items()]
+                               for name, samples in exited.items()}, f)
+                os.replace(tmp_path, self._file('exited.json'))
+                for name in collected:
+                    os.unlink(self._file(name))
+
+    def collect(self):
+        """Return {metric name: {label key: value}} summed over all processes."""
+        self.flush()
+        total = {}
+        # Shared lock: a starting worker may be folding files into exited.json
+        with open(self._file('.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            self._merge(total, self._load(self._file('exited.json')), include_gauges=False)
+            for name in os.listdir(self.path):
+                if not name.endswith('.json') or not name[:-5].isdigit():
+                    continue
+                pid = int(name[:-5])
+                alive = pid_alive(pid)
+                values = self._load(self._file(name))
+                for metric_name, samples in values.items():
+                    metric = self.metrics.get(metric_name)
+                    if metric is None:
+                        continue
+                    if metric.type == 'gauge':
+                        if alive:
+                            gauges = total.setdefault(metric_name, {})
+                            for key, value in samples.items():
+                                gauges[key + (('pid', str(pid)),)] = value
+                    else:
+                        self._merge(total, {metric_name: samples})
+        return total
+
+    def exposition(self):
+        """Render all metrics in the Prometheus text format."""
+        values = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(values.get(name, {}).items()):
+                if metric.type != 'histogram':
+                    lines.append(f"{name}{format_labels(key)} {format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value['buckets'] + [None]):
+                    cumulative = value['count'] if count is None else cumulative + count
+                    lines.append(f"{name}_bucket{format_labels(key + (('le', format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(key)} {format_value(value['sum'])}")
+                lines.append(f"{name}_count{format_labels(key)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MultiProcessRegistry()
@@ -0,0 +1,29 @@
+import hmac
+
+from flask import Blueprint, Response, request, current_app, jsonify
+from flask_login import current_user
+
+from .registry import registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus scrape endpoint.
+
+    Scrapers authenticate with 'Authorization: Bearer <METRICS_TOKEN>'; a
+    logged-in browser session is accepted as well.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    authorized = current_user.is_authenticated or (
+        token and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+    )
+    if not authorized:
+        current_app.logger.warning(f"Unauthorized metrics request from {request.remote_addr}")
+        response = jsonify({'error': 'Unauthorized'})
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response, 401
+
+    return Response(registry.exposition(), mimetype='text/plain; version=0.0.4')
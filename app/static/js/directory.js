@@ -1,10 +1,11 @@
 App.loadDirectory = function(path) {
+    App.cancelSearch();
     App.currentPath = path;
     App.isGlobalSearch = false; 
+    App.nextCursor = null;
     document.getElementById('search-bar').value = ''; 
     App.showLoading(true);
-    fetch(`/api/list?path=${encodeURIComponent(path)}`)
-        .then(response => response.json())
+    App.fetchDirectoryPage(path, null)
         .then(data => {
             if (data.error) {
                 App.showToast(data.error);
@@ -15,8 +16,13 @@ App.loadDirectory = function(path) {
                 return path ? `${path}/${dir}`.replace(/\\/g, '/') : dir;
             });
             App.allFiles = data.files;
+            App.directorySizes = {};
+            App.storeDirectorySizes(path, data.directory_sizes);
+            App.nextCursor = data.next_cursor;
+            App.totalItems = data.total;
             App.updateBreadcrumb(data.breadcrumb);
             App.applyFilters();
+            App.watchDirectory(path);
             App.showLoading(false); 
         })
         .catch(error => {
@@ -26,6 +32,62 @@ App.loadDirectory = function(path) {
         });
 };
 
+App.fetchDirectoryPage = function(path, cursor) {
+    const params = new URLSearchParams({
+        path: path,
+        sort: App.currentSort,
+        limit: App.pageSize,
+        sizes: 1
+    });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return App.fetchJSON(`/api/list?${params.toString()}`);
+};
+
+App.loadMore = function() {
+    if (!App.nextCursor || App.isLoadingMore || App.isGlobalSearch) {
+        return;
+    }
+    const path = App.currentPath;
+    App.isLoadingMore = true;
+    App.fetchDirectoryPage(path, App.nextCursor)
+        .then(data => {
+            if (path !== App.currentPath || App.isGlobalSearch) {
+                return;
+            }
+            if (data.error) {
+                App.showToast(data.error);
+                return;
+            }
+            const directories = data.directories.map(dir => {
+                return path ? `${path}/${dir}`.replace(/\\/g, '/') : dir;
+            });
+            App.allDirectories = App.allDirectories.concat(directories);
+            App.allFiles = App.allFiles.concat(data.files);
+            App.storeDirectorySizes(path, data.directory_sizes);
+            App.nextCursor = data.next_cursor;
+            App.totalItems = data.total;
+            App.appendFileListItems(directories, data.files);
+        })
+        .catch(error => {
+            console.error('Error fetching directory page:', error);
+            App.showToast('An error occurred while loading more items.');
+        })
+        .finally(() => {
+            App.isLoadingMore = false;
+        });
+};
+
+App.storeDirectorySizes = function(path, sizes) {
+    if (!sizes) {
+        return;
+    }
+    Object.entries(sizes).forEach(([name, totals]) => {
+        App.directorySizes[path ? `${path}/${name}` : name] = totals;
+    });
+};
+
 App.updateBreadcrumb = function(breadcrumb) {
     const breadcrumbLinks = document.getElementById('breadcrumb-links');
     breadcrumbLinks.innerHTML = ''; 
@@ -49,20 +111,6 @@ App.updateBreadcrumb = function(breadcrumb) {
     });
 };
 
-App.applyFilters = function() {
-    if (App.isGlobalSearch && App.currentSearch.trim() !== '') {
-        App.updateFileList(App.allDirectories, App.allFiles);
-        return;
-    }
-
-    let filteredDirectories = App.allDirectories.filter(dir => dir.toLowerCase().includes(App.currentSearch.toLowerCase()));
-    let filteredFiles = App.allFiles.filter(file => file.name.toLowerCase().includes(App.currentSearch.toLowerCase()));
-    filteredDirectories = App.sortArray(filteredDirectories, App.currentSort, 'directory');
-    filteredFiles = App.sortArray(filteredFiles, App.currentSort, 'file');
-
-    App.updateFileList(filteredDirectories, filteredFiles);
-};
-
 App.sortArray = function(arr, sortType, type='directory') {
     let sortedArr = [...arr];
     if (type === 'directory') {
@@ -105,32 +153,96 @@ App.sortArray = function(arr, sortType, type='directory') {
     return sortedArr;
 };
 
+App.searchRenderInterval = 200; // ms between re-renders while results stream in
+
+App.cancelSearch = function() {
+    if (App.searchController) {
+        App.searchController.abort();
+        App.searchController = null;
+    }
+};
+
 App.performGlobalSearch = function (query) {
-    fetch(`/api/search?query=${encodeURIComponent(query)}`)
-        .then(response => response.json())
-        .then(data => {
-            if (data.error) {
-                App.showToast(data.error);
-                showLoading(false);
-                return;
-            }
-            App.allDirectories = data.directories;
-            App.allFiles = data.files;
-            App.updateBreadcrumb(data.breadcrumb); 
+    App.cancelSearch();
+    const controller = new AbortController();
+    App.searchController = controller;
+    App.allDirectories = [];
+    App.allFiles = [];
+    App.updateBreadcrumb([{ name: 'Root', path: '' }, { name: `Search Results for '${query}'`, path: '' }]);
+
+    let lastRender = 0;
+    const render = (force) => {
+        const now = Date.now();
+        if (force || now - lastRender >= App.searchRenderInterval) {
+            lastRender = now;
             App.applyFilters();
+        }
+    };
+    const handleLine = (line) => {
+        if (!line) {
+            return;
+        }
+        const result = JSON.parse(line);
+        if (result.type === 'directory') {
+            App.allDirectories.push(result.path);
+        } else if (result.type === 'file') {
+            App.allFiles.push(result);
+        } else if (result.type === 'done' && result.truncated) {
+            App.showToast(result.reason === 'time_budget'
+                ? 'The search took too long and was stopped; showing what was found so far.'
+                : `Showing the first ${result.found} results; refine the search to see others.`);
+        }
+    };
+
+    // Results arrive as one JSON object per line and are shown as they come
+    fetch(`/api/search/live?query=${encodeURIComponent(query)}`, { signal: controller.signal })
+        .then(response => {
+            if (!response.ok) {
+                return response.json().then(data => {
+                    throw new Error(data.error || 'An error occurred while searching.');
+                });
+            }
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            const pump = () => reader.read().then(({ done, value }) => {
+                if (done) {
+                    handleLine(buffered + decoder.decode());
+                    return;
+                }
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+                lines.forEach(handleLine);
+                App.showLoading(false);
+                render(false);
+                return pump();
+            });
+            return pump();
+        })
+        .then(() => {
+            render(true);
             App.showLoading(false);
         })
         .catch(error => {
+            if (error.name === 'AbortError') {
+                return;
+            }
             console.error('Error performing search:', error);
-            App.showToast('An error occurred while searching.');
-            showLoading(false);
+            App.showToast(error.message);
+            App.showLoading(false);
         });
-}
+};
 
 App.sortFiles = function() {
     const sortType = document.getElementById('sort-dropdown').value;
     App.currentSort = sortType;
-    App.applyFilters();
+    if (App.isGlobalSearch) {
+        App.applyFilters();
+    } else {
+        // Listings are paged, so the server has to apply the new order
+        App.loadDirectory(App.currentPath);
+    }
 }
 
 App.searchFiles = function() {
@@ -149,15 +261,15 @@ App.searchFiles = function() {
 
 App.applyFilters = function() {
     if (App.isGlobalSearch && App.currentSearch.trim() !== '') {
-        App.updateFileList(App.allDirectories, App.allFiles);
+        const sortedDirectories = App.sortArray(App.allDirectories, App.currentSort, 'directory');
+        const sortedFiles = App.sortArray(App.allFiles, App.currentSort, 'file');
+        App.updateFileList(sortedDirectories, sortedFiles);
         return;
     }
 
-    let filteredDirectories = App.allDirectories.filter(dir => dir.toLowerCase().includes(App.currentSearch.toLowerCase()));
-    let filteredFiles = App.allFiles.filter(file => file.name.toLowerCase().includes(App.currentSearch.toLowerCase()));
-
-    filteredDirectories = App.sortArray(filteredDirectories, App.currentSort, 'directory');
-    filteredFiles = App.sortArray(filteredFiles, App.currentSort, 'file');
+    // Directory listings arrive already sorted by the server
+    const filteredDirectories = App.allDirectories.filter(dir => dir.toLowerCase().includes(App.currentSearch.toLowerCase()));
+    const filteredFiles = App.allFiles.filter(file => file.name.toLowerCase().includes(App.currentSearch.toLowerCase()));
 
     App.updateFileList(filteredDirectories, filteredFiles);
 }
@@ -178,70 +290,298 @@ App.updateFileList = function(directories, files) {
     selectAllItem.appendChild(selectAllCheckbox);
     fileList.appendChild(selectAllItem);
 
+    App.appendFileListItems(directories, files);
+};
+
+App.appendFileListItems = function(directories, files) {
+    const fileList = document.getElementById('file-list');
+    const fragment = document.createDocumentFragment();
+
     directories.forEach(directory => {
-        const listItem = document.createElement('li');
-        listItem.className = 'file-list-item';
-
-        const checkbox = document.createElement('input');
-        checkbox.type = 'checkbox';
-        checkbox.name = 'selected_paths';
-        checkbox.value = directory;
-        checkbox.className = 'file-checkbox';
-        if (App.selectedItems.has(directory)) {
-            checkbox.checked = true;
-        }
+        fragment.appendChild(App.createDirectoryItem(directory));
+    });
+    files.forEach(file => {
+        fragment.appendChild(App.createFileItem(file));
+    });
 
-        const link = document.createElement('a');
-        link.href = '#';
-        link.className = 'file-link';
-        link.innerHTML = `<i class="bi bi-folder-fill file-icon"></i> ${App.getDirectoryName(directory)}`;
-        link.addEventListener('click', (e) => {
-            e.preventDefault();
-            const newPath = directory;
-            App.navigationHistory.push(App.currentPath);
-            App.loadDirectory(newPath);
-        });
+    const loadMoreItem = document.getElementById('load-more-item');
+    if (loadMoreItem) {
+        loadMoreItem.remove();
+    }
+    fileList.appendChild(fragment);
 
-        // File details (e.g., Folder)
-        const details = document.createElement('div');
-        details.className = 'file-details';
-        details.textContent = 'Folder';
+    if (App.nextCursor && !App.isGlobalSearch) {
+        fileList.appendChild(App.createLoadMoreItem());
+    }
+};
+
+App.createDirectoryItem = function(directory) {
+    const listItem = document.createElement('li');
+    listItem.className = 'file-list-item';
+    listItem.dataset.path = directory;
 
-        listItem.appendChild(checkbox);
-        listItem.appendChild(link);
-        listItem.appendChild(details);
-        fileList.appendChild(listItem);
+    const checkbox = document.createElement('input');
+    checkbox.type = 'checkbox';
+    checkbox.name = 'selected_paths';
+    checkbox.value = directory;
+    checkbox.className = 'file-checkbox';
+    if (App.selectedItems.has(directory)) {
+        checkbox.checked = true;
+    }
+
+    const link = document.createElement('a');
+    link.href = '#';
+    link.className = 'file-link';
+    link.innerHTML = `<i class="bi bi-folder-fill file-icon"></i> ${App.getDirectoryName(directory)}`;
+    link.addEventListener('click', (e) => {
+        e.preventDefault();
+        const newPath = directory;
+        App.navigationHistory.push(App.currentPath);
+        App.loadDirectory(newPath);
     });
 
-    // Add files
-    files.forEach(file => {
-        const listItem = document.createElement('li');
-        listItem.className = 'file-list-item';
-
-        const checkbox = document.createElement('input');
-        checkbox.type = 'checkbox';
-        checkbox.name = 'selected_paths';
-        checkbox.value = file.path;
-        checkbox.className = 'file-checkbox';
-        if (App.selectedItems.has(file.path)) {
-            checkbox.checked = true;
-        }
+    // File details (e.g., Folder)
+    const details = document.createElement('div');
+    details.className = 'file-details';
+    const totals = App.directorySizes[directory];
+    details.textContent = totals
+        ? `Folder | ${App.formatSize(totals.size)} | ${totals.files} file(s)`
+        : 'Folder';
+
+    listItem.appendChild(checkbox);
+    listItem.appendChild(link);
+    listItem.appendChild(details);
+    return listItem;
+};
+
+App.createFileItem = function(file) {
+    const listItem = document.createElement('li');
+    listItem.className = 'file-list-item';
+    listItem.dataset.path = file.path;
+
+    const checkbox = document.createElement('input');
+    checkbox.type = 'checkbox';
+    checkbox.name = 'selected_paths';
+    checkbox.value = file.path;
+    checkbox.className = 'file-checkbox';
+    if (App.selectedItems.has(file.path)) {
+        checkbox.checked = true;
+    }
+
+    const span = document.createElement('span');
+    span.className = 'file-link';
+    span.innerHTML = `<i class="bi bi-file-earmark-fill file-icon"></i> ${file.name}`;
+    span.addEventListener('click', () => {
+        // implement file preview or download?
+    });
+
+    // File details (e.g., size and last modified)
+    const details = document.createElement('div');
+    details.className = 'file-details';
+    details.textContent = `${App.formatSize(file.size)} | ${App.formatDate(file.lastModified)}`;
+
+    listItem.appendChild(checkbox);
+    listItem.appendChild(span);
+    listItem.appendChild(details);
+    return listItem;
+};
+
+App.createLoadMoreItem = function() {
+    const listItem = document.createElement('li');
+    listItem.className = 'file-list-item load-more-item';
+    listItem.id = 'load-more-item';
+
+    const button = document.createElement('button');
+    button.type = 'button';
+    button.className = 'load-more-button';
+    const loaded = App.allDirectories.length + App.allFiles.length;
+    button.textContent = `Load more (${loaded} of ${App.totalItems})`;
+    button.addEventListener('click', App.loadMore);
+    listItem.appendChild(button);
 
-        const span = document.createElement('span');
-        span.className = 'file-link';
-        span.innerHTML = `<i class="bi bi-file-earmark-fill file-icon"></i> ${file.name}`;
-        span.addEventListener('click', () => {
-            // implement file preview or download?
+    // Fetch the next page as soon as the end of the list scrolls into view
+    if ('IntersectionObserver' in window) {
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                observer.disconnect();
+                App.loadMore();
+            }
         });
+        observer.observe(listItem);
+    }
+    return listItem;
+};
+
+App.refreshDirectory = function() {
+    // With a live change feed the listing is already being kept up to date
+    if (App.changeFeedLive && !App.isGlobalSearch) {
+        return;
+    }
+    App.loadDirectory(App.currentPath);
+};
 
-        // File details (e.g., size and last modified)
-        const details = document.createElement('div');
-        details.className = 'file-details';
-        details.textContent = `${App.formatSize(file.size)} | ${App.formatDate(file.lastModified)}`;
+App.closeChangeFeed = function() {
+    if (App.changeSource) {
+        App.changeSource.close();
+    }
+    App.changeSource = null;
+    App.changeFeedLive = false;
+};
 
-        listItem.appendChild(checkbox);
-        listItem.appendChild(span);
-        listItem.appendChild(details);
-        fileList.appendChild(listItem);
+App.watchDirectory = function(path) {
+    if (!window.EventSource) {
+        return;
+    }
+    if (App.changeSource && App.changeSourcePath === path) {
+        return;
+    }
+    App.closeChangeFeed();
+
+    const source = new EventSource(`/api/events?path=${encodeURIComponent(path)}`);
+    let interrupted = false;
+    App.changeSource = source;
+    App.changeSourcePath = path;
+
+    source.addEventListener('ready', () => {
+        App.changeFeedLive = true;
+        if (interrupted) {
+            // Changes made while reconnecting were missed
+            interrupted = false;
+            App.loadDirectory(App.currentPath);
+        }
+    });
+    source.addEventListener('change', (e) => {
+        App.applyChange(JSON.parse(e.data));
     });
+    source.onerror = () => {
+        App.changeFeedLive = false;
+        interrupted = true;
+        if (source.readyState === EventSource.CLOSED && App.changeSource === source) {
+            // Refused by the server (e.g. 503); fall back to reloading after actions
+            App.changeSource = null;
+        }
+    };
+};
+
+App.applyChange = function(change) {
+    if (App.isGlobalSearch || change.path !== App.currentPath) {
+        return;
+    }
+
+    if (change.event === 'resync') {
+        App.loadDirectory(App.currentPath);
+        return;
+    }
+    if (change.event === 'deleted') {
+        App.closeChangeFeed();
+        App.showToast('This folder was removed.', 'warning');
+        App.loadDirectory(App.currentPath.split('/').slice(0, -1).join('/'));
+        return;
+    }
+
+    const fullPath = change.path ? `${change.path}/${change.name}` : change.name;
+    const existed = App.removeEntry(fullPath, change.is_dir);
+    if (change.event === 'added' || change.event === 'modified') {
+        if (change.event === 'added' && !existed) {
+            App.totalItems += 1;
+        }
+        App.insertEntry(fullPath, change);
+    } else {
+        App.totalItems -= 1;
+        if (App.selectedItems.delete(fullPath)) {
+            App.updateSelectedItemsPanel();
+        }
+    }
+    App.updateLoadMoreItem();
+};
+
+App.compareEntries = function(a, b) {
+    const [field, order] = App.currentSort.split('_');
+    let result = 0;
+    if (field === 'date') {
+        result = a.lastModified - b.lastModified;
+    } else if (field === 'size') {
+        result = a.size - b.size;
+    }
+    if (result === 0) {
+        const aName = a.name.toLowerCase();
+        const bName = b.name.toLowerCase();
+        result = aName < bName ? -1 : aName > bName ? 1 : (a.name < b.name ? -1 : a.name > b.name ? 1 : 0);
+    }
+    return order === 'desc' ? -result : result;
+};
+
+App.removeEntry = function(path, isDirectory) {
+    const index = isDirectory ? App.allDirectories.indexOf(path) : App.allFiles.findIndex(file => file.path === path);
+    if (index === -1) {
+        return false;
+    }
+    if (isDirectory) {
+        App.allDirectories.splice(index, 1);
+    } else {
+        App.allFiles.splice(index, 1);
+    }
+    const listItem = App.findListItem(path);
+    if (listItem) {
+        listItem.remove();
+    }
+    return true;
+};
+
+App.insertEntry = function(path, change) {
+    let index;
+    let nextPath;
+    let listItem;
+
+    if (change.is_dir) {
+        const entry = { name: change.name, size: 0, lastModified: change.lastModified };
+        if (App.currentSort.startsWith('date')) {
+            // Only the new folder's time is known, and it is the newest one
+            index = App.currentSort === 'date_desc' ? 0 : App.allDirectories.length;
+        } else {
+            index = App.allDirectories.findIndex(dir => App.compareEntries(entry, { name: App.getDirectoryName(dir), size: 0, lastModified: 0 }) < 0);
+            index = index === -1 ? App.allDirectories.length : index;
+        }
+        // Folders come first, so one sorting last belongs to a later page unless files were loaded
+        if (index === App.allDirectories.length && App.nextCursor && App.allFiles.length === 0) {
+            return;
+        }
+        App.allDirectories.splice(index, 0, path);
+        nextPath = App.allDirectories[index + 1] || (App.allFiles[0] && App.allFiles[0].path);
+        listItem = App.createDirectoryItem(path);
+    } else {
+        const file = { name: change.name, size: change.size, lastModified: change.lastModified, path: path };
+        index = App.allFiles.findIndex(other => App.compareEntries(file, other) < 0);
+        if (index === -1) {
+            if (App.nextCursor) {
+                return;
+            }
+            index = App.allFiles.length;
+        }
+        App.allFiles.splice(index, 0, file);
+        nextPath = App.allFiles[index + 1] && App.allFiles[index + 1].path;
+        listItem = App.createFileItem(file);
+    }
+
+    const fileList = document.getElementById('file-list');
+    const before = (nextPath && App.findListItem(nextPath)) || document.getElementById('load-more-item');
+    fileList.insertBefore(listItem, before);
+};
+
+App.findListItem = function(path) {
+    const fileList = document.getElementById('file-list');
+    for (const listItem of fileList.children) {
+        if (listItem.dataset.path === path) {
+            return listItem;
+        }
+    }
+    return null;
+};
+
+App.updateLoadMoreItem = function() {
+    const loadMoreItem = document.getElementById('load-more-item');
+    if (loadMoreItem) {
+        const loaded = App.allDirectories.length + App.allFiles.length;
+        loadMoreItem.querySelector('.load-more-button').textContent = `Load more (${loaded} of ${App.totalItems})`;
+    }
 };
@@ -1,5 +1,7 @@
 App.setupEditor = function() {
-    require.config({ paths: { 'vs': '/static/js/vendor/monaco/vs' }});
+    // Fingerprinted location of the Monaco tree, rendered into the page
+    const base = document.querySelector('meta[name="monaco-base"]');
+    require.config({ paths: { 'vs': base ? base.getAttribute('content') : '/static/js/vendor/monaco/vs' }});
     require(['vs/editor/editor.main'], function() {
         App.editor = monaco.editor.create(document.getElementById('editor'), {
             value: '',
@@ -7,22 +9,42 @@ App.setupEditor = function() {
             theme: 'vs-dark',
             automaticLayout: true
         });
+        App.editor.onDidScrollChange(App.onViewerScroll);
+        App.editor.addAction({
+            id: 'viewer-go-to-line',
+            label: 'Go to Line in File...',
+            contextMenuGroupId: 'navigation',
+            run: App.viewerGoToLine
+        });
     }, function(err) {
         console.error('Failed to load Monaco Editor:', err);
         App.showToast('Failed to load the editor.', 'danger');
     });
 };
 
+App.editorMaxFileSize = 5 * 1024 * 1024; // larger files open read-only in windows (EDITOR_MAX_FILE_SIZE)
+
 App.openEditor = function(filePath) {
+    const file = App.allFiles.find(item => item.path === filePath);
+    if (file && file.size > App.editorMaxFileSize) {
+        App.openViewer(filePath);
+        return;
+    }
+
     App.currentEditingFilePath = filePath;
-    fetch(`/api/get_file_content?path=${encodeURIComponent(filePath)}`)
-        .then(response => response.json())
+    App.fetchJSON(`/api/get_file_content?path=${encodeURIComponent(filePath)}`)
         .then(data => {
             if (data.error) {
+                if (data.size !== undefined) {
+                    // Grew past the limit since it was listed
+                    App.openViewer(filePath);
+                    return;
+                }
                 App.showToast(data.error);
                 return;
             }
             App.editor.setValue(data.content);
+            App.editorBase = { version: data.version, lines: data.content.split('\n') };
             App.showEditorModal(true);
             const extension = App.getFileExtension(filePath);
             App.setEditorLanguage(extension);
@@ -34,9 +56,269 @@ App.openEditor = function(filePath) {
 };
 
 App.closeEditor = function() {
+    App.closeViewer();
     App.showEditorModal(false);
     App.editor.setValue('');
     App.currentEditingFilePath = '';
+    App.editorBase = null;
+};
+
+// Large files are shown read-only, a few windows of lines at a time. The
+// editor holds consecutive windows ("segments", each with its byte range
+// and line count); scrolling near either end fetches the adjacent window
+// and drops the one furthest away, so memory stays flat on both sides.
+App.viewerWindowLines = 1000;
+App.viewerMaxLines = 3000;
+App.viewerEdgeLines = 100;
+App.viewerFollowInterval = 2000; // ms
+
+App.openViewer = function(filePath) {
+    App.closeViewer();
+    App.currentEditingFilePath = filePath;
+    App.viewer = {
+        path: filePath,
+        segments: [],
+        firstLine: 0,
+        totalLines: null,
+        fileId: null,
+        loading: false,
+        followTimer: null
+    };
+    App.setViewerMode(true);
+    App.fetchWindow('offset=0').then(data => {
+        if (!data) {
+            return;
+        }
+        App.setViewerWindow(data);
+        App.showEditorModal(true);
+        App.setEditorLanguage(App.getFileExtension(filePath));
+    });
+};
+
+App.closeViewer = function() {
+    if (!App.viewer) {
+        return;
+    }
+    clearInterval(App.viewer.followTimer);
+    App.viewer = null;
+    App.setViewerMode(false);
+};
+
+App.setViewerMode = function(on) {
+    App.editor.updateOptions({
+        readOnly: on,
+        lineNumbers: on ? App.viewerLineNumber : 'on'
+    });
+    document.getElementById('save-editor-button').style.display = on ? 'none' : '';
+    const followButton = document.getElementById('follow-editor-button');
+    followButton.style.display = on ? '' : 'none';
+    followButton.textContent = 'Follow';
+};
+
+App.viewerLineNumber = function(lineNumber) {
+    const viewer = App.viewer;
+    return viewer && viewer.firstLine !== null ? String(viewer.firstLine + lineNumber) : '';
+};
+
+App.fetchWindow = function(params) {
+    const viewer = App.viewer;
+    viewer.loading = true;
+    const url = `/api/file_window?path=${encodeURIComponent(viewer.path)}&lines=${App.viewerWindowLines}&${params}`;
+    return fetch(url, { cache: 'no-store' })
+        .then(response => response.json())
+        .then(data => {
+            viewer.loading = false;
+            if (App.viewer !== viewer) {
+                return null;
+            }
+            if (data.error) {
+                App.showToast(data.error);
+                return null;
+            }
+            return data;
+        })
+        .catch(error => {
+            viewer.loading = false;
+            console.error('Error fetching file window:', error);
+            App.showToast('An error occurred while reading the file.');
+            return null;
+        });
+};
+
+App.countLines = function(text) {
+    return (text.match(/\n/g) || []).length;
+};
+
+App.viewerStart = function() {
+    return App.viewer.segments[0].start;
+};
+
+App.viewerEnd = function() {
+    const segments = App.viewer.segments;
+    return segments[segments.length - 1].end;
+};
+
+App.updateViewerInfo = function(data) {
+    const viewer = App.viewer;
+    viewer.fileId = data.file_id;
+    if (data.total_lines !== null) {
+        viewer.totalLines = data.total_lines;
+    }
+    viewer.bof = App.viewerStart() === 0;
+    viewer.eof = App.viewerEnd() >= data.size;
+};
+
+App.setViewerWindow = function(data) {
+    const viewer = App.viewer;
+    viewer.segments = [{ start: data.offset, end: data.end, lines: App.countLines(data.text) }];
+    viewer.firstLine = data.first_line;
+    App.updateViewerInfo(data);
+    App.editor.setValue(data.text);
+    // Re-render line numbers for the new first line
+    App.editor.updateOptions({ lineNumbers: App.viewerLineNumber });
+};
+
+App.appendWindow = function(data) {
+    const viewer = App.viewer;
+    const model = App.editor.getModel();
+    const last = model.getLineCount();
+    const column = model.getLineMaxColumn(last);
+    model.applyEdits([{ range: new monaco.Range(last, column, last, column), text: data.text }]);
+    viewer.segments.push({ start: data.offset, end: data.end, lines: App.countLines(data.text) });
+
+    const lineHeight = App.editor.getOption(monaco.editor.EditorOption.lineHeight);
+    while (viewer.segments.length > 1 && model.getLineCount() > App.viewerMaxLines) {
+        const dropped = viewer.segments.shift();
+        model.applyEdits([{ range: new monaco.Range(1, 1, dropped.lines + 1, 1), text: '' }]);
+        if (viewer.firstLine !== null) {
+            viewer.firstLine += dropped.lines;
+        }
+        App.editor.setScrollTop(App.editor.getScrollTop() - dropped.lines * lineHeight);
+    }
+    App.updateViewerInfo(data);
+    App.editor.updateOptions({ lineNumbers: App.viewerLineNumber });
+};
+
+App.prependWindow = function(data) {
+    const viewer = App.viewer;
+    const model = App.editor.getModel();
+    const lines = App.countLines(data.text);
+    model.applyEdits([{ range: new monaco.Range(1, 1, 1, 1), text: data.text }]);
+    viewer.segments.unshift({ start: data.offset, end: data.end, lines: lines });
+    viewer.firstLine = data.first_line !== null ? data.first_line
+        : (viewer.firstLine !== null ? viewer.firstLine - lines : null);
+
+    const lineHeight = App.editor.getOption(monaco.editor.EditorOption.lineHeight);
+    App.editor.setScrollTop(App.editor.getScrollTop() + lines * lineHeight);
+    while (viewer.segments.length > 1 && model.getLineCount() > App.viewerMaxLines) {
+        const dropped = viewer.segments.pop();
+        // The dropped window starts on the line after the previous window's last newline
+        const last = model.getLineCount();
+        model.applyEdits([{
+            range: new monaco.Range(last - dropped.lines, 1, last, model.getLineMaxColumn(last)),
+            text: ''
+        }]);
+    }
+    App.updateViewerInfo(data);
+    App.editor.updateOptions({ lineNumbers: App.viewerLineNumber });
+};
+
+App.onViewerScroll = function() {
+    const viewer = App.viewer;
+    if (!viewer || viewer.loading || viewer.followTimer || !viewer.segments.length) {
+        return;
+    }
+    const ranges = App.editor.getVisibleRanges();
+    if (!ranges.length) {
+        return;
+    }
+    const top = ranges[0].startLineNumber;
+    const bottom = ranges[ranges.length - 1].endLineNumber;
+    const count = App.editor.getModel().getLineCount();
+
+    if (bottom > count - App.viewerEdgeLines && !viewer.eof) {
+        App.fetchWindow(`offset=${App.viewerEnd()}&file_id=${viewer.fileId}`).then(data => {
+            if (data && data.reset) {
+                App.showToast('The file was replaced; reloading it.');
+                App.openViewer(viewer.path);
+            } else if (data) {
+                App.appendWindow(data);
+            }
+        });
+    } else if (top < App.viewerEdgeLines && !viewer.bof) {
+        App.fetchWindow(`before=${App.viewerStart()}&file_id=${viewer.fileId}`).then(data => {
+            if (data && data.reset) {
+                App.showToast('The file was replaced; reloading it.');
+                App.openViewer(viewer.path);
+            } else if (data) {
+                App.prependWindow(data);
+            }
+        });
+    }
+};
+
+App.viewerGoToLine = function() {
+    const viewer = App.viewer;
+    if (!viewer) {
+        App.editor.trigger('viewer', 'editor.action.gotoLine');
+        return;
+    }
+    const target = parseInt(prompt(viewer.totalLines ? `Line (1-${viewer.totalLines})` : 'Line'), 10);
+    if (!(target > 0)) {
+        return;
+    }
+    const line = Math.max(0, target - 1 - Math.floor(App.viewerWindowLines / 2));
+    App.fetchWindow(`line=${line}`).then(data => {
+        if (!data) {
+            return;
+        }
+        App.setViewerWindow(data);
+        App.editor.revealLineInCenter(target - data.first_line);
+    });
+};
+
+App.toggleFollow = function() {
+    const viewer = App.viewer;
+    if (!viewer) {
+        return;
+    }
+    const followButton = document.getElementById('follow-editor-button');
+    if (viewer.followTimer) {
+        clearInterval(viewer.followTimer);
+        viewer.followTimer = null;
+        followButton.textContent = 'Follow';
+        return;
+    }
+    followButton.textContent = 'Stop following';
+    App.fetchWindow('tail').then(data => {
+        if (!data || App.viewer !== viewer) {
+            return;
+        }
+        App.setViewerWindow(data);
+        App.editor.revealLine(App.editor.getModel().getLineCount());
+        viewer.followTimer = setInterval(App.pollFollow, App.viewerFollowInterval);
+    });
+};
+
+App.pollFollow = function() {
+    const viewer = App.viewer;
+    if (!viewer || viewer.loading) {
+        return;
+    }
+    App.fetchWindow(`offset=${App.viewerEnd()}&file_id=${viewer.fileId}`).then(data => {
+        if (!data) {
+            return;
+        }
+        if (data.reset) {
+            // Rotated or truncated: start again from the new file's tail
+            App.fetchWindow('tail').then(tail => tail && App.setViewerWindow(tail));
+            return;
+        }
+        if (data.text) {
+            App.appendWindow(data);
+            App.editor.revealLine(App.editor.getModel().getLineCount());
+        }
+    });
 };
 
 App.showEditorModal = function(show) {
@@ -48,27 +330,95 @@ App.showEditorModal = function(show) {
     }
 };
 
+App.diffMaxCost = 1000; // edit distance above which changed lines are sent as one hunk
+
+// Line edits turning `a` into `b`, as [{start, end, lines}] replacing a[start..end)
+// with `lines`. The common prefix and suffix are trimmed and the middle is
+// diffed with Myers' algorithm, falling back to one hunk past diffMaxCost.
+App.diffLines = function(a, b) {
+    let head = 0;
+    while (head < a.length && head < b.length && a[head] === b[head]) head++;
+    let tail = 0;
+    while (tail < a.length - head && tail < b.length - head
+            && a[a.length - 1 - tail] === b[b.length - 1 - tail]) tail++;
+    const n = a.length - head - tail;
+    const m = b.length - head - tail;
+    if (n === 0 && m === 0) return [];
+
+    // v[k + max] is the furthest x reached on diagonal k; trace keeps it before each cost
+    const max = Math.min(n + m, App.diffMaxCost);
+    const v = new Int32Array(2 * max + 2);
+    const trace = [];
+    let cost = -1;
+    search:
+    for (let d = 0; d <= max; d++) {
+        trace.push(v.slice());
+        for (let k = -d; k <= d; k += 2) {
+            let x = (k === -d || (k !== d && v[k - 1 + max] < v[k + 1 + max]))
+                ? v[k + 1 + max] : v[k - 1 + max] + 1;
+            let y = x - k;
+            while (x < n && y < m && a[head + x] === b[head + y]) { x++; y++; }
+            v[k + max] = x;
+            if (x >= n && y >= m) { cost = d; break search; }
+        }
+    }
+    if (cost < 0) return [{ start: head, end: head + n, lines: b.slice(head, head + m) }];
+
+    // Walk back from (n, m), merging adjacent deletions and insertions into hunks
+    const hunks = [];
+    let x = n, y = m;
+    for (let d = cost; d > 0; d--) {
+        const prev = trace[d];
+        const k = x - y;
+        const inserted = k === -d || (k !== d && prev[k - 1 + max] < prev[k + 1 + max]);
+        const prevK = inserted ? k + 1 : k - 1;
+        const prevX = prev[prevK + max];
+        const prevY = prevX - prevK;
+        const last = hunks[hunks.length - 1];
+        if (inserted) {
+            if (last && last.start === prevX) last.lines.unshift(b[head + prevY]);
+            else hunks.push({ start: prevX, end: prevX, lines: [b[head + prevY]] });
+        } else {
+            if (last && last.start === prevX + 1) last.start = prevX;
+            else hunks.push({ start: prevX, end: prevX + 1, lines: [] });
+        }
+        x = prevX;
+        y = prevY;
+    }
+    return hunks.reverse().map(h => ({ start: head + h.start, end: head + h.end, lines: h.lines }));
+};
+
 App.saveEditor = function() {
+    if (App.viewer) {
+        App.showToast('Large files are opened read-only.');
+        return;
+    }
     const editedContent = App.editor.getValue();
+    const base = App.editorBase;
+    // Only the changed lines are sent; the server applies them to the version we opened
+    const body = base && base.version
+        ? { path: App.currentEditingFilePath, base_version: base.version,
+            edits: App.diffLines(base.lines, editedContent.split('\n')) }
+        : { path: App.currentEditingFilePath, content: editedContent };
     fetch('/api/save_file_content', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
             'X-CSRFToken': App.getCSRFToken()
         },
-        body: JSON.stringify({
-            path: App.currentEditingFilePath,
-            content: editedContent
-        }),
+        body: JSON.stringify(body),
     })
-    .then(response => response.json())
-    .then(data => {
-        if (data.error) {
+    .then(response => response.json().then(data => ({ status: response.status, data })))
+    .then(({ status, data }) => {
+        if (status === 409) {
+            // Keep the editor open so the changes can be copied before reopening the file
+            App.showToast('The file was changed by someone else since you opened it. Copy your changes and reopen it.', 'danger');
+        } else if (data.error) {
             App.showToast(data.error);
         } else {
             App.showToast('File saved successfully.');
             App.closeEditor();
-            App.loadDirectory(App.currentPath);
+            App.refreshDirectory();
         }
     })
     .catch(error => {
@@ -0,0 +1,159 @@
+// Web Worker hashing files for upload deduplication, so large files are read
+// and hashed off the main thread. Computes BLAKE2b (RFC 7693) with a 20-byte
+// digest, the same digest the server's hash cache stores. BLAKE2b works on
+// 64-bit words, kept here as pairs of 32-bit halves, low half first.
+//
+// Messages in: { id, file }. Messages out: { id, loaded } while reading,
+// then { id, digest: 'blake2b:<hex>' } or { id, error }.
+
+const DIGEST_SIZE = 20;
+const READ_SIZE = 4 * 1024 * 1024;
+
+const IV = new Uint32Array([
+    0xF3BCC908, 0x6A09E667, 0x84CAA73B, 0xBB67AE85, 0xFE94F82B, 0x3C6EF372, 0x5F1D36F1, 0xA54FF53A,
+    0xADE682D1, 0x510E527F, 0x2B3E6C1F, 0x9B05688C, 0xFB41BD6B, 0x1F83D9AB, 0x137E2179, 0x5BE0CD19
+]);
+
+// Message word order of each round, doubled to index the 32-bit halves
+const SIGMA = [
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15],
+    [14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3],
+    [11, 8, 12, 0, 5, 2, 15, 13, 10, 14, 3, 6, 7, 1, 9, 4],
+    [7, 9, 3, 1, 13, 12, 11, 14, 2, 6, 5, 10, 4, 0, 15, 8],
+    [9, 0, 5, 7, 2, 4, 10, 15, 14, 1, 11, 12, 6, 8, 3, 13],
+    [2, 12, 6, 10, 0, 11, 8, 3, 4, 13, 7, 5, 15, 14, 1, 9],
+    [12, 5, 1, 15, 14, 13, 4, 10, 0, 7, 6, 3, 9, 2, 8, 11],
+    [13, 11, 7, 14, 12, 1, 3, 9, 5, 0, 15, 4, 8, 6, 2, 10],
+    [6, 15, 14, 9, 11, 3, 0, 8, 12, 2, 13, 7, 1, 4, 10, 5],
+    [10, 2, 8, 4, 7, 6, 1, 5, 15, 11, 9, 14, 3, 12, 13, 0]
+].map(row => row.map(index => index * 2));
+
+const v = new Uint32Array(32);
+const m = new Uint32Array(32);
+
+// v[a] += v[b], as 64-bit words
+function add64(a, b) {
+    const x = v[a];
+    const low = (x + v[b]) >>> 0;
+    v[a + 1] = (v[a + 1] + v[b + 1] + (low < x ? 1 : 0)) >>> 0;
+    v[a] = low;
+}
+
+// v[a] += m[i]
+function add64Message(a, i) {
+    const x = v[a];
+    const low = (x + m[i]) >>> 0;
+    v[a + 1] = (v[a + 1] + m[i + 1] + (low < x ? 1 : 0)) >>> 0;
+    v[a] = low;
+}
+
+function mix(a, b, c, d, x, y) {
+    add64(a, b);
+    add64Message(a, x);
+    let low = v[d] ^ v[a], high = v[d + 1] ^ v[a + 1];
+    v[d] = high;  // rotate right 32
+    v[d + 1] = low;
+    add64(c, d);
+    low = v[b] ^ v[c]; high = v[b + 1] ^ v[c + 1];
+    v[b] = (low >>> 24) ^ (high << 8);  // rotate right 24
+    v[b + 1] = (high >>> 24) ^ (low << 8);
+    add64(a, b);
+    add64Message(a, y);
+    low = v[d] ^ v[a]; high = v[d + 1] ^ v[a + 1];
+    v[d] = (low >>> 16) ^ (high << 16);  // rotate right 16
+    v[d + 1] = (high >>> 16) ^ (low << 16);
+    add64(c, d);
+    low = v[b] ^ v[c]; high = v[b + 1] ^ v[c + 1];
+    v[b] = (high >>> 31) ^ (low << 1);  // rotate right 63
+    v[b + 1] = (low >>> 31) ^ (high << 1);
+}
+
+function compress(state, block, offset, last) {
+    const h = state.h;
+    for (let i = 0; i < 16; i++) {
+        v[i] = h[i];
+        v[i + 16] = IV[i];
+    }
+    v[24] ^= state.count % 0x100000000;
+    v[25] ^= Math.floor(state.count / 0x100000000);
+    if (last) {
+        v[28] = ~v[28];
+        v[29] = ~v[29];
+    }
+    for (let i = 0; i < 32; i++) {
+        const j = offset + i * 4;
+        m[i] = block[j] ^ (block[j + 1] << 8) ^ (block[j + 2] << 16) ^ (block[j + 3] << 24);
+    }
+    for (let round = 0; round < 12; round++) {
+        const s = SIGMA[round % 10];
+        mix(0, 8, 16, 24, s[0], s[1]);
+        mix(2, 10, 18, 26, s[2], s[3]);
+        mix(4, 12, 20, 28, s[4], s[5]);
+        mix(6, 14, 22, 30, s[6], s[7]);
+        mix(0, 10, 20, 30, s[8], s[9]);
+        mix(2, 12, 22, 24, s[10], s[11]);
+        mix(4, 14, 16, 26, s[12], s[13]);
+        mix(6, 8, 18, 28, s[14], s[15]);
+    }
+    for (let i = 0; i < 16; i++) {
+        h[i] = h[i] ^ v[i] ^ v[i + 16];
+    }
+}
+
+function blake2bInit() {
+    const h = new Uint32Array(IV);
+    h[0] ^= 0x01010000 ^ DIGEST_SIZE;  // no key, fanout and depth 1
+    return { h: h, buffer: new Uint8Array(128), filled: 0, count: 0 };
+}
+
+function blake2bUpdate(state, data) {
+    let offset = 0;
+    while (offset < data.length) {
+        // A full block is only compressed once more data follows, since the
+        // last block is compressed differently
+        if (state.filled === 128) {
+            state.count += 128;
+            compress(state, state.buffer, 0, false);
+            state.filled = 0;
+        }
+        if (state.filled === 0 && data.length - offset > 128) {
+            state.count += 128;
+            compress(state, data, offset, false);
+            offset += 128;
+            continue;
+        }
+        const take = Math.min(128 - state.filled, data.length - offset);
+        state.buffer.set(data.subarray(offset, offset + take), state.filled);
+        state.filled += take;
+        offset += take;
+    }
+}
+
+function blake2bDigest(state) {
+    state.count += state.filled;
+    state.buffer.fill(0, state.filled);
+    compress(state, state.buffer, 0, true);
+    let hex = '';
+    for (let i = 0; i < DIGEST_SIZE; i++) {
+        const byte = (state.h[i >> 2] >>> (8 * (i & 3))) & 0xFF;
+        hex += byte.toString(16).padStart(2, '0');
+    }
+    return hex;
+}
+
+async function hashFile(id, file) {
+    const state = blake2bInit();
+    for (let offset = 0; offset < file.size; offset += READ_SIZE) {
+        const data = new Uint8Array(await file.slice(offset, offset + READ_SIZE).arrayBuffer());
+        blake2bUpdate(state, data);
+        self.postMessage({ id: id, loaded: offset + data.length });
+    }
+    return 'blake2b:' + blake2bDigest(state);
+}
+
+self.onmessage = function(event) {
+    const { id, file } = event.data;
+    hashFile(id, file)
+        .then(digest => self.postMessage({ id: id, digest: digest }))
+        .catch(error => self.postMessage({ id: id, error: error.message || String(error) }));
+};
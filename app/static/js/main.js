@@ -4,17 +4,30 @@ Object.assign(App, {
     currentPath: '',
     allDirectories: [],
     allFiles: [],
+    directorySizes: {},
     currentSort: 'name_asc',
+    pageSize: 500,
+    nextCursor: null,
+    totalItems: 0,
+    isLoadingMore: false,
     currentSearch: '',
     isGlobalSearch: false,
+    searchController: null,
     selectedItems: new Set(),
     navigationHistory: [],
     editor: null,
     currentEditingFilePath: '',
     selectedDestinationPath: '',
+    destinationAction: 'move',
 
     activeUploadXHRs: {},
     activeDownloadXHRs: {},
+    activeJobs: {},
+    hashPool: null,
+    changeSource: null,
+    changeSourcePath: null,
+    changeFeedLive: false,
+    jobPollInterval: 1000,
 });
 
 document.addEventListener('DOMContentLoaded', () => {
@@ -24,6 +37,7 @@ document.addEventListener('DOMContentLoaded', () => {
     App.setupEditor();
     App.setupProgressTray();
     App.setupHamburgerMenu();
+    App.restoreJobs();
 });
 
 App.setupNavigationButtons = function() {
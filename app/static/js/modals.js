@@ -1,5 +1,7 @@
-App.openDestinationModal = function() {
+App.openDestinationModal = function(action = 'move') {
+    App.destinationAction = action;
     App.selectedDestinationPath = App.currentPath; 
+    document.getElementById('confirm-move-button').textContent = App.transferActions[action].title;
     document.getElementById('destination-modal').style.display = 'block';
     App.loadDestinationFolders(App.selectedDestinationPath);
     App.updateDestinationBreadcrumb(App.selectedDestinationPath);
@@ -11,8 +13,7 @@ App.closeDestinationModal = function() {
 };
 
 App.loadDestinationFolders = function(path) {
-    fetch(`/api/list?path=${encodeURIComponent(path)}`)
-        .then(response => response.json())
+    App.fetchJSON(`/api/list?path=${encodeURIComponent(path)}`)
         .then(data => {
             if (data.error) {
                 App.showToast(data.error);
@@ -166,7 +167,7 @@ App.submitAddFolder = function() {
             App.showToast(`Error: ${data.error}`);
         } else {
             App.showToast('Folder created successfully.');
-            App.loadDirectory(App.currentPath);
+            App.refreshDirectory();
             App.closeAddFolderModal();
         }
     })
@@ -213,7 +214,7 @@ App.submitAddFile = function() {
             App.showToast(`Error: ${data.error}`);
         } else {
             App.showToast('File created successfully.');
-            App.loadDirectory(App.currentPath);
+            App.refreshDirectory();
             App.closeAddFileModal();
         }
     })
@@ -226,17 +227,31 @@ App.submitAddFile = function() {
     });
 };
 
+App.transferActions = {
+    move: { endpoint: '/api/move_items', verb: 'move', past: 'moved', progressive: 'Moving', title: 'Confirm Move' },
+    copy: { endpoint: '/api/copy_items', verb: 'copy', past: 'copied', progressive: 'Copying', title: 'Confirm Copy' }
+};
+
+App.confirmDestination = function() {
+    App.confirmTransfer(App.destinationAction);
+};
+
 App.confirmMove = function() {
+    App.confirmTransfer('move');
+};
+
+App.confirmTransfer = function(action) {
+    const transfer = App.transferActions[action];
     if (App.selectedDestinationPath === null || App.selectedDestinationPath === undefined) {
         App.showToast('Please select a destination folder.');
         return;
     }
 
-    App.showConfirmation(`Are you sure you want to move ${App.selectedItems.size} item(s) to "${App.selectedDestinationPath || 'Root'}"?`, 'Confirm Move')
+    App.showConfirmation(`Are you sure you want to ${transfer.verb} ${App.selectedItems.size} item(s) to "${App.selectedDestinationPath || 'Root'}"?`, transfer.title)
         .then(() => {
             App.showLoading(true);
 
-            return fetch('/api/move_items', {
+            return fetch(transfer.endpoint, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -249,19 +264,35 @@ App.confirmMove = function() {
             });
         })
         .then(response => {
-            if (response.status === 207) {
+            if (response.status === 202) {
+                return response.json().then(data => {
+                    if (data.errors.length > 0) {
+                        let errorMsg = `Some items could not be ${transfer.past}:\n`;
+                        data.errors.forEach(err => {
+                            errorMsg += `- ${err.path}: ${err.error}\n`;
+                        });
+                        App.showToast(errorMsg, 'danger');
+                    }
+                    App.showToast(`${transfer.progressive} items in the background.`, 'info');
+                    App.trackJob(data.job, action, App.refreshDirectory);
+                    App.refreshDirectory();
+                    App.closeDestinationModal();
+                    App.selectedItems.clear();
+                    App.updateSelectedItemsPanel();
+                });
+            } else if (response.status === 207) {
                 return response.json().then(data => {
-                    if (data.moved.length > 0) {
-                        App.showToast(`Successfully moved ${data.moved.length} item(s).`, 'success');
+                    if (data[transfer.past].length > 0) {
+                        App.showToast(`Successfully ${transfer.past} ${data[transfer.past].length} item(s).`, 'success');
                     }
                     if (data.errors.length > 0) {
-                        let errorMsg = 'Some items could not be moved:\n';
+                        let errorMsg = `Some items could not be ${transfer.past}:\n`;
                         data.errors.forEach(err => {
                             errorMsg += `- ${err.path}: ${err.error}\n`;
                         });
                         App.showToast(errorMsg, 'danger');
                     }
-                    App.loadDirectory(App.currentPath);
+                    App.refreshDirectory();
                     App.closeDestinationModal();
                     App.selectedItems.clear();
                     App.updateSelectedItemsPanel();
@@ -271,7 +302,7 @@ App.confirmMove = function() {
             } else {
                 return response.json().then(data => {
                     App.showToast(data.message, 'success');
-                    App.loadDirectory(App.currentPath);
+                    App.refreshDirectory();
                     App.closeDestinationModal();
                     App.selectedItems.clear();
                     App.updateSelectedItemsPanel();
@@ -279,8 +310,8 @@ App.confirmMove = function() {
             }
         })
         .catch(error => {
-            console.error('Error moving items:', error);
-            App.showToast(error.error || 'An error occurred while moving the items.', 'danger');
+            console.error(`Error during ${transfer.verb}:`, error);
+            App.showToast(error.error || `An error occurred while trying to ${transfer.verb} the items.`, 'danger');
         })
         .finally(() => {
             App.showLoading(false);
@@ -315,3 +346,58 @@ App.showConfirmation = function(message, title = 'Confirm Action') {
 };
 
 
+
+App.openLargestFoldersModal = function() {
+    document.getElementById('largest-folders-modal').style.display = 'block';
+    const list = document.getElementById('largest-folders-list');
+    list.innerHTML = '';
+    document.getElementById('largest-folders-title').textContent =
+        `Largest Folders in ${App.currentPath ? '/' + App.currentPath : 'Root'}`;
+
+    App.fetchJSON(`/api/largest_folders?path=${encodeURIComponent(App.currentPath)}&limit=20`)
+        .then(data => {
+            if (data.error) {
+                App.showToast(data.error, 'warning');
+                return;
+            }
+            if (data.folders.length === 0) {
+                const emptyItem = document.createElement('li');
+                emptyItem.className = 'file-list-item';
+                emptyItem.textContent = 'No folders found.';
+                list.appendChild(emptyItem);
+                return;
+            }
+            data.folders.forEach(folder => {
+                const listItem = document.createElement('li');
+                listItem.className = 'file-list-item';
+
+                const link = document.createElement('a');
+                link.href = '#';
+                link.className = 'file-link';
+                link.innerHTML = `<i class="bi bi-folder-fill file-icon"></i> `;
+                link.appendChild(document.createTextNode(folder.path));
+                link.addEventListener('click', (e) => {
+                    e.preventDefault();
+                    App.closeLargestFoldersModal();
+                    App.navigationHistory.push(App.currentPath);
+                    App.loadDirectory(folder.path);
+                });
+
+                const details = document.createElement('div');
+                details.className = 'file-details';
+                details.textContent = `${App.formatSize(folder.size)} | ${folder.files} file(s) | ${folder.folders} folder(s)`;
+
+                listItem.appendChild(link);
+                listItem.appendChild(details);
+                list.appendChild(listItem);
+            });
+        })
+        .catch(error => {
+            console.error('Error loading largest folders:', error);
+            App.showToast('An error occurred while loading folder sizes.', 'danger');
+        });
+};
+
+App.closeLargestFoldersModal = function() {
+    document.getElementById('largest-folders-modal').style.display = 'none';
+};
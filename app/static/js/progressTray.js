@@ -98,3 +98,108 @@ App.removeProgressBar = function(id) {
         toggleButton.innerHTML = '<i class="bi bi-chevron-up"></i> Show Progress';
     }
 };
+
+App.jobProgress = function(job) {
+    if (job.bytes_total) {
+        return Math.min(100, Math.round((job.bytes_done / job.bytes_total) * 100));
+    }
+    if (job.items_total) {
+        return Math.min(100, Math.round((job.items_done / job.items_total) * 100));
+    }
+    return null;
+};
+
+App.trackJob = function(job, type, onDone) {
+    const id = job.id;
+    if (App.activeJobs[id]) {
+        return;
+    }
+    App.addProgressBar(id, type, job.description, true);
+    App.activeJobs[id] = { onDone: onDone, timer: null };
+
+    const poll = () => {
+        fetch(`/api/jobs/${id}`, { cache: 'no-store' })
+            .then(response => {
+                if (!response.ok) {
+                    return response.json().then(data => { throw data; });
+                }
+                return response.json();
+            })
+            .then(data => {
+                if (!App.activeJobs[id]) {
+                    return;
+                }
+                const progress = App.jobProgress(data);
+                App.updateProgressBar(id, progress, progress === null);
+
+                if (data.status === 'completed' || data.status === 'failed' || data.status === 'cancelled') {
+                    App.finishJob(data);
+                } else {
+                    App.activeJobs[id].timer = setTimeout(poll, App.jobPollInterval);
+                }
+            })
+            .catch(error => {
+                console.error('Error polling job:', error);
+                App.removeProgressBar(id);
+                delete App.activeJobs[id];
+            });
+    };
+    poll();
+};
+
+App.finishJob = function(job) {
+    const tracked = App.activeJobs[job.id];
+    delete App.activeJobs[job.id];
+    App.removeProgressBar(job.id);
+
+    if (job.status === 'completed') {
+        if (job.errors && job.errors.length > 0) {
+            let errorMessage = `${job.description} finished with errors:\n`;
+            job.errors.forEach(err => {
+                errorMessage += `- ${err.path}: ${err.error}\n`;
+            });
+            App.showToast(errorMessage, 'warning');
+        } else {
+            App.showToast(`${job.description} completed.`, 'success');
+        }
+        if (job.result && job.result.download_url) {
+            window.location.href = job.result.download_url;
+        }
+    } else if (job.status === 'cancelled') {
+        App.showToast(`${job.description} was canceled.`, 'warning');
+    } else {
+        App.showToast(`${job.description} failed: ${job.error}`, 'danger');
+    }
+
+    if (tracked && tracked.onDone) {
+        tracked.onDone(job);
+    }
+};
+
+App.cancelJob = function(id) {
+    fetch(`/api/jobs/${id}/cancel`, {
+        method: 'POST',
+        headers: { 'X-CSRFToken': App.getCSRFToken() }
+    })
+        .then(response => {
+            if (!response.ok) {
+                return response.json().then(data => { throw data; });
+            }
+            App.showToast('Canceling operation...', 'info');
+        })
+        .catch(error => {
+            console.error('Error canceling job:', error);
+            App.showToast(error.error || 'Could not cancel the operation.', 'danger');
+        });
+};
+
+App.restoreJobs = function() {
+    fetch('/api/jobs?active=1', { cache: 'no-store' })
+        .then(response => response.ok ? response.json() : { jobs: [] })
+        .then(data => {
+            data.jobs.forEach(job => {
+                App.trackJob(job, job.type, App.refreshDirectory);
+            });
+        })
+        .catch(error => console.error('Error loading jobs:', error));
+};
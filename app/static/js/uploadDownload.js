@@ -33,7 +33,9 @@ App.performAction = function(action) {
     } else if (action === 'edit') {
         App.editSelectedItem(paths);
     } else if (action === 'move') {
-        App.openDestinationModal();
+        App.openDestinationModal('move');
+    } else if (action === 'copy') {
+        App.openDestinationModal('copy');
     }
 };
 
@@ -70,7 +72,9 @@ App.downloadSingleFile = function(path) {
 };
 
 App.downloadMultipleItems = function(paths) {
-    if (App.isIOS()) {
+    if (App.resumableDownloads) {
+        App.downloadViaLink(paths);
+    } else if (App.isIOS()) {
         App.downloadViaForm(paths, 'download-multiple');
     } else {
         App.downloadMultipleItemsXHR(paths);
@@ -78,14 +82,37 @@ App.downloadMultipleItems = function(paths) {
 };
 
 App.downloadAll = function() {
-    const allPaths = App.allFiles.map(file => file.path).concat(App.allDirectories);
-    if (App.isIOS()) {
+    // The listing is loaded a page at a time, so archive the directory itself
+    // rather than the entries shown so far; '' is the whole volume.
+    const allPaths = [App.currentPath];
+    if (App.resumableDownloads) {
+        App.downloadViaLink(allPaths);
+    } else if (App.isIOS()) {
         App.downloadViaForm(allPaths, 'download-all');
     } else {
         App.downloadMultipleItemsXHR(allPaths);
     }
 };
 
+// Archives are served from a GET link, so the browser's own download
+// manager shows progress and can pause, resume or retry them.
+App.resumableDownloads = true;
+
+App.downloadViaLink = function(paths) {
+    App.uploadRequest('POST', '/download_link', { selected_paths: paths })
+        .then(data => {
+            const link = document.createElement('a');
+            link.href = data.url;
+            document.body.appendChild(link);
+            link.click();
+            document.body.removeChild(link);
+            App.showToast('Your download should begin shortly. Please check your downloads.');
+        })
+        .catch(error => {
+            App.showToast(`Error: ${error.message}`);
+        });
+};
+
 App.downloadSingleFileXHR = function(path) {
     const id = App.generateUniqueId();
     App.addProgressBar(id, 'download', path.split('/').pop());
@@ -127,7 +154,7 @@ App.downloadSingleFileXHR = function(path) {
             a.remove();
             window.URL.revokeObjectURL(url);
             App.showToast('Download completed successfully.');
-            App.loadDirectory(App.currentPath);
+            App.refreshDirectory();
         } else {
             try {
                 const response = JSON.parse(xhr.responseText);
@@ -196,7 +223,7 @@ App.downloadMultipleItemsXHR = function(paths) {
             a.remove();
             window.URL.revokeObjectURL(url);
             App.showToast('Download completed successfully.');
-            App.loadDirectory(App.currentPath);
+            App.refreshDirectory();
         } else {
             try {
                 const response = JSON.parse(xhr.responseText);
@@ -257,152 +284,414 @@ App.downloadViaForm = function(paths, formId) {
     App.showToast('Your download should begin shortly. Please check your downloads.');
 };
 
-App.uploadFiles = function() {
-    const input = document.getElementById('upload-file-input');
-    const files = input.files;
-    if (files.length === 0) {
-        App.showToast('Please select at least one file to upload.');
-        return;
+App.uploadChunkSize = 8 * 1024 * 1024;
+App.uploadParallelChunks = 4;
+App.uploadParallelFiles = 2;
+App.uploadChunkRetries = 3;
+
+App.uploadRequest = function(method, url, body) {
+    const options = {
+        method: method,
+        headers: { 'X-CSRFToken': App.getCSRFToken() }
+    };
+    if (body !== undefined) {
+        options.headers['Content-Type'] = 'application/json';
+        options.body = JSON.stringify(body);
     }
+    return fetch(url, options).then(response => {
+        return response.json().then(data => {
+            if (!response.ok) {
+                throw new Error(data.error || 'Upload request failed.');
+            }
+            return data;
+        });
+    });
+};
+
+App.resumeOrCreateUpload = function(storageKey, file, relativePath, targetPath) {
+    const create = () => App.uploadRequest('POST', '/uploads', {
+        path: targetPath,
+        filename: relativePath,
+        size: file.size,
+        chunk_size: App.uploadChunkSize
+    }).then(session => {
+        localStorage.setItem(storageKey, session.id);
+        return session;
+    });
 
-    for (let i = 0; i < files.length; i++) {
-        const file = files[i];
-        const id = App.generateUniqueId();
-        App.addProgressBar(id, 'upload', file.name);
+    const previousId = localStorage.getItem(storageKey);
+    if (!previousId) {
+        return create();
+    }
+    return App.uploadRequest('GET', `/uploads/${previousId}`).catch(() => {
+        localStorage.removeItem(storageKey);
+        return create();
+    });
+};
 
-        const formData = new FormData();
-        formData.append('files', file);
-        formData.append('path', App.currentPath);
+App.sendChunk = function(upload, session, file, index, onProgress, attempt = 1) {
+    const start = index * session.chunk_size;
+    const end = Math.min(start + session.chunk_size, session.size);
 
+    return new Promise((resolve, reject) => {
         const xhr = new XMLHttpRequest();
-        App.activeUploadXHRs[id] = xhr;
-        xhr.open('POST', '/upload', true);
-
+        upload.xhrs.add(xhr);
+        xhr.open('PUT', `/uploads/${session.id}/chunks/${index}`, true);
         App.setCSRFHeader(xhr);
+        xhr.setRequestHeader('Content-Type', 'application/octet-stream');
 
         xhr.upload.onprogress = function(event) {
-            if (event.lengthComputable) {
-                const percentComplete = ((event.loaded / event.total) * 100).toFixed(2);
-                App.updateProgressBar(id, percentComplete, false);
-            } else {
-                App.updateProgressBar(id, 0, true);
-            }
+            onProgress(event.loaded);
         };
-
         xhr.onload = function() {
+            upload.xhrs.delete(xhr);
             if (xhr.status === 200) {
-                const response = JSON.parse(xhr.responseText);
-                if (response.error) {
-                    App.showToast(`Error uploading ${file.name}: ${response.error}`);
-                } else {
-                    App.showToast(`File "${file.name}" uploaded successfully.`);
-                    App.loadDirectory(App.currentPath);
-                }
-            } else {
-                try {
-                    const response = JSON.parse(xhr.responseText);
-                    App.showToast(`Error uploading ${file.name}: ${response.error}`);
-                } catch (e) {
-                    App.showToast(`An error occurred during the upload of "${file.name}".`);
-                }
+                resolve(end - start);
+                return;
             }
-            App.removeProgressBar(id);
-            delete App.activeUploadXHRs[id];
+            let message = `Chunk ${index} was rejected.`;
+            try {
+                message = JSON.parse(xhr.responseText).error || message;
+            } catch (e) {}
+            reject(new Error(message));
         };
-
         xhr.onerror = function() {
-            App.showToast(`An error occurred during the upload of "${file.name}".`);
-            App.removeProgressBar(id);
-            delete App.activeUploadXHRs[id];
+            upload.xhrs.delete(xhr);
+            reject(new Error('network'));
         };
-
         xhr.onabort = function() {
-            App.showToast(`Upload of "${file.name}" has been canceled.`);
+            upload.xhrs.delete(xhr);
+            reject(new Error('aborted'));
+        };
+        xhr.send(file.slice(start, end));
+    }).catch(error => {
+        if (error.message === 'network' && !upload.aborted && attempt < App.uploadChunkRetries) {
+            onProgress(0);
+            return new Promise(resolve => setTimeout(resolve, 1000 * attempt))
+                .then(() => App.sendChunk(upload, session, file, index, onProgress, attempt + 1));
+        }
+        throw error;
+    });
+};
+
+App.chunkedUpload = function(file, relativePath, targetPath, onProgress) {
+    // Upload one file as numbered chunks, several at a time. The session id
+    // is remembered in localStorage, so uploading the same file again after
+    // a dropped connection or a reload only sends the missing chunks.
+    const upload = { xhrs: new Set(), aborted: false, sessionId: null };
+    const storageKey = `upload:${targetPath}:${relativePath}:${file.size}:${file.lastModified}`;
+
+    // pause() keeps the server-side session so the upload can be resumed later
+    upload.pause = function() {
+        upload.aborted = true;
+        upload.xhrs.forEach(xhr => xhr.abort());
+    };
+
+    upload.abort = function() {
+        upload.pause();
+        if (upload.sessionId) {
+            App.uploadRequest('DELETE', `/uploads/${upload.sessionId}`).catch(() => {});
+            localStorage.removeItem(storageKey);
+        }
+    };
+
+    upload.promise = App.resumeOrCreateUpload(storageKey, file, relativePath, targetPath)
+        .then(session => {
+            upload.sessionId = session.id;
+            if (upload.aborted) {
+                upload.abort();
+                throw new Error('aborted');
+            }
+            const pending = session.missing.slice();
+            const inFlight = {};
+            let doneBytes = session.received.reduce((total, range) => total + range[1] - range[0], 0);
+
+            const report = () => {
+                const inFlightBytes = Object.values(inFlight).reduce((total, loaded) => total + loaded, 0);
+                onProgress(doneBytes + inFlightBytes, session.size);
+            };
+
+            const worker = () => {
+                if (upload.aborted) {
+                    return Promise.reject(new Error('aborted'));
+                }
+                const index = pending.shift();
+                if (index === undefined) {
+                    return Promise.resolve();
+                }
+                return App.sendChunk(upload, session, file, index, loaded => {
+                    inFlight[index] = loaded;
+                    report();
+                }).then(length => {
+                    delete inFlight[index];
+                    doneBytes += length;
+                    report();
+                    return worker();
+                });
+            };
+
+            report();
+            const workers = [];
+            for (let i = 0; i < App.uploadParallelChunks; i++) {
+                workers.push(worker());
+            }
+            return Promise.all(workers)
+                .then(() => App.uploadRequest('POST', `/uploads/${session.id}/commit`))
+                .then(result => {
+                    localStorage.removeItem(storageKey);
+                    return result;
+                });
+        });
+
+    return upload;
+};
+
+// Files the server already has are placed there instead of being sent:
+// the server names the files whose size matches one it knows, those are
+// hashed on Web Workers, and the digests decide which are duplicates.
+App.uploadDedup = true;
+App.uploadDedupMinSize = 4 * 1024 * 1024; // smaller files are cheaper to send than to hash
+App.uploadHashWorkers = 2;
+
+App.hashFile = function(file, onProgress) {
+    if (!App.hashPool) {
+        const meta = document.querySelector('meta[name="hash-worker"]');
+        const url = meta ? meta.getAttribute('content') : '/static/js/hashWorker.js';
+        const pool = { workers: [], pending: {}, lastId: 0 };
+        for (let i = 0; i < App.uploadHashWorkers; i++) {
+            const worker = new Worker(url);
+            worker.onmessage = event => {
+                const { id, loaded, digest, error } = event.data;
+                const request = pool.pending[id];
+                if (!request) {
+                    return;
+                }
+                if (loaded !== undefined) {
+                    request.onProgress(loaded);
+                    return;
+                }
+                delete pool.pending[id];
+                if (error) {
+                    request.reject(new Error(error));
+                } else {
+                    request.resolve(digest);
+                }
+            };
+            pool.workers.push(worker);
+        }
+        App.hashPool = pool;
+    }
+
+    const pool = App.hashPool;
+    return new Promise((resolve, reject) => {
+        const id = ++pool.lastId;
+        pool.pending[id] = { resolve: resolve, reject: reject, onProgress: onProgress };
+        pool.workers[id % pool.workers.length].postMessage({ id: id, file: file });
+    });
+};
+
+App.stopHashing = function() {
+    if (!App.hashPool) {
+        return;
+    }
+    App.hashPool.workers.forEach(worker => worker.terminate());
+    Object.values(App.hashPool.pending).forEach(request => request.reject(new Error('aborted')));
+    App.hashPool = null;
+};
+
+App.dedupUploads = function(entries, targetPath) {
+    // entries are { file, relativePath }; resolves with the set of entries
+    // that need no upload, or rejects with 'aborted' if the check is
+    // cancelled. Any other failure just means everything is uploaded.
+    const candidates = App.uploadDedup ? entries.filter(entry => entry.file.size >= App.uploadDedupMinSize) : [];
+    if (candidates.length === 0) {
+        return Promise.resolve(new Set());
+    }
+    const ask = list => App.uploadRequest('POST', '/uploads/dedup', {
+        path: targetPath,
+        files: list.map(entry => ({ filename: entry.relativePath, size: entry.file.size, digest: entry.digest }))
+    });
+
+    const id = App.generateUniqueId();
+    let toHash = [];
+    return ask(candidates)
+        .then(sizes => {
+            toHash = candidates.filter((entry, index) => sizes.files[index].status === 'hash');
+            if (toHash.length === 0) {
+                return { files: [], job: null };
+            }
+            App.addProgressBar(id, 'upload', 'Checking for files already on the server');
+            App.activeUploadXHRs[id] = { abort: App.stopHashing };
+            const totalBytes = toHash.reduce((total, entry) => total + entry.file.size, 0);
+            const hashedBytes = {};
+            return Promise.all(toHash.map(entry => App.hashFile(entry.file, loaded => {
+                hashedBytes[entry.relativePath] = loaded;
+                const hashed = Object.values(hashedBytes).reduce((total, bytes) => total + bytes, 0);
+                App.updateProgressBar(id, ((hashed / totalBytes) * 100).toFixed(2), false);
+            }).then(digest => {
+                entry.digest = digest;
+            }))).then(() => ask(toHash));
+        })
+        .then(digests => {
+            const skipped = new Set(toHash.filter((entry, index) => {
+                const status = digests.files[index].status;
+                return status === 'placed' || status === 'queued';
+            }));
+            if (digests.job) {
+                App.trackJob(digests.job, 'copy', App.refreshDirectory);
+            }
+            if (skipped.size) {
+                App.showToast(`${skipped.size} file(s) were already on the server and were added without uploading.`, 'success');
+                App.refreshDirectory();
+            }
+            return skipped;
+        })
+        .catch(error => {
+            if (error.message === 'aborted') {
+                throw error;
+            }
+            console.error('Error checking for duplicate uploads:', error);
+            return new Set();
+        })
+        .finally(() => {
             App.removeProgressBar(id);
             delete App.activeUploadXHRs[id];
-        };
+        });
+};
 
-        xhr.send(formData);
+App.uploadFiles = function() {
+    const input = document.getElementById('upload-file-input');
+    const files = Array.from(input.files);
+    if (files.length === 0) {
+        App.showToast('Please select at least one file to upload.');
+        return;
     }
+
+    const targetPath = App.currentPath;
+    const entries = files.map(file => ({ file: file, relativePath: file.name }));
+    App.dedupUploads(entries, targetPath).then(skipped => {
+        entries.filter(entry => !skipped.has(entry)).forEach(entry => App.uploadFile(entry.file, targetPath));
+    }, () => {});
     input.value = '';
 };
 
+App.uploadFile = function(file, targetPath) {
+    const id = App.generateUniqueId();
+    App.addProgressBar(id, 'upload', file.name);
+
+    const upload = App.chunkedUpload(file, file.name, targetPath, (loaded, total) => {
+        const percentComplete = total ? ((loaded / total) * 100).toFixed(2) : '100.00';
+        App.updateProgressBar(id, percentComplete, false);
+    });
+    App.activeUploadXHRs[id] = upload;
+
+    upload.promise
+        .then(() => {
+            App.showToast(`File "${file.name}" uploaded successfully.`);
+            App.refreshDirectory();
+        })
+        .catch(error => {
+            if (error.message === 'aborted') {
+                App.showToast(`Upload of "${file.name}" has been canceled.`);
+            } else if (error.message === 'network') {
+                App.showToast(`An error occurred during the upload of "${file.name}". Upload it again to resume.`);
+            } else {
+                App.showToast(`Error uploading ${file.name}: ${error.message}`);
+            }
+        })
+        .finally(() => {
+            App.removeProgressBar(id);
+            delete App.activeUploadXHRs[id];
+        });
+};
+
 App.uploadFolders = function() {
     const input = document.getElementById('upload-folder-input');
-    const files = input.files;
+    const files = Array.from(input.files);
     if (files.length === 0) {
         App.showToast('Please select at least one folder to upload.', 'warning');
         return;
     }
     const folderName = files.length > 0 ? files[0].webkitRelativePath.split('/')[0] : 'this folder';
 
+    const targetPath = App.currentPath;
     App.showConfirmation(`Are you sure you want to upload all files from “${folderName}”? Only do this if you trust the site.`, 'Confirm Upload')
         .then(() => {
-            const formData = new FormData();
-            formData.append('path', App.currentPath);
-
-            for (let i = 0; i < files.length; i++) {
-                const file = files[i];
-                formData.append('files', file, file.webkitRelativePath);
-            }
-
-            const id = App.generateUniqueId();
-            App.addProgressBar(id, 'upload', 'Folder Upload', true);
-
-            const xhr = new XMLHttpRequest();
-            App.activeUploadXHRs[id] = xhr;
-            xhr.open('POST', '/upload', true);
+            input.value = '';
+            const entries = files.map(file => ({ file: file, relativePath: file.webkitRelativePath }));
+            App.dedupUploads(entries, targetPath).then(skipped => {
+                App.uploadFolderFiles(entries.filter(entry => !skipped.has(entry)).map(entry => entry.file), targetPath);
+            }, () => {});
+        }, () => {
+            App.showToast('Upload canceled.', 'info');
+        });
+};
 
-            App.setCSRFHeader(xhr);
+App.uploadFolderFiles = function(files, targetPath) {
+    const id = App.generateUniqueId();
+    App.addProgressBar(id, 'upload', 'Folder Upload', true);
+
+    // Each file gets its own upload session; a few files are sent at a time
+    const totalBytes = files.reduce((total, file) => total + file.size, 0);
+    const loadedBytes = {};
+    const queue = files.slice();
+    const active = new Set();
+    const folderUpload = {
+        aborted: false,
+        abort: function() {
+            folderUpload.aborted = true;
+            active.forEach(upload => upload.abort());
+        }
+    };
+    App.activeUploadXHRs[id] = folderUpload;
 
-            xhr.upload.onprogress = function(event) {
-                if (event.lengthComputable) {
-                    const percentComplete = ((event.loaded / event.total) * 100).toFixed(2);
-                    App.updateProgressBar(id, percentComplete, false);
-                } else {
-                    App.updateProgressBar(id, 0, true);
-                }
-            };
+    const report = () => {
+        const loaded = Object.values(loadedBytes).reduce((total, bytes) => total + bytes, 0);
+        const percentComplete = totalBytes ? ((loaded / totalBytes) * 100).toFixed(2) : '100.00';
+        App.updateProgressBar(id, percentComplete, false);
+    };
 
-            xhr.onload = function() {
-                if (xhr.status === 200) {
-                    const response = JSON.parse(xhr.responseText);
-                    if (response.error) {
-                        App.showToast(`Error uploading: ${response.error}`, 'danger');
-                    } else {
-                        App.showToast('Folder uploaded successfully.', 'success');
-                        App.loadDirectory(App.currentPath);
-                        App.closeAddFolderModal();
-                    }
-                } else {
-                    try {
-                        const response = JSON.parse(xhr.responseText);
-                        App.showToast(`Error uploading: ${response.error}`, 'danger');
-                    } catch (e) {
-                        App.showToast('An error occurred during the upload.', 'danger');
-                    }
-                }
-                App.removeProgressBar(id);
-                delete App.activeUploadXHRs[id];
-            };
+    const worker = () => {
+        if (folderUpload.aborted) {
+            return Promise.reject(new Error('aborted'));
+        }
+        const file = queue.shift();
+        if (!file) {
+            return Promise.resolve();
+        }
+        const upload = App.chunkedUpload(file, file.webkitRelativePath, targetPath, loaded => {
+            loadedBytes[file.webkitRelativePath] = loaded;
+            report();
+        });
+        active.add(upload);
+        return upload.promise.finally(() => active.delete(upload)).then(worker);
+    };
 
-            xhr.onerror = function() {
-                App.showToast('An error occurred during the upload.', 'danger');
-                App.removeProgressBar(id);
-                delete App.activeUploadXHRs[id];
-            };
+    const workers = [];
+    for (let i = 0; i < App.uploadParallelFiles; i++) {
+        workers.push(worker());
+    }
 
-            xhr.onabort = function() {
+    Promise.all(workers)
+        .then(() => {
+            App.showToast('Folder uploaded successfully.', 'success');
+            App.refreshDirectory();
+            App.closeAddFolderModal();
+        })
+        .catch(error => {
+            folderUpload.aborted = true;
+            active.forEach(upload => upload.pause());
+            if (error.message === 'aborted') {
                 App.showToast('Upload has been canceled.', 'warning');
-                App.removeProgressBar(id);
-                delete App.activeUploadXHRs[id];
-            };
-
-            xhr.send(formData);
-            input.value = '';
+            } else if (error.message === 'network') {
+                App.showToast('An error occurred during the upload. Upload the folder again to resume.', 'danger');
+            } else {
+                App.showToast(`Error uploading: ${error.message}`, 'danger');
+            }
         })
-        .catch(() => {
-            App.showToast('Upload canceled.', 'info');
+        .finally(() => {
+            App.removeProgressBar(id);
+            delete App.activeUploadXHRs[id];
         });
 };
 
@@ -439,18 +728,22 @@ App.deleteItems = function(paths) {
             if (data.error) {
                 App.showToast(data.error, 'danger');
             } else {
+                if (data.job) {
+                    App.showToast('Deleting folders in the background.', 'info');
+                    App.trackJob(data.job, 'delete', App.refreshDirectory);
+                }
                 if (data.errors && data.errors.length > 0) {
                     let errorMessage = 'Some items were not deleted:\n';
                     data.errors.forEach(err => {
                         errorMessage += `- ${err.path}: ${err.error}\n`;
                     });
                     App.showToast(errorMessage, 'warning');
-                } else {
+                } else if (!data.job) {
                     App.showToast('Items deleted successfully.', 'success');
                 }
                 App.selectedItems.clear();
                 App.updateSelectedItemsPanel();
-                App.loadDirectory(App.currentPath);
+                App.refreshDirectory();
             }
             App.showLoading(false);
         })
@@ -477,6 +770,10 @@ App.cancelOperation = function(id, type) {
         delete App.activeDownloadXHRs[id];
         App.showToast('Download canceled.');
     }
+    if (App.activeJobs[id]) {
+        App.cancelJob(id);
+        return;
+    }
     App.removeProgressBar(id);
 };
 
@@ -40,3 +40,32 @@ App.updateProgressBar = function(id, percentComplete) {
         progressText.textContent = `${percentComplete}%`;
     }
 };
+
+App.etagCache = new Map();
+App.etagCacheSize = 50;
+
+App.fetchJSON = function(url) {
+    // Revalidate GET responses with If-None-Match so unchanged listings and
+    // files come back as an empty 304 and are served from this cache.
+    const cached = App.etagCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    return fetch(url, { headers: headers, cache: 'no-store' })
+        .then(response => {
+            if (response.status === 304 && cached) {
+                App.etagCache.delete(url);
+                App.etagCache.set(url, cached);
+                return cached.data;
+            }
+            return response.json().then(data => {
+                const etag = response.headers.get('ETag');
+                if (response.ok && etag) {
+                    App.etagCache.delete(url);
+                    App.etagCache.set(url, { etag: etag, data: data });
+                    if (App.etagCache.size > App.etagCacheSize) {
+                        App.etagCache.delete(App.etagCache.keys().next().value);
+                    }
+                }
+                return data;
+            });
+        });
+};
@@ -0,0 +1,327 @@
+import os
+import glob
+import json
+import time
+import zlib
+import struct
+import hashlib
+import tempfile
+import collections
+
+from config import SIGNATURES_DIR
+from app.jobs.engine import native_executor
+from app.jobs import fastcopy
+from .sessions import write_all
+
+WEAK = 'adler32'
+STRONG = 'blake2b'
+STRONG_SIZE = 16  # bytes of BLAKE2b per block
+ADLER_MOD = 65521
+READ_SIZE = 1024 * 1024
+BATCH_SIZE = 8 * 1024 * 1024  # bytes checksummed per pool task
+
+# Delta instructions: a one-byte opcode followed by big-endian arguments
+COPY = b'C'  # block index, block count: copy that run of blocks from the base file
+LITERAL = b'L'  # length, then that many bytes of new data
+END = b'E'  # size of the new file; nothing may follow
+COPY_ARGS = struct.Struct('>QI')
+LITERAL_ARGS = struct.Struct('>I')
+END_ARGS = struct.Struct('>Q')
+
+
+class DeltaError(ValueError):
+    """The delta is malformed or doesn't fit the base file."""
+
+
+class DigestMismatch(DeltaError):
+    """The rebuilt file doesn't have the digest the client expected."""
+
+
+def choose_block_size(size, minimum, maximum):
+    """
+    Return the power of two nearest sqrt(size) within [minimum, maximum].
+
+    Smaller blocks send fewer unchanged bytes around each change, larger
+    ones make a smaller signature; sqrt(size) balances the two.
+    """
+    block_size = minimum
+    while block_size < maximum and block_size * block_size < size:
+        block_size *= 2
+    return block_size
+
+
+def block_checksums(fd, offset, length, block_size):
+    """Return [weak, strong hex] of each block in length bytes of fd from offset."""
+    data = memoryview(os.pread(fd, length, offset))
+    return [
+        [zlib.adler32(block), hashlib.blake2b(block, digest_size=STRONG_SIZE).hexdigest()]
+        for block in (data[i:i + block_size] for i in range(0, len(data), block_size))
+    ]
+
+
+def _signature_prefix(path):
+    return os.path.join(SIGNATURES_DIR, hashlib.sha256(path.encode('utf-8', 'surrogateescape')).hexdigest())
+
+
+def signature_file(path, block_size, version):
+    """Where the signature of path at version is cached."""
+    return f"{_signature_prefix(path)}-{block_size}-{version}.json"
+
+
+def stream_signature(f, path, stat, version, block_size, workers):
+    """
+    Yield the signature of the open binary file f as JSON while it is computed.
+
+    The signature is {version, size, block_size, weak, strong, blocks}, one
+    [weak, strong] pair per block. Batches of blocks are checksummed on
+    `workers` native threads, at most two per thread in flight; zlib and
+    hashlib release the GIL on data this size, so they run in parallel.
+    The complete signature is cached in SIGNATURES_DIR, replacing those of
+    older versions, unless the file changed while it was read. f is closed
+    when done.
+    """
+    header = {'version': version, 'size': stat.st_size, 'block_size': block_size, 'weak': WEAK, 'strong': STRONG}
+    batch = max(1, BATCH_SIZE // block_size) * block_size
+    os.makedirs(SIGNATURES_DIR, exist_ok=True)
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=SIGNATURES_DIR, suffix='.tmp')
+    executor = native_executor(workers)
+    in_flight = collections.deque()
+    offsets = iter(range(0, stat.st_size, batch))
+    try:
+        with f, os.fdopen(tmp_fd, 'w') as out:
+            piece = json.dumps(header)[:-1] + ', "blocks": ['
+            separator = ''
+            while True:
+                while len(in_flight) < workers * 2:
+                    offset = next(offsets, None)
+                    if offset is None:
+                        break
+                    in_flight.append(executor.submit(
+                        block_checksums, f.fileno(), offset, min(batch, stat.st_size - offset), block_size))
+                if not in_flight:
+                    break
+                checksums = in_flight.popleft().result()
+                piece += separator + json.dumps(checksums)[1:-1]
+                separator = ', '
+                out.write(piece)
+                yield piece
+                piece = ''
+            piece += ']}'
+            out.write(piece)
+            yield piece
+            after = os.fstat(f.fileno())
+
+        if (after.st_ino, after.st_size, after.st_mtime_ns) == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            cache = signature_file(path, block_size, version)
+            os.replace(tmp_path, cache)
+            for stale in glob.glob(glob.escape(_signature_prefix(path)) + '-*.json'):
+                if not stale.endswith(f"-{version}.json"):
+                    try:
+                        os.unlink(stale)
+                    except OSError:
+                        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            raise DeltaError("The delta ends in the middle of an instruction.")
+        data += more
+    return data
+
+
+def _copy_blocks(src, dst, offset, dst_offset, length, hasher):
+    """Copy length bytes of src from offset to dst at dst_offset, hashing them if hasher is given."""
+    if hasher is None:
+        return fastcopy.copy_range(src, dst, offset, dst_offset, length)
+    copied = 0
+    while copied < length:
+        data = os.pread(src.fileno(), min(READ_SIZE, length - copied), offset + copied)
+        if not data:
+            break
+        hasher.update(data)
+        write_all(dst.fileno(), data, dst_offset + copied)
+        copied += len(data)
+    return copied
+
+
+def apply_delta(stream, src, dst, block_size, digest=None):
+    """
+    Write the new file described by the delta read from stream to dst; return its size.
+
+    Copies are taken from the base file src in block_size blocks, which
+    must be the block size of the signature the delta was made against.
+    They go through fastcopy.copy_range, so unchanged data stays in the
+    kernel and may share extents with the base file; literal data is
+    written as it arrives. A copy can cover most of a huge file, so it
+    runs on a native thread while the request only waits for it. If
+    digest (BLAKE2b hex, any length) is given, copied data is read and
+    hashed too, and DigestMismatch is raised unless the result matches.
+    Raises DeltaError for a malformed delta.
+    """
+    dst_fd = dst.fileno()
+    base_size = os.fstat(src.fileno()).st_size
+    hasher = hashlib.blake2b(digest_size=len(digest) // 2) if digest else None
+    executor = native_executor(1)
+    written = 0
+    try:
+        while True:
+            op = stream.read(1)
+            if op == COPY:
+                index, count = COPY_ARGS.unpack(_read_exact(stream, COPY_ARGS.size))
+                offset = index * block_size
+                length = min(count * block_size, base_size - offset)
+                if count == 0 or length <= 0:
+                    raise DeltaError(f"Block {index} is past the end of the base file.")
+                copied = executor.submit(_copy_blocks, src, dst, offset, written, length, hasher).result()
+                if copied != length:
+                    raise DeltaError("The base file is shorter than its signature.")
+                written += length
+            elif op == LITERAL:
+                (length,) = LITERAL_ARGS.unpack(_read_exact(stream, LITERAL_ARGS.size))
+                while length:
+                    data = stream.read(min(READ_SIZE, length))
+                    if not data:
+                        raise DeltaError("The delta ends in the middle of literal data.")
+                    if hasher is not None:
+                        hasher.update(data)
+                    write_all(dst_fd, data, written)
+                    written += len(data)
+                    length -= len(data)
+            elif op == END:
+                (size,) = END_ARGS.unpack(_read_exact(stream, END_ARGS.size))
+                if size != written:
+                    raise DeltaError(f"The delta describes {written} bytes but declares {size}.")
+                if stream.read(1):
+                    raise DeltaError("Data follows the end of the delta.")
+                break
+            elif not op:
+                raise DeltaError("The delta ends without an end instruction.")
+            else:
+                raise DeltaError(f"Unknown delta instruction {op!r}.")
+            # Yield to other greenlets when running under gevent
+            time.sleep(0)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if hasher is not None and hasher.hexdigest() != digest:
+        raise DigestMismatch("The rebuilt file doesn't match the expected digest.")
+    return written
+
+
+def make_delta(f, signature, read_size=4 * READ_SIZE):
+    """
+    Yield, in pieces, the delta that turns the file signature describes into the binary file f.
+
+    Reference encoder for clients, as in rsync: the adler32 of a window of
+    block_size bytes is rolled through f one byte at a time, and where it
+    matches a block's the window's BLAKE2b decides. Matched blocks become
+    copies, consecutive ones a single instruction, so data that only moved
+    is found too; everything in between is sent as literals. Unchanged
+    regions are checked a block at a time and only changed ones byte by
+    byte, so the work, like the delta, grows with what changed.
+    """
+    block_size = signature['block_size']
+    blocks = signature['blocks']
+    by_weak = collections.defaultdict(list)
+    for index, (weak, strong) in enumerate(blocks):
+        by_weak[weak].append(index)
+    last_length = signature['size'] - (len(blocks) - 1) * block_size if blocks else 0
+    read_size = max(read_size, 2 * block_size)
+
+    out = []
+    run = None  # [first block, count] of the copy being extended
+    written = 0
+
+    def end_run():
+        nonlocal run
+        if run is not None:
+            out.append(COPY + COPY_ARGS.pack(*run))
+            run = None
+
+    def copy(index):
+        nonlocal run, written
+        length = min(block_size, signature['size'] - index * block_size)
+        written += length
+        if run is not None and run[0] + run[1] == index:
+            run[1] += 1
+            return
+        end_run()
+        run = [index, 1]
+
+    def literal(data):
+        nonlocal written
+        if data:
+            end_run()
+            out.append(LITERAL + LITERAL_ARGS.pack(len(data)))
+            out.append(bytes(data))
+            written += len(data)
+
+    def lookup(weak, window):
+        candidates = by_weak.get(weak)
+        if not candidates:
+            return None
+        strong = hashlib.blake2b(window, digest_size=STRONG_SIZE).hexdigest()
+        matches = [index for index in candidates if blocks[index][1] == strong]
+        if not matches:
+            return None
+        # Prefer the block that continues the current run
+        following = run[0] + run[1] if run is not None else None
+        return following if following in matches else matches[0]
+
+    data = b''
+    start = position = 0  # pending literal data starts at start; the window at position
+    weak = None  # checksum of the window, while it can be rolled on
+    eof = False
+    while True:
+        if not eof and len(data) - position <= block_size:
+            literal(data[start:position])
+            chunk = f.read(read_size)
+            eof = not chunk
+            data = data[position:] + chunk
+            start = position = 0
+        else:
+            index = None
+            if len(data) - position >= block_size:
+                if weak is None:
+                    weak = zlib.adler32(data[position:position + block_size])
+                index = lookup(weak, data[position:position + block_size])
+                a, b = weak & 0xffff, weak >> 16
+                end = len(data) - block_size
+                while index is None and position < end:
+                    old, new = data[position], data[position + block_size]
+                    a = (a - old + new) % ADLER_MOD
+                    b = (b - block_size * old + a - 1) % ADLER_MOD
+                    position += 1
+                    weak = (b << 16) | a
+                    if weak in by_weak:
+                        index = lookup(weak, data[position:position + block_size])
+
+            if index is not None:
+                literal(data[start:position])
+                copy(index)
+                position += block_size
+                start = position
+                weak = None
+            elif eof:
+                # A short last block can only match the end of f
+                tail = len(data) - last_length
+                if (0 < last_length < block_size and tail >= start
+                        and hashlib.blake2b(data[tail:], digest_size=STRONG_SIZE).hexdigest() == blocks[-1][1]):
+                    literal(data[start:tail])
+                    copy(len(blocks) - 1)
+                else:
+                    literal(data[start:])
+                end_run()
+                out.append(END + END_ARGS.pack(written))
+                yield b''.join(out)
+                return
+        if out:
+            yield b''.join(out)
+            out.clear()
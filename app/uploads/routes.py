@@ -0,0 +1,340 @@
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, stream_with_context
+from flask_login import login_required, current_user
+import os
+import shutil
+
+from config import VOLUME
+from app.api.routes import secure_path, secure_relative_path, file_etag, not_modified, with_etag
+from app.api.file_saves import StaleVersion, save_atomically
+from app.api.file_hashes import ALGORITHM, hash_cache
+from app.api.listing import listing_cache
+from app.jobs.engine import job_manager
+from app.jobs.operations import copy_paths
+from app.jobs import fastcopy
+from extensions import csrf
+from .sessions import UploadSession, UploadError, prune_sessions
+from . import delta
+
+uploads_bp = Blueprint('uploads', __name__)
+
+def relative_target(session):
+    return os.path.relpath(session.target, VOLUME).replace("\\", "/")
+
+@uploads_bp.errorhandler(UploadError)
+def upload_error(error):
+    current_app.logger.error(f"Upload error: {error.message}")
+    return jsonify({'error': error.message}), error.status
+
+@uploads_bp.route('', methods=['POST'])
+@login_required
+def create_upload():
+    try:
+        if not request.is_json:
+            current_app.logger.error("Request content type is not JSON.")
+            return jsonify({'error': 'Invalid content type. JSON expected.'}), 400
+
+        data = request.get_json()
+        path = data.get('path', '').strip()
+        filename = data.get('filename', '').strip()
+        size = data.get('size')
+        chunk_size = data.get('chunk_size', current_app.config['UPLOAD_CHUNK_SIZE'])
+
+        if not filename:
+            current_app.logger.error("No filename provided.")
+            return jsonify({'error': 'No filename provided.'}), 400
+
+        if not isinstance(size, int) or size < 0:
+            return jsonify({'error': 'File size must be a non-negative integer.'}), 400
+
+        if not isinstance(chunk_size, int) or not 0 < chunk_size <= current_app.config['UPLOAD_MAX_CHUNK_SIZE']:
+            return jsonify({'error': 'Invalid chunk size.'}), 400
+
+        target_dir = secure_path(path)
+        if not os.path.exists(target_dir):
+            current_app.logger.error(f"Target directory does not exist: {target_dir}")
+            return jsonify({'error': 'Target directory does not exist.'}), 400
+
+        relative_path = secure_relative_path(filename)
+        if os.path.isabs(relative_path) or '..' in relative_path:
+            current_app.logger.error(f"Invalid file path: {relative_path}")
+            return jsonify({'error': 'Invalid file path.'}), 400
+
+        file_path = secure_path(os.path.join(target_dir, relative_path))
+        if os.path.exists(file_path):
+            current_app.logger.error(f'File "{file_path}" already exists.')
+            return jsonify({'error': f'File "{os.path.basename(file_path)}" already exists in the target directory.'}), 400
+
+        final_dir = os.path.dirname(file_path)
+        os.makedirs(final_dir, exist_ok=True)
+        if shutil.disk_usage(final_dir).free < size:
+            current_app.logger.error(f"Not enough space for {size} bytes in {final_dir}")
+            return jsonify({'error': 'Not enough free space on the volume.'}), 507
+
+        for stale in prune_sessions(current_app.config['UPLOAD_SESSION_TTL']):
+            current_app.logger.info(f"Removed stale upload session {stale.id} for {stale.target}")
+
+        session = UploadSession.create(file_path, size, chunk_size)
+        current_app.logger.info(f"User '{current_user.id}' started upload {session.id} of {size} bytes to {file_path}")
+        return jsonify(session.to_dict(relative_target(session))), 201
+
+    except Exception as e:
+        current_app.logger.exception(f"Error creating upload session: {e}")
+        return jsonify({'error': 'An error occurred while starting the upload.', 'message': str(e)}), 500
+
+@uploads_bp.route('/dedup', methods=['POST'])
+@login_required
+def dedup_uploads():
+    """
+    Place files the volume already holds instead of uploading them again.
+
+    The client sends path and files: [{filename, size, digest}], digest
+    being the BLAKE2b (20 bytes) of the whole file as 'blake2b:<hex>'. A
+    file with the same size and digest in the hash cache is reflinked into
+    place, hard linked if UPLOAD_DEDUP_HARDLINK is set, or else copied on
+    the server: inline up to COPY_INLINE_MAX_SIZE, by a copy job above it.
+    Each file comes back with status 'placed', 'queued' (the returned job
+    copies it) or 'upload' (send it as usual). Files sent without a digest
+    get 'hash' if a file of their size is known, so clients only hash
+    files that can match.
+    """
+    if not current_app.config['UPLOAD_DEDUP']:
+        return jsonify({'error': 'Upload deduplication is disabled.'}), 400
+    if not request.is_json:
+        current_app.logger.error("Request content type is not JSON.")
+        return jsonify({'error': 'Invalid content type. JSON expected.'}), 400
+
+    data = request.get_json()
+    files = data.get('files')
+    if not isinstance(files, list):
+        return jsonify({'error': 'No files provided.'}), 400
+
+    target_dir = secure_path(data.get('path', '').strip())
+    if not os.path.isdir(target_dir):
+        current_app.logger.error(f"Target directory does not exist: {target_dir}")
+        return jsonify({'error': 'Target directory does not exist.'}), 400
+
+    try:
+        results = []
+        background = []
+        changed_dirs = set()
+        for item in files:
+            filename = str(item.get('filename', '')).strip() if isinstance(item, dict) else ''
+            result = {'filename': filename, 'status': 'upload'}
+            results.append(result)
+
+            size = item.get('size') if filename else None
+            digest = item.get('digest') if filename else None
+            if not isinstance(size, int) or size <= 0:
+                continue
+            relative_path = secure_relative_path(filename)
+            file_path = secure_path(os.path.join(target_dir, relative_path))
+            if os.path.lexists(file_path):
+                continue
+            if digest is None:
+                if hash_cache.has_size(size):
+                    result['status'] = 'hash'
+                continue
+            if not isinstance(digest, str) or not digest.startswith(f"{ALGORITHM}:"):
+                continue
+            found = hash_cache.find(size, digest[len(ALGORITHM) + 1:].lower())
+            if found is None:
+                continue
+
+            source = os.path.join(VOLUME, found[0])
+            try:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                if fastcopy.clone_file(source, file_path):
+                    method = 'reflink'
+                elif current_app.config['UPLOAD_DEDUP_HARDLINK']:
+                    os.link(source, file_path)
+                    method = 'hardlink'
+                elif size > current_app.config['COPY_INLINE_MAX_SIZE']:
+                    background.append((filename, source, file_path))
+                    result['status'] = 'queued'
+                    continue
+                else:
+                    method = fastcopy.copy_file(source, file_path)
+            except OSError as e:
+                current_app.logger.warning(f"Could not place {file_path} from {source}: {e}")
+                continue
+            result.update(status='placed', method=method)
+            changed_dirs.add(os.path.dirname(file_path))
+            current_app.logger.info(f"User '{current_user.id}' placed {file_path} from {source} using {method}")
+
+        for directory in changed_dirs:
+            listing_cache.invalidate(directory)
+
+        job = None
+        if background:
+            job = job_manager.submit('copy', f"Copy {len(background)} already stored file(s) to /{data.get('path', '').strip('/')}",
+                                     current_user.id, copy_paths, background)
+        return jsonify({'files': results, 'job': job.record if job else None}), 200
+
+    except Exception as e:
+        current_app.logger.exception(f"Error deduplicating uploads: {e}")
+        return jsonify({'error': 'An error occurred while checking for duplicates.', 'message': str(e)}), 500
+
+def delta_block_size(size):
+    """The block_size argument if it is valid, else the default for a file of size bytes."""
+    minimum = current_app.config['DELTA_MIN_BLOCK_SIZE']
+    maximum = current_app.config['DELTA_MAX_BLOCK_SIZE']
+    block_size = request.args.get('block_size', type=int)
+    if block_size is None:
+        return delta.choose_block_size(size, minimum, maximum)
+    if not minimum <= block_size <= maximum or block_size & (block_size - 1):
+        raise UploadError(f"block_size must be a power of two from {minimum} to {maximum}.")
+    return block_size
+
+@uploads_bp.route('/signature', methods=['GET'])
+@login_required
+def file_signature():
+    """
+    Return the block signature of a file, the first half of a delta sync.
+
+    The JSON has the file's version, size and block_size and, for each
+    block, its adler32 and BLAKE2b (16 bytes) checksums. A client holding
+    a changed copy finds which blocks it still has with delta.make_delta()
+    and posts the rest to /uploads/delta. Signatures are cached per
+    version and block size, so only the first request reads the file.
+    """
+    path = request.args.get('path', '').strip()
+    if not path:
+        return jsonify({'error': 'No file path provided.'}), 400
+
+    secure_file_path = secure_path(path)
+
+    try:
+        if not os.path.isfile(secure_file_path):
+            return jsonify({'error': 'The specified path is not a file.'}), 400
+
+        stat = os.stat(secure_file_path)
+        block_size = delta_block_size(stat.st_size)
+        version = file_etag(stat)
+        etag = f"{version}-{block_size:x}"
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        cache = delta.signature_file(secure_file_path, block_size, version)
+        if os.path.exists(cache):
+            return with_etag(send_file(cache, mimetype='application/json', conditional=False, etag=False), etag)
+
+        current_app.logger.info(f"Computing signature of {secure_file_path} in {block_size} byte blocks")
+        # A file replaced since the stat gets a signature no delta can apply to: its version is stale
+        body = delta.stream_signature(open(secure_file_path, 'rb'), secure_file_path, stat, version, block_size,
+                                      current_app.config['SIGNATURE_WORKERS'])
+        return with_etag(Response(stream_with_context(body), mimetype='application/json'), etag)
+
+    except UploadError:
+        raise
+    except Exception as e:
+        current_app.logger.exception(f"Error computing the signature of {path}: {e}")
+        return jsonify({'error': 'An error occurred while computing the signature.', 'message': str(e)}), 500
+
+@uploads_bp.route('/delta', methods=['POST'])
+@login_required
+def apply_file_delta():
+    """
+    Update a file from a delta against the version its signature was taken of.
+
+    The query has path, base_version and block_size from the signature;
+    the body is the binary delta (see delta.py): copies of base blocks
+    and literal new data, so the upload is proportional to what changed.
+    The file is rebuilt in a temp file next to it and renamed over it,
+    or refused with 409 and the current version if it changed since the
+    signature. An optional X-Content-Digest: blake2b:<hex> header has
+    the result verified before it replaces the file.
+    """
+    path = request.args.get('path', '').strip()
+    base_version = request.args.get('base_version', '').strip()
+    block_size = request.args.get('block_size', type=int)
+    if not path or not base_version or block_size is None or block_size <= 0:
+        return jsonify({'error': 'path, base_version and block_size are required.'}), 400
+
+    digest = request.headers.get('X-Content-Digest')
+    if digest is not None:
+        algorithm, _, digest = digest.partition(':')
+        digest = digest.strip().lower()
+        if algorithm.strip().lower() != delta.STRONG or not digest or len(digest) % 2 or len(digest) > 128:
+            return jsonify({'error': f"X-Content-Digest must be {delta.STRONG}:<hex>."}), 400
+
+    secure_file_path = secure_path(path)
+
+    try:
+        if not os.path.isfile(secure_file_path):
+            return jsonify({'error': 'The specified path is not a file.'}), 400
+
+        result = {}
+
+        def write_body(src, dst):
+            result['size'] = delta.apply_delta(request.stream, src, dst, block_size, digest)
+
+        version = save_atomically(secure_file_path, base_version, file_etag, write_body)
+        listing_cache.invalidate(os.path.dirname(secure_file_path))
+        if current_app.config['UPLOAD_DEDUP']:
+            hash_cache.hash_later(os.path.relpath(secure_file_path, VOLUME).replace("\\", "/"))
+
+        current_app.logger.info(f"User '{current_user.id}' updated {secure_file_path} from a delta "
+                                f"of {request.content_length or 'unknown'} bytes")
+        return jsonify({'message': 'File updated successfully.', 'version': version, 'size': result['size']}), 200
+
+    except StaleVersion as e:
+        current_app.logger.info(f"Refused stale delta for {secure_file_path}: {e}")
+        return jsonify({'error': 'The file changed since its signature was taken.', 'version': e.current}), 409
+    except delta.DigestMismatch as e:
+        return jsonify({'error': str(e)}), 422
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.exception(f"Error applying delta to {path}: {e}")
+        return jsonify({'error': 'An error occurred while applying the delta.', 'message': str(e)}), 500
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    session = UploadSession.load(upload_id)
+    return jsonify(session.to_dict(relative_target(session))), 200
+
+# Requests on an existing session are authorised by the login plus the unguessable
+# upload id, so a multi-hour upload never outlives the page's CSRF token
+@uploads_bp.route('/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@csrf.exempt
+@login_required
+def upload_chunk(upload_id, index):
+    session = UploadSession.load(upload_id)
+    try:
+        session.write_chunk(index, request.stream)
+        current_app.logger.debug(f"Upload {upload_id}: received chunk {index}")
+        return jsonify({'message': 'Chunk received.', 'index': index}), 200
+    except UploadError:
+        raise
+    except Exception as e:
+        current_app.logger.exception(f"Error writing chunk {index} of upload {upload_id}: {e}")
+        return jsonify({'error': 'An error occurred while writing the chunk.', 'message': str(e)}), 500
+
+@uploads_bp.route('/<upload_id>/commit', methods=['POST'])
+@csrf.exempt
+@login_required
+def commit_upload(upload_id):
+    session = UploadSession.load(upload_id)
+    try:
+        session.commit()
+        current_app.logger.info(f"Uploaded file: {session.target}")
+        if current_app.config['UPLOAD_DEDUP']:
+            # So the next upload of the same data can skip the transfer
+            hash_cache.hash_later(relative_target(session))
+        return jsonify({'message': 'File uploaded successfully.', 'path': relative_target(session)}), 200
+    except UploadError:
+        raise
+    except Exception as e:
+        current_app.logger.exception(f"Error committing upload {upload_id}: {e}")
+        return jsonify({'error': 'An error occurred while finishing the upload.', 'message': str(e)}), 500
+
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@csrf.exempt
+@login_required
+def abort_upload(upload_id):
+    session = UploadSession.load(upload_id)
+    session.abort()
+    current_app.logger.info(f"User '{current_user.id}' aborted upload {upload_id} to {session.target}")
+    return jsonify({'message': 'Upload aborted.'}), 200
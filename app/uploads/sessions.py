@@ -0,0 +1,238 @@
+import os
+import re
+import errno
+import fcntl
+import json
+import time
+import shutil
+import secrets
+
+from config import UPLOADS_DIR
+
+READ_SIZE = 1024 * 1024  # 1 MB
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# errno values of os.link meaning "this filesystem has no hard links"
+LINK_UNSUPPORTED = {errno.EPERM, errno.EOPNOTSUPP, errno.EXDEV, errno.ENOSYS}
+
+
+class UploadError(Exception):
+    """
+    Raised when an upload request can't be honoured; status is the HTTP code to answer with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def write_all(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class UploadSession:
+    """
+    A chunked upload of one file.
+
+    The data is written into a staging file next to the destination, so the
+    final rename never crosses filesystems. Session state lives under
+    DATA_DIR/uploads/<id> where every gunicorn worker can see it: session.json
+    holds the metadata and 'received' is a bitmap with one byte per chunk.
+    Chunks own disjoint byte ranges of both files, so they can be written
+    concurrently without locking.
+    """
+
+    def __init__(self, id, target, staging, size, chunk_size, created):
+        self.id = id
+        self.target = target
+        self.staging = staging
+        self.size = size
+        self.chunk_size = chunk_size
+        self.created = created
+
+    @property
+    def directory(self):
+        return os.path.join(UPLOADS_DIR, self.id)
+
+    @property
+    def received_file(self):
+        return os.path.join(self.directory, 'received')
+
+    @property
+    def chunk_count(self):
+        return -(-self.size // self.chunk_size)
+
+    @classmethod
+    def create(cls, target, size, chunk_size):
+        id = secrets.token_hex(16)
+        staging = os.path.join(
+            os.path.dirname(target), f".{os.path.basename(target)}.{id}.part"
+        )
+        session = cls(id, target, staging, size, chunk_size, int(time.time()))
+
+        os.makedirs(session.directory)
+        with open(staging, 'xb') as f:
+            f.truncate(size)
+        with open(session.received_file, 'wb') as f:
+            f.truncate(session.chunk_count)
+        with open(os.path.join(session.directory, 'session.json'), 'w') as f:
+            json.dump({
+                'target': target,
+                'staging': staging,
+                'size': size,
+                'chunk_size': chunk_size,
+                'created': session.created,
+            }, f)
+        return session
+
+    @classmethod
+    def load(cls, id):
+        if not SESSION_ID_PATTERN.match(id):
+            raise UploadError('Upload not found.', 404)
+        try:
+            with open(os.path.join(UPLOADS_DIR, id, 'session.json')) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError('Upload not found.', 404)
+        return cls(id, data['target'], data['staging'], data['size'], data['chunk_size'], data['created'])
+
+    def chunk_range(self, index):
+        if not 0 <= index < self.chunk_count:
+            raise UploadError('Chunk index out of range.')
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, self.size)
+
+    def received(self):
+        with open(self.received_file, 'rb') as f:
+            return [bool(b) for b in f.read()]
+
+    def received_ranges(self):
+        """Return the received data as a list of [start, end) byte ranges."""
+        ranges = []
+        for index, done in enumerate(self.received()):
+            if not done:
+                continue
+            start, end = self.chunk_range(index)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return ranges
+
+    def write_chunk(self, index, stream):
+        """
+        Copy one chunk from stream into its slot in the staging file.
+
+        The chunk is flushed to disk before it is marked as received, so the
+        bitmap never claims data that a crash could lose.
+        """
+        start, end = self.chunk_range(index)
+        try:
+            fd = os.open(self.staging, os.O_WRONLY)
+        except FileNotFoundError:
+            raise UploadError('Upload not found.', 404)
+        try:
+            offset = start
+            while True:
+                data = stream.read(min(READ_SIZE, end - offset + 1))
+                if not data:
+                    break
+                if offset + len(data) > end:
+                    raise UploadError('Chunk is larger than expected.')
+                write_all(fd, data, offset)
+                offset += len(data)
+            if offset != end:
+                raise UploadError('Chunk is incomplete.')
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        fd = os.open(self.received_file, os.O_WRONLY)
+        try:
+            write_all(fd, b'\x01', index)
+        finally:
+            os.close(fd)
+
+    def commit(self):
+        """
+        Move the staging file into place once every chunk has arrived.
+
+        A hard link is used so an existing file is never replaced; filesystems
+        without hard links fall back to a rename after an existence check.
+        Commits of the same session are serialised with an flock on its
+        directory, so a repeated commit gets a 409 instead of racing the first.
+        """
+        try:
+            lock_fd = os.open(self.directory, os.O_RDONLY)
+        except FileNotFoundError:
+            raise UploadError('Upload not found.', 404)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            if not os.path.exists(self.staging):
+                raise UploadError('Upload has already been committed.', 409)
+            missing = self.received().count(False)
+            if missing:
+                raise UploadError(f"{missing} chunk(s) have not been received.", 409)
+            exists_error = UploadError(
+                f'File "{os.path.basename(self.target)}" already exists in the target directory.', 409)
+            if os.path.exists(self.target):
+                raise exists_error
+
+            try:
+                os.link(self.staging, self.target)
+            except FileExistsError:
+                raise exists_error
+            except FileNotFoundError:
+                # Aborted while we waited for the lock
+                raise UploadError('Upload not found.', 404)
+            except OSError as e:
+                if e.errno not in LINK_UNSUPPORTED:
+                    raise
+                if os.path.lexists(self.target):
+                    raise exists_error
+                os.rename(self.staging, self.target)
+            else:
+                os.unlink(self.staging)
+            shutil.rmtree(self.directory, ignore_errors=True)
+        finally:
+            os.close(lock_fd)
+
+    def abort(self):
+        try:
+            os.unlink(self.staging)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def to_dict(self, relative_path):
+        received = self.received()
+        return {
+            'id': self.id,
+            'path': relative_path,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'chunk_count': self.chunk_count,
+            'received': self.received_ranges(),
+            'missing': [index for index, done in enumerate(received) if not done],
+        }
+
+
+def prune_sessions(max_age):
+    """Abort upload sessions older than max_age seconds."""
+    if not os.path.isdir(UPLOADS_DIR):
+        return []
+    pruned = []
+    cutoff = time.time() - max_age
+    for id in os.listdir(UPLOADS_DIR):
+        try:
+            session = UploadSession.load(id)
+        except UploadError:
+            continue
+        if session.created < cutoff:
+            session.abort()
+            pruned.append(session)
+    return pruned
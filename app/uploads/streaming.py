@@ -0,0 +1,117 @@
+import os
+import errno
+import shutil
+import hashlib
+import tempfile
+
+from flask import Request
+from flask_login import current_user
+
+from config import VOLUME
+from .sessions import LINK_UNSUPPORTED
+
+# Endpoints whose multipart files are written straight into VOLUME
+DIRECT_UPLOAD_ENDPOINTS = {'main.upload_files'}
+
+
+class DirectUploadFile:
+    """
+    Temporary file on the volume that receives one multipart file part.
+
+    Werkzeug writes the part into it while parsing the request and the data
+    is hashed on the way through, so by the time the view runs the file only
+    needs to be renamed into place.
+    """
+
+    def __init__(self, directory):
+        fd, self.name = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.committed = False
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def commit(self, destination):
+        """
+        Move the received data to destination without replacing an existing file.
+
+        On the same filesystem this is a hard link; where links aren't
+        supported it is a rename, and a destination on another filesystem is
+        copied, both after checking again that destination doesn't exist.
+        Raises FileExistsError if it does.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        try:
+            os.link(self.name, destination)
+        except FileExistsError:
+            raise
+        except OSError as e:
+            if e.errno not in LINK_UNSUPPORTED:
+                raise
+            if os.path.lexists(destination):
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), destination)
+            if e.errno == errno.EXDEV:
+                shutil.move(self.name, destination)
+            else:
+                os.rename(self.name, destination)
+        else:
+            os.unlink(self.name)
+        self.committed = True
+
+    def discard(self):
+        self._file.close()
+        if not self.committed:
+            try:
+                os.unlink(self.name)
+            except FileNotFoundError:
+                pass
+
+
+def upload_directory(path):
+    """
+    Directory for the temporary files of an upload to path.
+
+    Staging next to the destination keeps the final rename on one filesystem.
+    Invalid or missing paths fall back to the root of the volume; the view
+    still validates the real destination.
+    """
+    volume = os.path.abspath(VOLUME)
+    directory = os.path.abspath(os.path.join(volume, path))
+    if os.path.commonpath([directory, volume]) == volume and os.path.isdir(directory):
+        return directory
+    return VOLUME
+
+
+class UploadRequest(Request):
+    """
+    Request class that streams multipart uploads to disk exactly once.
+
+    For DIRECT_UPLOAD_ENDPOINTS each file part goes into a DirectUploadFile on
+    the volume instead of Werkzeug's spooled temp file in /tmp, so the data
+    isn't written once to the container layer and then copied again.
+    Forms are parsed by the CSRF check before login_required runs, so
+    anonymous requests keep the default temp file and can't fill the volume.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in DIRECT_UPLOAD_ENDPOINTS or not current_user.is_authenticated:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        upload_file = DirectUploadFile(upload_directory(self.args.get('path', '')))
+        self.__dict__.setdefault('_direct_uploads', []).append(upload_file)
+        return upload_file
+
+    def close(self):
+        super().close()
+        for upload_file in self.__dict__.pop('_direct_uploads', []):
+            upload_file.discard()
@@ -0,0 +1,121 @@
+"""
+Measure how much a delta sync sends compared with uploading the whole file.
+
+    python benchmarks/delta_sync.py --size-mb 256 --changes 8 --change-kb 64
+
+A random file is stored in a temporary volume and a copy of it is edited:
+--changes regions of --change-kb are overwritten, and one of them is
+inserted instead, shifting everything after it. The copy is then synced
+through the Flask test client: GET /uploads/signature, the delta built with
+app.uploads.delta.make_delta, POST /uploads/delta. Reports the bytes each
+step moved and took, and checks the stored file matches the copy.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def edited_copy(data, changes, change_size, rng):
+    edited = bytearray(data)
+    for i in range(changes):
+        offset = rng.randrange(0, len(edited) - change_size)
+        if i == 0:
+            edited[offset:offset] = os.urandom(change_size)
+        else:
+            edited[offset:offset + change_size] = os.urandom(change_size)
+    return bytes(edited)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--changes', type=int, default=8)
+    parser.add_argument('--change-kb', type=int, default=64)
+    parser.add_argument('--block-size', type=int, help='default: chosen by the server')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        volume = os.path.join(tmp, 'volume')
+        data_dir = os.path.join(tmp, 'data')
+        os.makedirs(volume)
+        os.environ['VOLUME'] = volume
+        os.environ['DATA_DIR'] = data_dir
+        os.environ.setdefault('SECRET_KEY', 'benchmark')
+        os.environ.setdefault('CORS_ORIGINS', 'http://localhost')
+        os.environ.setdefault('SEARCH_INDEX', 'False')
+        os.environ.setdefault('LOG_FILE', os.path.join(tmp, 'app.log'))
+        sys.path.insert(0, ROOT)
+
+        from app import create_app
+        from app.auth.models import create_user
+        from app.uploads.delta import make_delta
+
+        rng = random.Random(args.seed)
+        original = os.urandom(args.size_mb * 1024 * 1024)
+        with open(os.path.join(volume, 'image.bin'), 'wb') as f:
+            f.write(original)
+        edited = edited_copy(original, args.changes, args.change_kb * 1024, rng)
+
+        create_user('bench', 'benchmark')
+        app = create_app()
+        app.config['WTF_CSRF_ENABLED'] = False
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = 'bench'
+            session['_fresh'] = True
+
+        query = '/uploads/signature?path=image.bin'
+        if args.block_size:
+            query += f'&block_size={args.block_size}'
+        start = time.perf_counter()
+        response = client.get(query)
+        signature_s = time.perf_counter() - start
+        signature = json.loads(response.data)
+        signature_bytes = len(response.data)
+
+        start = time.perf_counter()
+        client.get(query)
+        cached_signature_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        body = b''.join(make_delta(io.BytesIO(edited), signature))
+        encode_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.post(
+            f"/uploads/delta?path=image.bin&base_version={signature['version']}&block_size={signature['block_size']}",
+            data=body, content_type='application/octet-stream',
+            headers={'X-Content-Digest': 'blake2b:' + hashlib.blake2b(edited, digest_size=20).hexdigest()}
+        )
+        apply_s = time.perf_counter() - start
+        with open(os.path.join(volume, 'image.bin'), 'rb') as f:
+            matches = f.read() == edited
+
+        print(json.dumps({
+            'file_mb': round(len(edited) / 1024 / 1024, 1),
+            'changed_kb': args.changes * args.change_kb,
+            'block_size': signature['block_size'],
+            'signature_kb': round(signature_bytes / 1024, 1),
+            'delta_kb': round(len(body) / 1024, 1),
+            'sent_vs_full_upload': round((signature_bytes + len(body)) / len(edited), 4),
+            'signature_s': round(signature_s, 3),
+            'cached_signature_s': round(cached_signature_s, 3),
+            'encode_s': round(encode_s, 3),
+            'apply_s': round(apply_s, 3),
+            'status': response.status_code,
+            'matches': matches,
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,504 @@
+"""
+Benchmark the main endpoints against a synthetic volume.
+
+The app is driven either in-process through the Flask test client, or over
+HTTP against a real gunicorn server with gevent workers, the way the
+Dockerfile runs it, with several concurrent clients:
+
+    python benchmarks/suite.py --mode client --shape wide --shape deep
+    python benchmarks/suite.py --mode server --workers 6 --concurrency 32 \\
+        --save-baseline benchmarks/baselines/server.json
+    python benchmarks/suite.py --mode server --compare benchmarks/baselines/server.json
+
+For every scenario it reports throughput (requests/s and MB/s), latency
+percentiles, errors and the peak RSS of the process(es) serving it. Results
+are printed as JSON; --save-baseline stores them and --compare prints the
+change against a stored baseline, exiting non-zero when a scenario's p50
+latency or peak RSS regressed by more than --threshold.
+
+ZIP scenarios deflate on ARCHIVE_WORKERS threads per archive; set it in the
+environment to compare core counts. The huge_* and deep_* scenarios build
+the same trees as tar, tar.gz and tar.zst (zstd on ARCHIVE_WORKERS threads),
+so their requests/s compare the formats directly and response_mb shows
+what each one compresses to.
+
+Volumes are built with benchmarks/volume.py (same shape options) and reused
+between runs when their manifest matches.
+"""
+
+import argparse
+import concurrent.futures
+import http.client
+import json
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from volume import add_arguments, volume_options, build_volume  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERNAME = 'bench'
+PASSWORD = 'benchmark-password'
+READ_SIZE = 1024 * 1024
+
+
+class Scenario:
+    """One endpoint exercised with a fixed request."""
+
+    def __init__(self, name, method, path, requires=(), requests=None, body=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.requires = requires
+        self.requests = requests
+        # Called with the request number; returns (body bytes, content type)
+        self.body = body
+
+
+def multipart_upload(size):
+    payload = os.urandom(size)
+
+    def body(i):
+        boundary = uuid.uuid4().hex
+        parts = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="path"\r\n\r\nbench-uploads\r\n'.encode(),
+            (f'--{boundary}\r\nContent-Disposition: form-data; name="files"; '
+             f'filename="{uuid.uuid4().hex}.bin"\r\nContent-Type: application/octet-stream\r\n\r\n').encode(),
+            payload,
+            f'\r\n--{boundary}--\r\n'.encode(),
+        ]
+        return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+    return body
+
+
+def json_body(data):
+    encoded = json.dumps(data).encode()
+    return lambda i: (encoded, 'application/json')
+
+
+def build_scenarios(manifest):
+    deep_leaf = '/'.join(['deep'] + [f"level{level:03d}" for level in range(manifest['deep_depth'])])
+    scenarios = [
+        Scenario('list_wide_page', 'GET', '/api/list?path=wide&limit=500', requires=('wide',)),
+        Scenario('list_wide_full', 'GET', '/api/list?path=wide', requires=('wide',)),
+        Scenario('list_wide_sorted_size', 'GET', '/api/list?path=wide&limit=500&sort=size_desc', requires=('wide',)),
+        Scenario('list_deep_leaf', 'GET', f"/api/list?path={urllib.parse.quote(deep_leaf)}", requires=('deep',)),
+        Scenario('list_tiny_dir', 'GET', '/api/list?path=tiny/d00000', requires=('tiny',)),
+        Scenario('search_substring', 'GET', '/api/search?query=file00012'),
+        Scenario('search_glob', 'GET', '/api/search?query=%2A.log&mode=glob&limit=1000'),
+        Scenario('file_content', 'GET', '/api/get_file_content?path=wide/file0000000.txt', requires=('wide',)),
+        Scenario('zip_deep', 'POST', '/download_selected', requires=('deep',), requests=10,
+                 body=json_body({'selected_paths': ['deep']})),
+        Scenario('zip_tiny_dir', 'POST', '/download_selected', requires=('tiny',), requests=20,
+                 body=json_body({'selected_paths': ['tiny/d00000', 'tiny/d00001']})),
+        Scenario('zip_huge', 'POST', '/download_selected', requires=('huge',), requests=2,
+                 body=json_body({'selected_paths': ['huge']})),
+        Scenario('zip_huge_store', 'POST', '/download_selected', requires=('huge',), requests=2,
+                 body=json_body({'selected_paths': ['huge'], 'compression_level': 0})),
+        Scenario('zip_deep_fast', 'POST', '/download_selected', requires=('deep',), requests=10,
+                 body=json_body({'selected_paths': ['deep'], 'compression_level': 1})),
+        *[
+            Scenario(f"{shape}_{fmt.replace('.', '_')}", 'POST', '/download_selected', requires=(shape,),
+                     requests=requests, body=json_body({'selected_paths': [shape], 'format': fmt}))
+            for shape, requests in (('huge', 2), ('deep', 10))
+            for fmt in ('tar', 'tar.gz', 'tar.zst')
+        ],
+        Scenario('upload_64k', 'POST', '/upload?path=bench-uploads', requests=200,
+                 body=multipart_upload(64 * 1024)),
+        Scenario('upload_64m', 'POST', '/upload?path=bench-uploads', requests=4,
+                 body=multipart_upload(64 * 1024 * 1024)),
+    ]
+    return [s for s in scenarios if all(shape in manifest['shapes'] for shape in s.requires)]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command may contain spaces; ppid follows the closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+class RssSampler:
+    """Tracks the peak combined RSS of a process tree while a scenario runs."""
+
+    def __init__(self, pid, include_children, interval=0.05):
+        self.pid = pid
+        self.include_children = include_children
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        pids = [self.pid] + (child_pids(self.pid) if self.include_children else [])
+        self.peak_kb = max(self.peak_kb, sum(rss_kb(pid) for pid in pids))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def extract(pattern, html):
+    match = re.search(pattern, html)
+    if not match:
+        raise RuntimeError(f"Could not find {pattern!r} in the page")
+    return match.group(1)
+
+
+class TestClientTransport:
+    """Drives the app in this process; requests run one at a time."""
+
+    concurrency_supported = False
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.csrf_token = None
+
+    def login(self):
+        html = self.client.get('/auth/login').get_data(as_text=True)
+        token = extract(r'name="csrf_token" type="hidden" value="([^"]+)"', html)
+        self.client.post('/auth/login', data={'username': USERNAME, 'password': PASSWORD, 'csrf_token': token})
+        html = self.client.get('/').get_data(as_text=True)
+        self.csrf_token = extract(r'<meta name="csrf-token" content="([^"]+)"', html)
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {'X-CSRFToken': self.csrf_token}
+        if content_type:
+            headers['Content-Type'] = content_type
+        response = self.client.open(path, method=method, data=body, headers=headers, buffered=False)
+        received = 0
+        for chunk in response.response:
+            received += len(chunk)
+        response.close()
+        return response.status_code, received
+
+
+class HTTPTransport:
+    """Talks to a running server over keep-alive connections, one per thread."""
+
+    concurrency_supported = True
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.cookie = ''
+        self.csrf_token = None
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, 'connection', None) is None:
+            self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=600)
+        return self._local.connection
+
+    def _send(self, method, path, body=None, headers=None, keep_body=False):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        connection = self._connection()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Stale keep-alive connection; retry once on a fresh one
+            connection.close()
+            self._local.connection = None
+            connection = self._connection()
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+
+        chunks = []
+        received = 0
+        while True:
+            chunk = response.read(READ_SIZE)
+            if not chunk:
+                break
+            received += len(chunk)
+            if keep_body:
+                chunks.append(chunk)
+        for header, value in response.getheaders():
+            if header.lower() == 'set-cookie':
+                self.cookie = value.split(';', 1)[0]
+        return response.status, received, b''.join(chunks).decode('utf-8', 'replace')
+
+    def login(self):
+        _, _, html = self._send('GET', '/auth/login', keep_body=True)
+        token = extract(r'name="csrf_token" type="hidden" value="([^"]+)"', html)
+        form = urllib.parse.urlencode({'username': USERNAME, 'password': PASSWORD, 'csrf_token': token})
+        self._send('POST', '/auth/login', form, {'Content-Type': 'application/x-www-form-urlencoded'})
+        _, _, html = self._send('GET', '/', keep_body=True)
+        self.csrf_token = extract(r'<meta name="csrf-token" content="([^"]+)"', html)
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {'X-CSRFToken': self.csrf_token}
+        if content_type:
+            headers['Content-Type'] = content_type
+        status, received, _ = self._send(method, path, body, headers)
+        return status, received
+
+
+def run_scenario(transport, scenario, requests, concurrency, rss_pid, include_children):
+    bodies = [scenario.body(i) if scenario.body else (None, None) for i in range(requests)]
+    sent = sum(len(body) for body, _ in bodies if body)
+
+    def one(i):
+        body, content_type = bodies[i]
+        start = time.perf_counter()
+        status, received = transport.request(scenario.method, scenario.path, body, content_type)
+        return time.perf_counter() - start, status, received
+
+    latencies = []
+    errors = 0
+    received = 0
+    with RssSampler(rss_pid, include_children) as sampler:
+        start = time.perf_counter()
+        if concurrency > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(one, range(requests)))
+        else:
+            results = [one(i) for i in range(requests)]
+        elapsed = time.perf_counter() - start
+
+    for latency, status, size in results:
+        latencies.append(latency)
+        received += size
+        if status >= 400:
+            errors += 1
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 2),
+        'throughput_mb_s': round((received + sent) / elapsed / 1024 ** 2, 2),
+        'response_mb': round(received / requests / 1024 ** 2, 3),
+        'latency_ms': {
+            name: round(percentile(latencies, fraction) * 1000, 2)
+            for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))
+        },
+        'peak_rss_mb': round(sampler.peak_kb / 1024, 1),
+    }
+
+
+def wait_for_index(data_dir, timeout):
+    """Block until the filename index has completed its first scan."""
+    deadline = time.monotonic() + timeout
+    path = os.path.join(data_dir, 'search_index.db')
+    while time.monotonic() < deadline:
+        try:
+            conn = sqlite3.connect(path, timeout=5)
+            try:
+                if conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone():
+                    return True
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def configure_environment(volume, data_dir, search_index):
+    os.environ['VOLUME'] = volume
+    os.environ['DATA_DIR'] = data_dir
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('CORS_ORIGINS', 'http://localhost')
+    os.environ['SEARCH_INDEX'] = 'True' if search_index else 'False'
+    os.environ.setdefault('LOG_FILE', os.path.join(data_dir, 'app.log'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    sys.path.insert(0, ROOT)
+
+
+def run(args):
+    volume = args.volume or os.path.join(tempfile.gettempdir(), 'dve-bench-volume')
+    manifest = build_volume(volume, **volume_options(args))
+    data_dir = tempfile.mkdtemp(prefix='dve-bench-data-')
+    configure_environment(volume, data_dir, args.search_index)
+    # Upload scenarios write here; it is emptied so reruns start alike
+    uploads = os.path.join(volume, 'bench-uploads')
+    shutil.rmtree(uploads, ignore_errors=True)
+    os.makedirs(uploads)
+
+    from app.auth.models import create_user
+    create_user(USERNAME, PASSWORD)
+
+    server = None
+    if args.mode == 'client':
+        from app import create_app
+        transport = TestClientTransport(create_app())
+        rss_pid, include_children, concurrency = os.getpid(), False, 1
+    else:
+        port = free_port()
+        server = subprocess.Popen(
+            ['gunicorn', '--bind', f"127.0.0.1:{port}", '--workers', str(args.workers),
+             '--worker-class', 'gevent', '--timeout', '300', 'run:app'],
+            cwd=ROOT, env=os.environ.copy()
+        )
+        wait_for_server(port, server)
+        transport = HTTPTransport('127.0.0.1', port)
+        rss_pid, include_children, concurrency = server.pid, True, args.concurrency
+
+    try:
+        transport.login()
+        if args.search_index and not wait_for_index(data_dir, args.index_timeout):
+            print("Filename index not ready; search scenarios measure the walk fallback.", file=sys.stderr)
+
+        results = {}
+        for scenario in build_scenarios(manifest):
+            if args.scenario and scenario.name not in args.scenario:
+                continue
+            requests = min(scenario.requests or args.requests, args.requests)
+            results[scenario.name] = run_scenario(
+                transport, scenario, requests, concurrency, rss_pid, include_children
+            )
+            print(f"{scenario.name}: {json.dumps(results[scenario.name])}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    return {
+        'mode': args.mode,
+        'workers': args.workers if args.mode == 'server' else None,
+        'python': sys.version.split()[0],
+        'cpu_count': os.cpu_count(),
+        'timestamp': int(time.time()),
+        'volume': manifest,
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print the change of each metric against baseline; return True if something regressed."""
+    regressed = False
+    for key in ('mode', 'workers', 'volume'):
+        if report[key] != baseline.get(key):
+            print(f"Warning: {key} differs from the baseline; results are not comparable.")
+    for name, result in report['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            print(f"{name}: no baseline")
+            continue
+        changes = []
+        for label, current, old, lower_is_better in (
+            ('p50', result['latency_ms']['p50'], previous['latency_ms']['p50'], True),
+            ('p99', result['latency_ms']['p99'], previous['latency_ms']['p99'], True),
+            ('rps', result['throughput_rps'], previous['throughput_rps'], False),
+            ('rss', result['peak_rss_mb'], previous['peak_rss_mb'], True),
+        ):
+            change = (current - old) / old if old else 0.0
+            changes.append(f"{label} {old} -> {current} ({change:+.0%})")
+            if label in ('p50', 'rss') and lower_is_better and change > threshold:
+                regressed = True
+                changes[-1] += ' REGRESSION'
+        print(f"{name}: " + ', '.join(changes))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['client', 'server'], default='client')
+    parser.add_argument('--volume', help='Where to build or reuse the synthetic volume')
+    parser.add_argument('--workers', type=int, default=6, help='gunicorn workers (server mode)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients (server mode)')
+    parser.add_argument('--requests', type=int, default=100, help='Upper bound on requests per scenario')
+    parser.add_argument('--scenario', action='append', help='Only run the named scenario(s)')
+    parser.add_argument('--no-search-index', dest='search_index', action='store_false')
+    parser.add_argument('--index-timeout', type=int, default=600)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--save-baseline', help='Also store the report as a baseline')
+    parser.add_argument('--compare', help='Baseline to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p50/RSS regression (0.2 = 20%%)')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w') as f:
+            f.write(output + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Generate synthetic volumes for the benchmarks.
+
+A volume is built from named shapes, each written to its own top-level
+directory so one volume can exercise several access patterns at once:
+
+    python benchmarks/volume.py /tmp/bench-volume --shape wide --shape deep
+    python benchmarks/volume.py /tmp/bench-volume --shape tiny --tiny-files 1000000
+
+Shapes:
+    wide    one flat directory with --wide-files files
+    deep    a --deep-depth level chain of directories, --deep-files files each
+    tiny    --tiny-files files of 0-512 bytes spread over 1000 files per directory
+    huge    --huge-count files of --huge-mb MB each
+
+Contents are derived from --seed, so the same arguments always produce the
+same volume. A manifest.json describing the shape is written at the root and
+generation is skipped when an identical manifest is already there.
+"""
+
+import argparse
+import json
+import os
+import random
+
+SHAPES = ('wide', 'deep', 'tiny', 'huge')
+MANIFEST = 'manifest.json'
+BLOCK_SIZE = 1024 * 1024
+
+# Mix of compressible text and incompressible bytes, like real volumes
+TEXT = (b"The quick brown fox jumps over the lazy dog. " * 24000)[:BLOCK_SIZE]
+
+
+def file_data(rng, size, compressible):
+    if compressible:
+        return TEXT[:size]
+    return rng.randbytes(size)
+
+
+def write_file(path, rng, size, compressible):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            chunk = min(remaining, BLOCK_SIZE)
+            f.write(file_data(rng, chunk, compressible))
+            remaining -= chunk
+
+
+def make_wide(root, rng, files):
+    directory = os.path.join(root, 'wide')
+    os.makedirs(directory, exist_ok=True)
+    for i in range(files):
+        write_file(os.path.join(directory, f"file{i:07d}.txt"), rng, rng.randint(0, 8192), i % 2 == 0)
+
+
+def make_deep(root, rng, depth, files):
+    directory = os.path.join(root, 'deep')
+    for level in range(depth):
+        directory = os.path.join(directory, f"level{level:03d}")
+        os.makedirs(directory, exist_ok=True)
+        for i in range(files):
+            write_file(os.path.join(directory, f"file{i:03d}.log"), rng, rng.randint(0, 4096), True)
+
+
+def make_tiny(root, rng, files):
+    for i in range(files):
+        directory = os.path.join(root, 'tiny', f"d{i // 1000:05d}")
+        if i % 1000 == 0:
+            os.makedirs(directory, exist_ok=True)
+        write_file(os.path.join(directory, f"t{i:08d}.dat"), rng, rng.randint(0, 512), i % 3 == 0)
+
+
+def make_huge(root, rng, count, size_mb):
+    directory = os.path.join(root, 'huge')
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        # Alternate already-compressed-like and text-like payloads
+        extension = 'bin' if i % 2 == 0 else 'txt'
+        write_file(os.path.join(directory, f"huge{i:02d}.{extension}"), rng, size_mb * BLOCK_SIZE, i % 2 == 1)
+
+
+def build_volume(root, shapes, seed=0, wide_files=10000, deep_depth=50, deep_files=20,
+                 tiny_files=100000, huge_count=2, huge_mb=256):
+    """Create the volume at root unless an identical one already exists; return its manifest."""
+    manifest = {
+        'shapes': sorted(shapes),
+        'seed': seed,
+        'wide_files': wide_files,
+        'deep_depth': deep_depth,
+        'deep_files': deep_files,
+        'tiny_files': tiny_files,
+        'huge_count': huge_count,
+        'huge_mb': huge_mb,
+    }
+    manifest_path = os.path.join(root, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                return manifest
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(root, exist_ok=True)
+    for shape in manifest['shapes']:
+        # Each shape gets its own generator so adding one doesn't change the others
+        rng = random.Random(f"{seed}-{shape}")
+        if shape == 'wide':
+            make_wide(root, rng, wide_files)
+        elif shape == 'deep':
+            make_deep(root, rng, deep_depth, deep_files)
+        elif shape == 'tiny':
+            make_tiny(root, rng, tiny_files)
+        elif shape == 'huge':
+            make_huge(root, rng, huge_count, huge_mb)
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def add_arguments(parser):
+    parser.add_argument('--shape', action='append', choices=SHAPES, dest='shapes',
+                        help='Shape to generate; repeat for several (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--wide-files', type=int, default=10000)
+    parser.add_argument('--deep-depth', type=int, default=50)
+    parser.add_argument('--deep-files', type=int, default=20)
+    parser.add_argument('--tiny-files', type=int, default=100000)
+    parser.add_argument('--huge-count', type=int, default=2)
+    parser.add_argument('--huge-mb', type=int, default=256)
+
+
+def volume_options(args):
+    return {
+        'shapes': args.shapes or list(SHAPES),
+        'seed': args.seed,
+        'wide_files': args.wide_files,
+        'deep_depth': args.deep_depth,
+        'deep_files': args.deep_files,
+        'tiny_files': args.tiny_files,
+        'huge_count': args.huge_count,
+        'huge_mb': args.huge_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('root', help='Directory to create the volume in')
+    add_arguments(parser)
+    args = parser.parse_args()
+    manifest = build_volume(args.root, **volume_options(args))
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == '__main__':
+    main()
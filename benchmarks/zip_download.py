@@ -0,0 +1,143 @@
+"""
+Compare the old in-memory ZIP download with the streaming one.
+
+Each mode runs in its own process so peak RSS is measured independently:
+
+    python benchmarks/zip_download.py --files 200 --size-mb 5
+
+The buffered mode reproduces the previous download_all implementation, which
+built the whole archive in an io.BytesIO before sending anything. The
+streaming mode requests /download_all through the Flask test client and
+reads the response body chunk by chunk.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_volume(volume, files, size_mb):
+    block = os.urandom(1024 * 1024)
+    for i in range(files):
+        subdir = os.path.join(volume, f"dir{i % 10}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"file{i}.bin"), 'wb') as f:
+            for _ in range(size_mb):
+                f.write(block)
+
+
+def run_buffered(volume):
+    import io
+    import zipfile
+
+    start = time.perf_counter()
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for root, dirs, files in os.walk(volume):
+            for dir in dirs:
+                dir_path = os.path.join(root, dir)
+                zip_file.writestr(os.path.relpath(dir_path, volume) + '/', '')
+            for file in files:
+                file_path = os.path.join(root, file)
+                zip_file.write(file_path, os.path.relpath(file_path, volume))
+    zip_buffer.seek(0)
+
+    first_byte = None
+    total = 0
+    while True:
+        chunk = zip_buffer.read(1024 * 1024)
+        if not chunk:
+            break
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        total += len(chunk)
+    return first_byte, time.perf_counter() - start, total
+
+
+def run_streaming(volume, data_dir):
+    os.environ['VOLUME'] = volume
+    os.environ['DATA_DIR'] = data_dir
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('CORS_ORIGINS', 'http://localhost')
+    os.environ.setdefault('SEARCH_INDEX', 'False')
+    os.environ.setdefault('LOG_FILE', os.path.join(data_dir, 'app.log'))
+    sys.path.insert(0, ROOT)
+
+    from app import create_app
+    from app.auth.models import create_user
+
+    create_user('bench', 'benchmark')
+    app = create_app()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = 'bench'
+        session['_fresh'] = True
+
+    start = time.perf_counter()
+    response = client.get('/download_all', buffered=False)
+    first_byte = None
+    total = 0
+    for chunk in response.response:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        total += len(chunk)
+    response.close()
+    return first_byte, time.perf_counter() - start, total
+
+
+def child(args):
+    baseline = peak_rss_mb()
+    if args.mode == 'buffered':
+        first_byte, elapsed, total = run_buffered(args.volume)
+    else:
+        first_byte, elapsed, total = run_streaming(args.volume, args.data_dir)
+    print(json.dumps({
+        'mode': args.mode,
+        'time_to_first_byte_s': round(first_byte, 4),
+        'total_s': round(elapsed, 3),
+        'bytes': total,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_rss_delta_mb': round(peak_rss_mb() - baseline, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--size-mb', type=int, default=5)
+    parser.add_argument('--mode', choices=['buffered', 'streaming'])
+    parser.add_argument('--volume')
+    parser.add_argument('--data-dir')
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        volume = os.path.join(tmp, 'volume')
+        make_volume(volume, args.files, args.size_mb)
+        for mode in ('buffered', 'streaming'):
+            data_dir = os.path.join(tmp, f"data-{mode}")
+            os.makedirs(data_dir)
+            result = subprocess.run(
+                [sys.executable, __file__, '--mode', mode, '--volume', volume, '--data-dir', data_dir],
+                capture_output=True, text=True, check=True
+            )
+            print(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,18 @@ DATA_DIR = os.getenv("DATA_DIR", "/data")
 HOST_PATH = os.getenv("HOST_PATH", "nas")
 # Data Directory and Credentials File
 CREDENTIALS_FILE = os.path.join(DATA_DIR, 'credentials.json')
+SEARCH_INDEX_FILE = os.path.join(DATA_DIR, 'search_index.db')
+CONTENT_INDEX_FILE = os.path.join(DATA_DIR, 'content_index.db')
+UPLOADS_DIR = os.path.join(DATA_DIR, 'uploads')
+JOBS_DIR = os.path.join(DATA_DIR, 'jobs')
+ARCHIVES_DIR = os.path.join(DATA_DIR, 'archives')
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+DOWNLOAD_LINKS_DIR = os.path.join(DATA_DIR, 'download_links')
+LINE_INDEX_DIR = os.path.join(DATA_DIR, 'line_indexes')
+HASH_CACHE_FILE = os.path.join(DATA_DIR, 'file_hashes.db')
+SIGNATURES_DIR = os.path.join(DATA_DIR, 'signatures')
+# Fingerprinted and precompressed copy of app/static, normally built into the image
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build', 'static'))
 
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
@@ -22,6 +34,65 @@ class Config:
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE = os.getenv("LOG_FILE", "app.log")
     REMEMBER_COOKIE_DURATION = 3  # days
+    WTF_CSRF_TIME_LIMIT = int(os.getenv("WTF_CSRF_TIME_LIMIT", str(24 * 60 * 60)))  # seconds a page's CSRF token stays valid
+
+    SEARCH_INDEX = str_to_bool(os.getenv("SEARCH_INDEX", "True"))
+    SEARCH_INDEX_INTERVAL = int(os.getenv("SEARCH_INDEX_INTERVAL", "60"))  # seconds
+    SEARCH_RESULT_LIMIT = int(os.getenv("SEARCH_RESULT_LIMIT", "1000"))
+    LIVE_SEARCH_WORKERS = int(os.getenv("LIVE_SEARCH_WORKERS", "8"))  # scandir threads per live search
+    LIVE_SEARCH_TIME_BUDGET = float(os.getenv("LIVE_SEARCH_TIME_BUDGET", "10"))  # seconds, default per search
+    LIVE_SEARCH_MAX_TIME_BUDGET = float(os.getenv("LIVE_SEARCH_MAX_TIME_BUDGET", "60"))  # seconds
+    CONTENT_INDEX = str_to_bool(os.getenv("CONTENT_INDEX", "False"))
+    CONTENT_INDEX_INTERVAL = int(os.getenv("CONTENT_INDEX_INTERVAL", "300"))  # seconds
+    CONTENT_INDEX_MAX_FILE_SIZE = int(os.getenv("CONTENT_INDEX_MAX_FILE_SIZE", str(1024 * 1024)))  # bytes
+    CONTENT_SEARCH_LIMIT = int(os.getenv("CONTENT_SEARCH_LIMIT", "100"))
+
+    EDITOR_MAX_FILE_SIZE = int(os.getenv("EDITOR_MAX_FILE_SIZE", str(5 * 1024 * 1024)))  # larger files open read-only in windows
+    FILE_WINDOW_LINES = int(os.getenv("FILE_WINDOW_LINES", "1000"))  # default lines per window
+    FILE_WINDOW_MAX_LINES = int(os.getenv("FILE_WINDOW_MAX_LINES", "10000"))
+    FILE_WINDOW_MAX_BYTES = int(os.getenv("FILE_WINDOW_MAX_BYTES", str(1024 * 1024)))
+
+    LIST_CACHE_TTL = int(os.getenv("LIST_CACHE_TTL", "30"))  # seconds
+    LIST_CACHE_MAX_ENTRIES = int(os.getenv("LIST_CACHE_MAX_ENTRIES", "500000"))
+
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB
+    UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024  # 64 MB
+    UPLOAD_SESSION_TTL = 7 * 24 * 60 * 60  # seconds
+    UPLOAD_DEDUP = str_to_bool(os.getenv("UPLOAD_DEDUP", "True"))  # place files the volume already has instead of uploading them
+    # Hard link deduplicated uploads when they can't be reflinked; the copies then share edits
+    UPLOAD_DEDUP_HARDLINK = str_to_bool(os.getenv("UPLOAD_DEDUP_HARDLINK", "False"))
+    # Block sizes for delta sync; the default is the power of two nearest sqrt(file size) within these bounds
+    DELTA_MIN_BLOCK_SIZE = 4 * 1024  # 4 KB
+    DELTA_MAX_BLOCK_SIZE = 16 * 1024 * 1024  # 16 MB
+    SIGNATURE_WORKERS = int(os.getenv("SIGNATURE_WORKERS", str(os.cpu_count() or 1)))  # checksum threads per signature
+
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_RECORD_TTL = 24 * 60 * 60  # seconds
+    CHANGE_FEED = str_to_bool(os.getenv("CHANGE_FEED", "True"))
+    CHANGE_FEED_KEEPALIVE = 15  # seconds between keepalive comments on idle streams
+
+    HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))  # hashing threads per job
+    DUPLICATES_REPORT_LIMIT = int(os.getenv("DUPLICATES_REPORT_LIMIT", "1000"))  # duplicate groups per report
+
+    COPY_INLINE_MAX_SIZE = 64 * 1024 * 1024  # larger files are copied by a job
+
+    ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))  # 0 (store) to 9
+    ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", str(os.cpu_count() or 1)))  # deflate/zstd threads per archive
+    ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "3"))  # 1 to 19, for tar.zst
+    DOWNLOAD_LINK_TTL = 7 * 24 * 60 * 60  # seconds a resumable archive link stays valid
+
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # bearer token accepted by /metrics
+
+    STATIC_PIPELINE = str_to_bool(os.getenv("STATIC_PIPELINE", "True"))
+
+    # How file downloads are sent: 'off' (send_file), 'sendfile' (os.sendfile on
+    # gunicorn's socket), 'x-accel' (nginx) or 'x-sendfile' (Apache/lighttpd/Caddy)
+    DOWNLOAD_OFFLOAD = os.getenv("DOWNLOAD_OFFLOAD", "off").lower()
+    # Internal nginx locations aliasing each directory files are downloaded from
+    DOWNLOAD_ACCEL_LOCATIONS = {
+        VOLUME: os.getenv("ACCEL_VOLUME_LOCATION", "/_protected/volume/"),
+        ARCHIVES_DIR: os.getenv("ACCEL_ARCHIVES_LOCATION", "/_protected/archives/"),
+    }
 
     HTTPS = str_to_bool(os.getenv("HTTPS", "False"))
 